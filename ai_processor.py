@@ -3,13 +3,28 @@ AI Processor using Google Gemini for property data extraction
 """
 
 import os
+import asyncio
 import logging
+import copy
 import json
-from typing import Dict, Any, Optional
-from google import genai
-from google.genai.types import GenerateContentConfig
+import hashlib
+import threading
+import time
+import weakref
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+from google.genai.types import CreateCachedContentConfig, GenerateContentConfig
 from dotenv import load_dotenv
 
+from database import Property
+from extraction_cache import ExtractionCache, make_cache_key
+from gemini_client import GEMINI_CLIENT_MODE, create_client
+from gemini_usage import usage_tracker
+from json_repair import PartialJSONParser, repair_json
+from search_grammar import parse_search_grammar
+from quota_governor import Lane, QuotaExceededError, estimate_tokens, governor, is_quota_error
+from listing_parser import parse_listing
+
 # Load environment variables
 load_dotenv()
 
@@ -19,181 +34,204 @@ logger = logging.getLogger(__name__)
 
 # Configure Gemini AI
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
+if not GEMINI_API_KEY and GEMINI_CLIENT_MODE != 'replay':
     logger.error("GEMINI_API_KEY not found in environment variables")
     raise ValueError("GEMINI_API_KEY is required")
 
-# Initialize client with new package
-client = genai.Client(api_key=GEMINI_API_KEY)
-
-
-# Function declarations for Gemini function calling
-property_extraction_function = {
-    "name": "extract_property_data",
-    "description": "Extract structured property information from user's natural language description",
-    "parameters": {
-        "type": "object",
-        "properties": {
-            "property_type": {
-                "type": "string",
-                "description": "Type of property",
-                "enum": ["rumah", "apartemen", "tanah", "ruko", "villa", "kost", "gudang", "kantor", "lainnya"]
-            },
-            "transaction_type": {
-                "type": "string",
-                "description": "Sale or rent",
-                "enum": ["jual", "sewa"]
-            },
-            "address": {
-                "type": "string",
-                "description": "Full address of the property"
-            },
-            "city": {
-                "type": "string",
-                "description": "City name"
-            },
-            "district": {
-                "type": "string",
-                "description": "District/Kecamatan name"
-            },
-            "province": {
-                "type": "string",
-                "description": "Province name"
-            },
-            "price": {
-                "type": "integer",
-                "description": "Price in Indonesian Rupiah"
-            },
-            "negotiable": {
-                "type": "boolean",
-                "description": "Whether price is negotiable"
-            },
-            "land_area": {
-                "type": "integer",
-                "description": "Land area in square meters"
-            },
-            "building_area": {
-                "type": "integer",
-                "description": "Building area in square meters"
-            },
-            "bedrooms": {
-                "type": "integer",
-                "description": "Number of bedrooms"
-            },
-            "bathrooms": {
-                "type": "integer",
-                "description": "Number of bathrooms"
-            },
-            "floors": {
-                "type": "integer",
-                "description": "Number of floors"
-            },
-            "carports": {
-                "type": "integer",
-                "description": "Number of carports"
-            },
-            "garages": {
-                "type": "integer",
-                "description": "Number of garages"
-            },
-            "year_built": {
-                "type": "integer",
-                "description": "Year the property was built"
-            },
-            "facilities": {
-                "type": "array",
-                "items": {"type": "string"},
-                "description": "List of facilities/amenities"
-            },
-            "certificate_type": {
-                "type": "string",
-                "description": "Certificate type",
-                "enum": ["SHM", "SHGB", "AJB", "Girik", "Lainnya"]
-            },
-            "description": {
-                "type": "string",
-                "description": "Additional description"
-            },
-            "contact_name": {
-                "type": "string",
-                "description": "Contact person name"
-            },
-            "contact_phone": {
-                "type": "string",
-                "description": "Contact phone number"
-            },
-            "contact_whatsapp": {
-                "type": "string",
-                "description": "WhatsApp number"
-            }
-        },
-        "required": ["property_type", "transaction_type"]
+# Live google-genai client, or a recorder / offline replay stand-in (see gemini_client.py)
+client = create_client(GEMINI_API_KEY)
+
+# gemini-flash-latest is stable, good balance of speed and quota
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-flash-latest')
+
+# Async path: max concurrent Gemini calls and per-call timeout (seconds)
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+GEMINI_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '20'))
+# One semaphore per event loop: a semaphore bound to a finished loop breaks later asyncio.run calls
+_async_semaphores: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = weakref.WeakKeyDictionary()
+
+# Static prompt prefixes are registered once as cached content (falls back to a compact system instruction)
+PROMPT_CACHE_ENABLED = os.getenv('PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+PROMPT_CACHE_TTL = int(os.getenv('PROMPT_CACHE_TTL', '3600'))
+PROMPT_CACHE_RETRY = 3600  # Seconds before retrying after the API refused to cache a prefix
+
+
+# Columns the model never fills: keys, bookkeeping and values derived after saving
+EXTRACTION_EXCLUDED_COLUMNS = {
+    'id', 'user_id', 'postal_code', 'latitude', 'longitude',
+    'province_id', 'city_id', 'district_id',
+    'price_per_meter', 'status', 'created_at', 'updated_at',
+}
+
+PROPERTY_TYPES = ["rumah", "apartemen", "tanah", "ruko", "villa", "kost", "gudang", "kantor", "lainnya"]
+
+# Enums and descriptions layered on top of the column types
+EXTRACTION_FIELD_HINTS: Dict[str, Dict[str, Any]] = {
+    'property_type': {'enum': PROPERTY_TYPES},
+    'condition': {'enum': ["Baru", "Bekas", "Siap Huni", "Butuh Renovasi"]},
+    'transaction_type': {'enum': ["jual", "sewa", "jual sewa"]},
+    'price': {'description': "Harga dalam rupiah (harga jual jika ada jual & sewa)"},
+    'rent_price': {'description': "Harga sewa dalam rupiah jika ada jual & sewa"},
+    'land_area': {'description': "Luas tanah m2"},
+    'building_area': {'description': "Luas bangunan m2"},
+    'electricity': {'description': "Daya listrik dalam watt"},
+    'dimensions': {'description': "Dimensi tanah, contoh 10 x 20"},
+    'row_road': {'description': "Lebar jalan, contoh 3 mobil / 6 meter"},
+    'water_type': {'description': "PDAM/Sumur"},
+    'furnished': {'enum': ["Full", "Semi", "Kosongan"]},
+    'certificate_type': {'description': "SHM/SHGB/AJB/Girik/dll"},
+    'description': {'description': "Deskripsi singkat", 'max_length': 500},
+}
+
+
+def _column_schema(column) -> Dict[str, Any]:
+    """JSON schema for one ORM column (every field may be null)"""
+    python_type = column.type.python_type
+    if python_type is bool:
+        schema = {'type': 'boolean'}
+    elif python_type is int:
+        schema = {'type': 'integer'}
+    elif python_type in (float, Decimal):
+        schema = {'type': 'number'}
+    elif python_type in (list, dict):
+        # JSON columns hold lists of strings (facilities)
+        schema = {'type': 'array', 'items': {'type': 'string'}}
+    else:
+        schema = {'type': 'string'}
+    schema['nullable'] = bool(column.nullable)
+    schema.update(EXTRACTION_FIELD_HINTS.get(column.name, {}))
+    return schema
+
+
+def build_property_schema() -> Dict[str, Any]:
+    """Structured-output schema for one listing, generated from the Property columns"""
+    properties = {
+        column.name: _column_schema(column)
+        for column in Property.__table__.columns
+        if column.name not in EXTRACTION_EXCLUDED_COLUMNS and column.computed is None
     }
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': ['property_type', 'transaction_type'],
+        'property_ordering': list(properties),
+    }
+
+
+PROPERTY_RESPONSE_SCHEMA = build_property_schema()
+EXTRACTION_FIELDS = frozenset(PROPERTY_RESPONSE_SCHEMA['properties'])
+
+SEARCH_RESPONSE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'property_type': {'type': 'string', 'nullable': True, 'enum': PROPERTY_TYPES},
+        'location_keyword': {'type': 'string', 'nullable': True,
+                             'description': "Nama kota, kecamatan, atau area"},
+        'min_price': {'type': 'integer', 'nullable': True},
+        'max_price': {'type': 'integer', 'nullable': True},
+        'min_bedrooms': {'type': 'integer', 'nullable': True},
+        'min_land_area': {'type': 'integer', 'nullable': True},
+        'must_have_facilities': {'type': 'array', 'nullable': True, 'items': {'type': 'string'}},
+    },
+    'property_ordering': ['property_type', 'location_keyword', 'min_price', 'max_price',
+                          'min_bedrooms', 'min_land_area', 'must_have_facilities'],
 }
 
+# Output caps keep answers small and bounded; truncated JSON is repaired, not discarded
+EXTRACTION_MAX_OUTPUT_TOKENS = int(os.getenv('EXTRACTION_MAX_OUTPUT_TOKENS', '1024'))
+SEARCH_MAX_OUTPUT_TOKENS = 256
 
-class QuotaExceededError(Exception):
-    """Raised when Gemini API quota is exceeded"""
-    pass
 
-def extract_property_info(user_input: str, conversation_history: Optional[str] = None) -> Dict[str, Any]:
+def _compact_prompt(prompt: str) -> str:
+    """Strip indentation and blank lines from a static prompt (fewer tokens, same content)"""
+    return "\n".join(line.strip() for line in prompt.splitlines() if line.strip())
+
+
+class PromptPrefix:
     """
-    Extract property information from user's natural language input using Gemini AI
-    
-    Args:
-        user_input: User's message describing the property
-        conversation_history: Optional conversation context
-        
-    Returns:
-        Dictionary with extracted property data
+    Static instructions shared by every call of one kind.
+    Registered once as Gemini cached content; when the API refuses (prompt below the
+    minimum cacheable size, unsupported model) the compact text is sent as system_instruction,
+    which keeps the prefix byte-identical so implicit caching can still apply.
     """
-    # Try Gemini AI first
-    try:
-        # Build prompt with context
-        system_prompt = """Anda adalah asisten AI yang membantu mengekstrak informasi properti dari deskripsi pengguna.
+
+    def __init__(self, name: str, prompt: str):
+        self.name = name
+        self.instruction = _compact_prompt(prompt)
+        self._cache_name: Optional[str] = None
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _needs_cache(self) -> bool:
+        now = time.monotonic()
+        return (PROMPT_CACHE_ENABLED and now >= self._retry_at
+                and (self._cache_name is None or now >= self._expires_at - 60))
+
+    def _create_config(self) -> CreateCachedContentConfig:
+        return CreateCachedContentConfig(
+            display_name=f"home-{self.name}",
+            system_instruction=self.instruction,
+            ttl=f"{PROMPT_CACHE_TTL}s",
+        )
+
+    def _created(self, cached) -> None:
+        self._cache_name = cached.name
+        self._expires_at = time.monotonic() + PROMPT_CACHE_TTL
+        logger.info(f"Registered cached prompt prefix '{self.name}': {cached.name}")
+
+    def _refused(self, e: Exception) -> None:
+        self._cache_name = None
+        self._retry_at = time.monotonic() + PROMPT_CACHE_RETRY
+        logger.info(f"Prompt prefix '{self.name}' not cached, using system instruction: {e}")
+
+    def ensure(self) -> None:
+        """Create or refresh the cached content (blocking)"""
+        if not self._needs_cache():
+            return
+        with self._lock:
+            if not self._needs_cache():
+                return
+            try:
+                self._created(client.caches.create(model=GEMINI_MODEL, config=self._create_config()))
+            except Exception as e:
+                self._refused(e)
+
+    async def aensure(self) -> None:
+        """Create or refresh the cached content on the async client"""
+        if not self._needs_cache():
+            return
+        # Block concurrent refreshes for a moment instead of racing several creates
+        self._retry_at = time.monotonic() + GEMINI_TIMEOUT
+        try:
+            self._created(await client.aio.caches.create(model=GEMINI_MODEL, config=self._create_config()))
+            self._retry_at = 0.0
+        except Exception as e:
+            self._refused(e)
+
+    def invalidate(self) -> None:
+        """Forget the cached content (expired or deleted server-side)"""
+        self._cache_name = None
+
+    def reset(self) -> None:
+        """Forget the cached content and any refusal, e.g. after switching clients"""
+        self._cache_name = None
+        self._retry_at = 0.0
+
+    def config(self, **kwargs) -> GenerateContentConfig:
+        """Generation config carrying this prefix plus the call's own settings"""
+        if self._cache_name:
+            return GenerateContentConfig(cached_content=self._cache_name, **kwargs)
+        return GenerateContentConfig(system_instruction=self.instruction, **kwargs)
+
+
+EXTRACTION_SYSTEM_PROMPT = """Anda adalah asisten AI yang membantu mengekstrak informasi properti dari deskripsi pengguna.
 Tugas Anda adalah mengidentifikasi dan mengekstrak data properti terstruktur dari percakapan natural.
 
-PENTING: Keluarkan hasil HANYA dalam format JSON dengan key bahasa Inggris berikut:
-{
-    "property_type": "rumah/apartemen/tanah/ruko/villa/dll",
-    "condition": "Baru/Bekas/Siap Huni/Butuh Renovasi",
-    "transaction_type": "jual/sewa/jual sewa",
-    "city": "nama kota",
-    "district": "nama kecamatan",
-    "address": "alamat lengkap",
-    "price": 1000000000 (angka dalam rupiah, prioritas harga jual),
-    "rent_price": 50000000 (angka dalam rupiah, jika ada harga sewa),
-    "negotiable": true/false,
-    "land_area": 100 (angka m2),
-    "building_area": 100 (angka m2),
-    "bedrooms": 3 (angka),
-    "bathrooms": 2 (angka),
-    "floors": 2 (angka),
-    "garages": 1 (angka),
-    "carports": 1 (angka),
-    "year_built": 2020 (angka),
-    "orientation": "Selatan/Utara/dll",
-    "dimensions": "10 x 20",
-    "row_road": "3 mobil/6 meter",
-    "water_type": "PDAM/Sumur",
-    "electricity": 2200 (angka watt),
-    "phone_line_count": 1 (angka),
-    "furnished": "Full/Semi/Kosongan",
-    "kpr": true/false,
-    "imb": true/false,
-    "blueprint": true/false,
-    "facilities": ["ac", "taman", "kolam renang"],
-    "certificate_type": "SHM/SHGB/dll",
-    "description": "deskripsi singkat",
-    "contact_name": "nama kontak",
-    "contact_phone": "nomor telepon",
-    "property_url": "link properti",
-    "agent_url": "link agen",
-    "video_review_url": "link video review"
-}
+Jawaban berupa JSON sesuai skema yang diberikan (key bahasa Inggris).
 
 Peraturan:
-1. "property_type" harus salah satu dari: rumah, apartemen, tanah, ruko, villa, gudang, kantor
+1. "property_type" harus salah satu nilai enum pada skema
 2. "condition" ekstrak dari kata kunci: "Baru/New/Gress" -> "Baru", "Second/Lama" -> "Bekas", "Siap Huni" -> "Siap Huni", "Hitung Tanah" -> "Butuh Renovasi"
 3. "transaction_type" harus: jual, sewa, atau "jual sewa" (jika kedua opsi tersedia)
 4. Jika ada dua harga (jual & sewa), masukkan harga jual ke "price" dan harga sewa ke "rent_price".
@@ -224,184 +262,591 @@ Peraturan:
 13. Jika informasi tidak ada atau tidak jelas, isi dengan null (JANGAN isi sembarangan).
 """
 
-        # Combine conversation history if available
-        full_prompt = f"{system_prompt}\n\nInput pengguna: {user_input}"
-        
-        # Use gemini-flash-latest (stable, good balance of speed and quota)
-        response = client.models.generate_content(
-            model='gemini-flash-latest',
-            contents=full_prompt,
-            config=GenerateContentConfig(
-                temperature=0.1,  # Low temperature for consistent extraction
+# Cache entries are only valid for the prompt/model that produced them
+EXTRACTION_CACHE_VERSION = hashlib.sha256(
+    f"{GEMINI_MODEL}\x00{EXTRACTION_SYSTEM_PROMPT}\x00{json.dumps(PROPERTY_RESPONSE_SCHEMA, sort_keys=True)}".encode('utf-8')
+).hexdigest()[:16]
+
+extraction_cache = ExtractionCache()
+EXTRACTION_PREFIX = PromptPrefix('extraction', EXTRACTION_SYSTEM_PROMPT)
+
+
+def set_client(new_client: Any) -> None:
+    """Swap the Gemini client (recorder, replay stand-in); cached prefixes of the old one are dropped"""
+    global client
+    client = new_client
+    for prefix in (EXTRACTION_PREFIX, BATCH_PREFIX, SEARCH_PREFIX):
+        prefix.reset()
+
+
+def get_client() -> Any:
+    """The Gemini client currently in use"""
+    return client
+
+
+def get_extraction_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the extraction cache"""
+    return extraction_cache.stats()
+
+
+def get_usage_stats() -> Dict[str, Dict[str, Any]]:
+    """Token counts, estimated cost and latency per ai_processor function"""
+    return usage_tracker.stats()
+
+
+def get_search_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the AI search-query cache"""
+    return search_cache.stats()
+
+
+def get_quota_stats() -> Dict[str, Any]:
+    """Quota governor counters: granted/rejected calls, 429s, queue depth per lane"""
+    return governor.stats()
+
+
+def _clean_extraction(data: Any) -> Dict[str, Any]:
+    """Keep only schema fields (unknown keys would break Property(**data)), drop nulls"""
+    if not isinstance(data, dict):
+        return {}
+    return {key: value for key, value in data.items() if key in EXTRACTION_FIELDS and value is not None}
+
+
+def _extraction_prompt(user_input: str) -> str:
+    """Per-call part of the extraction prompt (the instructions travel in EXTRACTION_PREFIX)"""
+    return f"Input pengguna: {user_input}"
+
+
+def _extraction_config() -> Dict[str, Any]:
+    """Generation settings used for extraction calls: JSON constrained to the Property schema"""
+    return dict(
+        temperature=0.1,  # Low temperature for consistent extraction
+        response_mime_type='application/json',
+        response_schema=PROPERTY_RESPONSE_SCHEMA,
+        max_output_tokens=EXTRACTION_MAX_OUTPUT_TOKENS,
+    )
+
+
+def _parse_extraction_response(response_text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Turn the model's answer into property data.
+    Returns None when the AI produced nothing usable (caller falls back to the text parser).
+    """
+    extracted_data = _clean_extraction(repair_json(response_text))
+    if not extracted_data.get('property_type'):
+        logger.warning("Could not parse JSON from AI response, using text analysis")
+        return None
+
+    logger.info(f"Extracted property data via AI: {extracted_data}")
+    return extracted_data
+
+
+def _quota_exceeded(e: Exception) -> QuotaExceededError:
+    """The governor's error as-is, or a QuotaExceededError wrapping a raw 429"""
+    return e if isinstance(e, QuotaExceededError) else QuotaExceededError("Gemini API quota exceeded")
+
+
+def _handle_extraction_error(e: Exception) -> None:
+    """Raise QuotaExceededError for quota errors, log anything else"""
+    if is_quota_error(e):
+        logger.warning(f"Gemini API quota exceeded: {e}")
+        raise _quota_exceeded(e)
+    if isinstance(e, asyncio.TimeoutError):
+        logger.error(f"Gemini extraction timed out after {GEMINI_TIMEOUT}s")
+    else:
+        logger.error(f"Error extracting property info with Gemini: {e}")
+
+
+def _gemini_semaphore() -> asyncio.Semaphore:
+    """Semaphore capping concurrent async Gemini calls on the running loop (created on first use)"""
+    loop = asyncio.get_running_loop()
+    semaphore = _async_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _async_semaphores[loop] = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    return semaphore
+
+
+def _cache_failure(e: Exception, prefix: Optional[PromptPrefix], config: Optional[GenerateContentConfig]) -> bool:
+    """True if a call failed because its cached prefix is gone; the prefix is reset for a retry"""
+    if prefix is None or config is None or not config.cached_content or is_quota_error(e):
+        return False
+    if isinstance(e, asyncio.TimeoutError):
+        return False
+    logger.warning(f"Cached prompt prefix '{prefix.name}' rejected, resending inline: {e}")
+    prefix.invalidate()
+    return True
+
+
+def _call_config(prefix: Optional[PromptPrefix], config_kwargs: Dict[str, Any]) -> Optional[GenerateContentConfig]:
+    """Generation config for one call, with the prompt prefix if there is one"""
+    if prefix is not None:
+        return prefix.config(**config_kwargs)
+    return GenerateContentConfig(**config_kwargs) if config_kwargs else None
+
+
+def _generate(function: str, contents: str, prefix: Optional[PromptPrefix] = None,
+              items: int = 1, lane: Lane = Lane.INTERACTIVE, **config_kwargs):
+    """
+    Blocking Gemini call with the prompt prefix applied and usage recorded under function.
+    Admission, pacing and 429 retries are handled by the quota governor in the given lane.
+    """
+    if prefix is not None:
+        prefix.ensure()
+    estimated = estimate_tokens(contents, prefix.instruction if prefix is not None else None)
+
+    def send(config):
+        start = time.perf_counter()
+        response = client.models.generate_content(model=GEMINI_MODEL, contents=contents, config=config)
+        return response, time.perf_counter() - start
+
+    for attempt in range(2):
+        config = _call_config(prefix, config_kwargs)
+        try:
+            response, latency = governor.call(lane, estimated, lambda: send(config))
+        except Exception as e:
+            if attempt == 0 and _cache_failure(e, prefix, config):
+                continue
+            usage_tracker.record_error(function)
+            raise
+        usage_tracker.record(function, response.usage_metadata, latency, items)
+        governor.settle(estimated, getattr(response.usage_metadata, 'prompt_token_count', None))
+        return response
+
+
+async def _generate_content_async(function: str, contents: str, prefix: Optional[PromptPrefix] = None,
+                                  lane: Lane = Lane.INTERACTIVE, **config_kwargs):
+    """
+    Call Gemini through the async client, bounded by the concurrency cap and per-call timeout.
+    Usage and quota are handled like _generate.
+    """
+    if prefix is not None:
+        await prefix.aensure()
+    estimated = estimate_tokens(contents, prefix.instruction if prefix is not None else None)
+
+    async def send(config):
+        async with _gemini_semaphore():
+            start = time.perf_counter()
+            response = await asyncio.wait_for(
+                client.aio.models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents=contents,
+                    config=config
+                ),
+                timeout=GEMINI_TIMEOUT
             )
-        )
-        
-        # Parse response
-        extracted_data = {}
-        
-        if response.text:
-            # Try to extract JSON from response
-            try:
-                # Look for JSON in the response
-                text = response.text
-                if '{' in text and '}' in text:
-                    start = text.index('{')
-                    end = text.rindex('}') + 1
-                    json_str = text[start:end]
-                    extracted_data = json.loads(json_str)
-            except json.JSONDecodeError:
-                logger.warning("Could not parse JSON from AI response, using text analysis")
-                # Fallback: manual parsing
-                extracted_data = _parse_text_response(user_input, response.text)
-        
-        # If AI returned some data, use it; otherwise fallback
-        if extracted_data:
-            logger.info(f"Extracted property data via AI: {extracted_data}")
-            return extracted_data
-        
+            return response, time.perf_counter() - start
+
+    for attempt in range(2):
+        config = _call_config(prefix, config_kwargs)
+        try:
+            response, latency = await governor.call_async(lane, estimated, lambda: send(config))
+        except Exception as e:
+            if attempt == 0 and _cache_failure(e, prefix, config):
+                continue
+            usage_tracker.record_error(function)
+            raise
+        usage_tracker.record(function, response.usage_metadata, latency)
+        governor.settle(estimated, getattr(response.usage_metadata, 'prompt_token_count', None))
+        return response
+
+
+def _extract_with_gemini(user_input: str, lane: Lane = Lane.INTERACTIVE) -> Optional[Dict[str, Any]]:
+    """Run one blocking Gemini extraction call"""
+    try:
+        response = _generate('extract_property_info', _extraction_prompt(user_input),
+                             EXTRACTION_PREFIX, lane=lane, **_extraction_config())
+        return _parse_extraction_response(response.text)
     except Exception as e:
-        error_msg = str(e)
-        if '429' in error_msg or 'RESOURCE_EXHAUSTED' in error_msg:
-            logger.warning(f"Gemini API quota exceeded: {error_msg}")
-            raise QuotaExceededError("Gemini API quota exceeded")
-        else:
-            logger.error(f"Error extracting property info with Gemini: {e}")
+        _handle_extraction_error(e)
+    return None
+
+
+async def _extract_with_gemini_async(user_input: str) -> Optional[Dict[str, Any]]:
+    """Run one Gemini extraction call on the async client"""
+    try:
+        response = await _generate_content_async('extract_property_info', _extraction_prompt(user_input),
+                                                 EXTRACTION_PREFIX, **_extraction_config())
+        return _parse_extraction_response(response.text)
+    except Exception as e:
+        _handle_extraction_error(e)
+    return None
+
+
+def extract_property_info(user_input: str, conversation_history: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract property information from user's natural language input using Gemini AI
+    
+    Repeated listings are answered from the extraction cache without calling Gemini.
+    
+    Args:
+        user_input: User's message describing the property
+        conversation_history: Optional conversation context
+        
+    Returns:
+        Dictionary with extracted property data
+    """
+    return _extract_single(user_input, Lane.INTERACTIVE)
+
+
+def _extract_single(user_input: str, lane: Lane) -> Dict[str, Any]:
+    """Local parser, then cache, then Gemini in the given quota lane, then the fallback parser"""
+    # Structured broker posts are handled by the deterministic parser
+    local_data = _extract_locally(user_input)
+    if local_data:
+        return local_data
+    
+    cache_key = make_cache_key(user_input, EXTRACTION_CACHE_VERSION)
+    extracted_data = extraction_cache.get_or_compute(cache_key, lambda: _extract_with_gemini(user_input, lane))
+    if extracted_data:
+        return extracted_data
     
     # Fallback to basic extraction
     logger.info("Using fallback text parser due to error")
     return _parse_text_response(user_input, "")
 
 
-def parse_search_query(user_query: str) -> Dict[str, Any]:
+async def extract_property_info_async(user_input: str, conversation_history: Optional[str] = None) -> Dict[str, Any]:
     """
-    Parse user's natural language search query into structured filters
+    Async variant of extract_property_info for use inside bot handlers
+    (does not block the event loop while Gemini is answering)
     """
-    try:
-        system_prompt = """Anda adalah asisten pencarian properti. 
-Tugas Anda: Terjemahkan keinginan user menjadi filter database SQL.
+    local_data = _extract_locally(user_input)
+    if local_data:
+        return local_data
+    
+    cache_key = make_cache_key(user_input, EXTRACTION_CACHE_VERSION)
+    extracted_data = await extraction_cache.aget_or_compute(
+        cache_key, lambda: _extract_with_gemini_async(user_input)
+    )
+    if extracted_data:
+        return extracted_data
+    
+    logger.info("Using fallback text parser due to error")
+    return _parse_text_response(user_input, "")
 
-Input User: "Cari rumah di Jaksel minimal 3 kamar harga max 5M yang ada kolam renang"
-
-Output JSON:
-{
-    "property_type": "rumah",
-    "location_keyword": "Jakarta Selatan", 
-    "min_price": null,
-    "max_price": 5000000000,
-    "min_bedrooms": 3,
-    "min_land_area": null,
-    "must_have_facilities": ["kolam renang"]
-}
 
-Peraturan:
-1. Harga harus angka murni (5M -> 5000000000).
-2. location_keyword bisa nama kota, kecamatan, atau area.
-3. null jika tidak disebutkan.
-4. "must_have_facilities" adalah list string.
+# Batch extraction: several listings per request, each marked with a delimiter
+BATCH_DELIMITER = "### LISTING {index} ###"
+BATCH_MAX_INPUT_TOKENS = int(os.getenv('BATCH_MAX_INPUT_TOKENS', '12000'))
+BATCH_MAX_OUTPUT_TOKENS = int(os.getenv('BATCH_MAX_OUTPUT_TOKENS', '8192'))
+BATCH_OUTPUT_TOKENS_PER_ITEM = 450  # Rough size of one extracted JSON object
+BATCH_CHARS_PER_TOKEN = 4.0  # Used when count_tokens is unavailable
+
+BATCH_INSTRUCTIONS = """
+MODE BATCH:
+Input berisi beberapa listing properti. Setiap listing diawali baris "### LISTING <nomor> ###".
+Ekstrak SETIAP listing secara terpisah dengan peraturan di atas.
+Jawaban berupa satu JSON array: satu objek per listing, dengan key "index" berisi nomor listing.
+Jangan gabungkan data antar listing.
 """
-        
-        full_prompt = f"{system_prompt}\n\nInput User: {user_query}"
-        
-        response = client.models.generate_content(
-            model='gemini-flash-latest',
-            contents=full_prompt,
-            config=GenerateContentConfig(temperature=0.1)
-        )
-        
-        filters = {}
-        if response.text:
-            try:
-                text = response.text
-                if '{' in text and '}' in text:
-                    start = text.index('{')
-                    end = text.rindex('}') + 1
-                    json_str = text[start:end]
-                    filters = json.loads(json_str)
-            except json.JSONDecodeError:
-                pass
-                
-        logger.info(f"Parsed search query: {filters}")
-        return filters
 
+BATCH_PREFIX = PromptPrefix('batch', f"{EXTRACTION_SYSTEM_PROMPT}\n{BATCH_INSTRUCTIONS}")
+
+BATCH_RESPONSE_SCHEMA = {
+    'type': 'array',
+    'items': {
+        **PROPERTY_RESPONSE_SCHEMA,
+        'properties': {'index': {'type': 'integer'}, **PROPERTY_RESPONSE_SCHEMA['properties']},
+        'required': ['index'] + PROPERTY_RESPONSE_SCHEMA['required'],
+        'property_ordering': ['index'] + PROPERTY_RESPONSE_SCHEMA['property_ordering'],
+    },
+}
+
+
+def _extract_json_array(text: Optional[str]) -> List[Any]:
+    """
+    Parse the batch answer's JSON array.
+    If the answer was cut off, the last (possibly partial) element is dropped so it gets retried.
+    """
+    parser = PartialJSONParser()
+    parser.feed(text)
+    result = parser.snapshot()
+    if not isinstance(result, list):
+        return []
+    if not parser.complete and result:
+        result.pop()
+    return result
+
+
+def _count_listing_tokens(texts: List[str]) -> List[int]:
+    """
+    Estimate prompt tokens per listing.
+    One count_tokens call calibrates the chars-per-token ratio for the whole set.
+    """
+    chars_per_token = BATCH_CHARS_PER_TOKEN
+    joined = "\n".join(texts)
+    try:
+        counted = client.models.count_tokens(model=GEMINI_MODEL, contents=joined).total_tokens
+        if counted:
+            chars_per_token = max(len(joined) / counted, 1.0)
     except Exception as e:
-        error_msg = str(e)
-        if '429' in error_msg or 'RESOURCE_EXHAUSTED' in error_msg:
-            logger.warning(f"Gemini API quota exceeded for search")
-            raise QuotaExceededError("Gemini API quota exceeded")
-        logger.error(f"Error parsing search query: {e}")
-        return {}  # Return empty dict on error (will fall back to basic text search)
+        logger.warning(f"count_tokens unavailable, estimating batch size: {e}")
+    return [int(len(text) / chars_per_token) + 8 for text in texts]  # + delimiter line
 
 
-def _parse_text_response(user_input: str, ai_response: str = "") -> Dict[str, Any]:
+def _plan_batches(indexes: List[int], token_counts: List[int]) -> List[List[int]]:
+    """Greedily pack listings into batches under the input and output token budgets"""
+    max_items = max(BATCH_MAX_OUTPUT_TOKENS // BATCH_OUTPUT_TOKENS_PER_ITEM, 1)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for idx, tokens in zip(indexes, token_counts):
+        if current and (current_tokens + tokens > BATCH_MAX_INPUT_TOKENS or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(idx)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _extract_batch_with_gemini(texts: List[str]) -> List[Optional[Dict[str, Any]]]:
     """
-    Fallback parser for extracting basic property info from text
+    Run one Gemini call for several listings.
+    Returns results aligned to texts; None marks an item that must be retried.
     """
-    data = {}
-    text = (user_input + " " + ai_response).lower()
+    parts = []
+    for position, text in enumerate(texts, 1):
+        parts.append(f"{BATCH_DELIMITER.format(index=position)}\n{text.strip()}")
     
-    # Property type detection
-    if "rumah" in text:
-        data['property_type'] = "rumah"
-    elif "apartemen" in text or "apartment" in text:
-        data['property_type'] = "apartemen"
-    elif "tanah" in text or "kavling" in text:
-        data['property_type'] = "tanah"
-    elif "ruko" in text:
-        data['property_type'] = "ruko"
-    elif "villa" in text:
-        data['property_type'] = "villa"
+    results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+    try:
+        response = _generate(
+            'extract_property_batch',
+            "\n\n".join(parts),
+            BATCH_PREFIX,
+            items=len(texts),
+            lane=Lane.BACKFILL,
+            temperature=0.1,
+            response_mime_type='application/json',
+            response_schema=BATCH_RESPONSE_SCHEMA,
+            max_output_tokens=BATCH_MAX_OUTPUT_TOKENS
+        )
+        items = _extract_json_array(response.text)
+    except Exception as e:
+        if is_quota_error(e):
+            logger.warning(f"Gemini API quota exceeded during batch extraction: {e}")
+            raise _quota_exceeded(e)
+        logger.error(f"Error in batch extraction: {e!r}")
+        return results
     
-    # Transaction type
-    if "sewa" in text or "rent" in text or "kontrak" in text:
-        data['transaction_type'] = "sewa"
-    elif "jual" in text or "dijual" in text or "beli" in text:
-        data['transaction_type'] = "jual"
+    if not items:
+        logger.warning(f"Could not parse JSON array from batch response ({len(texts)} listings)")
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            position = int(item.pop('index'))
+        except (KeyError, TypeError, ValueError):
+            continue
+        item = _clean_extraction(item)
+        if 1 <= position <= len(texts) and item.get('property_type'):
+            results[position - 1] = item
+    return results
+
+
+def extract_property_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    Extract many listings with as few Gemini calls as possible (bulk imports, seeding)
     
-    # Price extraction (basic)
-    import re
+    Listings the local parser handles confidently and cached listings are skipped, the rest are packed into multi-listing requests sized
+    from their token counts. Only items missing from a batch answer are retried one by one.
     
-    # Look for price patterns like "2 miliar", "500 juta", "2M", "500jt"
-    price_patterns = [
-        r'(\d+[\.,]?\d*)\s*(?:miliar|milyar|m\b)',  # billions
-        r'(\d+[\.,]?\d*)\s*(?:juta|jt)',  # millions
-        r'rp\.?\s*(\d+[\.,]?\d*)',  # Rp notation
-    ]
+    Args:
+        texts: Raw listing texts
+        
+    Returns:
+        List of extracted property dicts, aligned with texts
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+    keys = [make_cache_key(text, EXTRACTION_CACHE_VERSION) for text in texts]
     
-    for pattern in price_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            price_str = match.group(1).replace(',', '.')
-            price_val = float(price_str)
-            
-            if 'miliar' in match.group(0).lower() or 'm' in match.group(0).lower():
-                data['price'] = int(price_val * 1_000_000_000)
-            elif 'juta' in match.group(0).lower() or 'jt' in match.group(0).lower():
-                data['price'] = int(price_val * 1_000_000)
-            else:
-                data['price'] = int(price_val)
-            break
+    # Cache hits and duplicates inside the batch cost nothing
+    pending: Dict[str, List[int]] = {}
+    for i, key in enumerate(keys):
+        local_data = _extract_locally(texts[i])
+        if local_data:
+            results[i] = local_data
+            continue
+        cached = extraction_cache.get(key) if key not in pending else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.setdefault(key, []).append(i)
     
-    # Bedrooms
-    bedroom_match = re.search(r'(\d+)\s*(?:kamar tidur|kt|bedroom|bed)', text, re.IGNORECASE)
-    if bedroom_match:
-        data['bedrooms'] = int(bedroom_match.group(1))
+    todo = [positions[0] for positions in pending.values()]
+    if todo:
+        token_counts = _count_listing_tokens([texts[i] for i in todo])
+        batches = _plan_batches(todo, token_counts)
+        logger.info(f"Batch extraction: {len(texts)} listings, {len(todo)} uncached, {len(batches)} requests")
+        
+        retry: List[int] = []
+        for batch in batches:
+            batch_results = _extract_batch_with_gemini([texts[i] for i in batch])
+            for i, data in zip(batch, batch_results):
+                if data:
+                    extraction_cache.set(keys[i], data)
+                    results[i] = data
+                else:
+                    retry.append(i)
+        
+        if retry:
+            logger.info(f"Retrying {len(retry)} listings individually")
+        for i in retry:
+            results[i] = _extract_single(texts[i], Lane.BACKFILL)
+        
+        # Fill duplicates of listings that were extracted once
+        for positions in pending.values():
+            for i in positions[1:]:
+                results[i] = copy.deepcopy(results[positions[0]])
     
-    # Bathrooms
-    bathroom_match = re.search(r'(\d+)\s*(?:kamar mandi|km|bathroom|bath)', text, re.IGNORECASE)
-    if bathroom_match:
-        data['bathrooms'] = int(bathroom_match.group(1))
+    return [result or {} for result in results]
+
+
+SEARCH_SYSTEM_PROMPT = """Anda adalah asisten pencarian properti. 
+Tugas Anda: Terjemahkan keinginan user menjadi filter database SQL.
+Jawaban berupa JSON sesuai skema yang diberikan.
+
+Contoh: "Cari rumah di Jaksel minimal 3 kamar harga max 5M yang ada kolam renang"
+-> property_type "rumah", location_keyword "Jakarta Selatan", max_price 5000000000,
+   min_bedrooms 3, must_have_facilities ["kolam renang"]
+
+Peraturan:
+1. Harga harus angka murni (5M -> 5000000000).
+2. location_keyword bisa nama kota, kecamatan, atau area.
+3. null jika tidak disebutkan.
+4. "must_have_facilities" adalah list string.
+"""
+
+SEARCH_PREFIX = PromptPrefix('search', SEARCH_SYSTEM_PROMPT)
+
+# AI-parsed queries are cached in memory only (they are cheap to recompute and short-lived)
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '2048'))
+SEARCH_CACHE_VERSION = hashlib.sha256(
+    f"{GEMINI_MODEL}\x00{SEARCH_SYSTEM_PROMPT}\x00{json.dumps(SEARCH_RESPONSE_SCHEMA, sort_keys=True)}".encode('utf-8')
+).hexdigest()[:16]
+search_cache = ExtractionCache(max_entries=SEARCH_CACHE_SIZE, persistent=False)
+
+
+def _search_prompt(user_query: str) -> str:
+    """Per-call part of the search-parsing prompt (the instructions travel in SEARCH_PREFIX)"""
+    return f"Input User: {user_query}"
+
+
+def _parse_search_response(response_text: Optional[str]) -> Dict[str, Any]:
+    """Turn the model's answer into search filters (empty dict if unusable)"""
+    filters = repair_json(response_text)
+    if not isinstance(filters, dict):
+        filters = {}
+    filters = {key: value for key, value in filters.items()
+               if key in SEARCH_RESPONSE_SCHEMA['properties'] and value is not None}
+    logger.info(f"Parsed search query: {filters}")
+    return filters
+
+
+def _search_config() -> Dict[str, Any]:
+    """Generation settings for search parsing: JSON constrained to the filter schema"""
+    return dict(
+        temperature=0.1,
+        response_mime_type='application/json',
+        response_schema=SEARCH_RESPONSE_SCHEMA,
+        max_output_tokens=SEARCH_MAX_OUTPUT_TOKENS,
+    )
+
+
+def _handle_search_error(e: Exception) -> Dict[str, Any]:
+    """Raise QuotaExceededError for quota errors, otherwise return empty filters"""
+    if is_quota_error(e):
+        logger.warning(f"Gemini API quota exceeded for search")
+        raise _quota_exceeded(e)
+    logger.error(f"Error parsing search query: {e!r}")
+    return {}  # Return empty dict on error (will fall back to basic text search)
+
+
+def _parse_search_locally(user_query: str) -> Optional[Dict[str, Any]]:
+    """Filters from the local grammar when it understood the whole query"""
+    parsed = parse_search_grammar(user_query)
+    if parsed.complete:
+        logger.info(f"Parsed search query locally, AI skipped: {parsed.filters}")
+        return parsed.filters
+    return None
+
+
+def _search_with_gemini(user_query: str) -> Dict[str, Any]:
+    """Run one blocking Gemini search-parsing call"""
+    try:
+        response = _generate('parse_search_query', _search_prompt(user_query), SEARCH_PREFIX,
+                             lane=Lane.SEARCH, **_search_config())
+        return _parse_search_response(response.text)
+    except Exception as e:
+        return _handle_search_error(e)
+
+
+async def _search_with_gemini_async(user_query: str) -> Dict[str, Any]:
+    """Run one Gemini search-parsing call on the async client"""
+    try:
+        response = await _generate_content_async(
+            'parse_search_query', _search_prompt(user_query), SEARCH_PREFIX,
+            lane=Lane.SEARCH, **_search_config()
+        )
+        return _parse_search_response(response.text)
+    except Exception as e:
+        return _handle_search_error(e)
+
+
+def parse_search_query(user_query: str) -> Dict[str, Any]:
+    """
+    Parse user's natural language search query into structured filters
     
-    # Land area
-    land_match = re.search(r'(?:luas tanah|lt)\s*[:\-]?\s*(\d+)\s*(?:m2|m²|meter)', text, re.IGNORECASE)
-    if land_match:
-        data['land_area'] = int(land_match.group(1))
+    Common phrasings are handled by the local grammar (search_grammar.py); only the rest
+    reach Gemini, and those answers are kept in an LRU keyed by the normalized query.
+    """
+    local_filters = _parse_search_locally(user_query)
+    if local_filters is not None:
+        return local_filters
     
-    # Building area
-    building_match = re.search(r'(?:luas bangunan|lb)\s*[:\-]?\s*(\d+)\s*(?:m2|m²|meter)', text, re.IGNORECASE)
-    if building_match:
-        data['building_area'] = int(building_match.group(1))
+    cache_key = make_cache_key(user_query, SEARCH_CACHE_VERSION)
+    return search_cache.get_or_compute(cache_key, lambda: _search_with_gemini(user_query)) or {}
+
+
+async def parse_search_query_async(user_query: str) -> Dict[str, Any]:
+    """
+    Async variant of parse_search_query for use inside bot handlers
+    """
+    local_filters = _parse_search_locally(user_query)
+    if local_filters is not None:
+        return local_filters
     
-    return data
+    cache_key = make_cache_key(user_query, SEARCH_CACHE_VERSION)
+    return await search_cache.aget_or_compute(cache_key, lambda: _search_with_gemini_async(user_query)) or {}
+
+
+def _parse_text_response(user_input: str, ai_response: str = "") -> Dict[str, Any]:
+    """
+    Fallback parser for extracting basic property info from text
+    """
+    text = f"{user_input}\n{ai_response}" if ai_response else user_input
+    return parse_listing(text).data
+
+
+def extract_property_draft(user_input: str) -> Dict[str, Any]:
+    """
+    Instant best-effort extraction from the local parser, shown while the AI is still working
+    """
+    return parse_listing(user_input).data
+
+
+def _extract_locally(user_input: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the local parser's confident fields when the record is complete enough to
+    skip Gemini (low-confidence guesses are dropped rather than saved unchecked)
+    """
+    local = parse_listing(user_input)
+    if local.is_confident():
+        data = local.confident_data()
+        logger.info(f"Extracted property data locally, AI skipped: {data}")
+        return data
+    return None
 
 
 def generate_property_summary(property_data: Dict[str, Any]) -> str:
@@ -524,20 +969,36 @@ def generate_property_summary(property_data: Dict[str, Any]) -> str:
     return "\n".join(parts)
 
 
+def _ask_prompt(question: str, context: str = "") -> str:
+    """Build the prompt for a general question"""
+    return f"{context}\n\nPertanyaan: {question}" if context else question
+
+
+def _handle_ask_error(e: Exception) -> str:
+    """Map a Gemini error to a user-facing message"""
+    if is_quota_error(e):
+        return "Maaf, kuota AI sementara habis. Silakan coba lagi sebentar lagi atau hubungi admin."
+    logger.error(f"Error asking Gemini: {e!r}")
+    return "Maaf, saya mengalami kesulitan memproses pertanyaan Anda. Silakan coba lagi."
+
+
 def ask_gemini(question: str, context: str = "") -> str:
     """
     General purpose AI assistant for answering questions
     """
     try:
-        prompt = f"{context}\n\nPertanyaan: {question}" if context else question
-        response = client.models.generate_content(
-            model='gemini-flash-latest',
-            contents=prompt
-        )
+        response = _generate('ask_gemini', _ask_prompt(question, context), lane=Lane.ASK)
+        return response.text
+    except Exception as e:
+        return _handle_ask_error(e)
+
+
+async def ask_gemini_async(question: str, context: str = "") -> str:
+    """
+    Async variant of ask_gemini
+    """
+    try:
+        response = await _generate_content_async('ask_gemini', _ask_prompt(question, context), lane=Lane.ASK)
         return response.text
     except Exception as e:
-        error_msg = str(e)
-        if '429' in error_msg or 'RESOURCE_EXHAUSTED' in error_msg:
-            return "Maaf, kuota AI sementara habis. Silakan coba lagi sebentar lagi atau hubungi admin."
-        logger.error(f"Error asking Gemini: {e}")
-        return "Maaf, saya mengalami kesulitan memproses pertanyaan Anda. Silakan coba lagi."
+        return _handle_ask_error(e)
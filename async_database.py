@@ -0,0 +1,691 @@
+"""
+Async database layer for the Telegram bot
+
+Same operations as database.py, on an asyncpg AsyncEngine so a slow query only
+suspends the handler that issued it instead of blocking the whole event loop.
+Models and filter conditions are shared with database.py; scripts (seed_data.py,
+migrations) keep using the sync functions.
+
+Inside unit_of_work() (the bot opens one per Telegram update) every read and write
+shares one session, so an update checks out one pooled connection; writes only
+flush. commit() commits them before the handler confirms the write to the user and
+hands the connection back to the pool, and the unit commits whatever is left at
+the end. Outside it each call runs in its own short session and commits itself.
+
+With DATABASE_REPLICA_URL set, read-only functions (read_scope) run on the replica
+(one session per unit as well), except for a user who wrote in the last
+REPLICA_STICKY_SECONDS or inside a unit of work that has uncommitted writes (see
+read_router.py). Writes always go to the primary.
+"""
+
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import DateTime, Integer, column, select, update, values
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from database import (
+    DATABASE_URL,
+    User,
+    Property,
+    PropertyImage,
+    UserPropertyStats,
+    PropertySummary,
+    PROPERTY_SUMMARY_COLUMNS,
+    STATS_DELTA_SQL,
+    STATS_LOCK_SHARED_SQL,
+    STATS_LOCK_SQL,
+    LOCATION_FIELDS,
+    advanced_search_conditions,
+    apply_gazetteer,
+    bulk_insert,
+    image_bulk_rows,
+    prepare_property,
+    property_bulk_rows,
+    property_copy_data,
+    reserve_ids_query,
+    city_condition,
+    keyword_search_conditions,
+    keyword_search_rank,
+    location_conditions,
+    count_query,
+    page_query,
+    property_ids_query,
+    property_images_query,
+    property_summaries,
+    unique_location_names,
+    property_stats_from_rollup,
+    property_stats_from_rows,
+    property_stats_query,
+    property_stats_rollup_insert,
+    stats_delta,
+    stats_delta_created,
+    stats_key,
+    RECENT_FIRST,
+    CHEAPEST_FIRST,
+)
+from facilities import normalize_facilities
+from pagination import PAGE_SIZE, Keyset, build_page
+from read_router import ReadRouter
+from user_cache import CachedUser, UserIdentityCache
+
+logger = logging.getLogger(__name__)
+
+# Pool sized for concurrent handlers: each awaiting handler holds one connection
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+# Optional streaming replica for read-only queries (same pool settings)
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+
+# Seconds between batched last_active writes
+USER_ACTIVITY_FLUSH_INTERVAL = float(os.getenv('USER_ACTIVITY_FLUSH_INTERVAL', '60'))
+
+
+def to_async_url(url: str):
+    """postgresql:// URL for the asyncpg driver (sslmode becomes asyncpg's ssl)"""
+    parsed = make_url(url).set(drivername='postgresql+asyncpg')
+    sslmode = parsed.query.get('sslmode')
+    if sslmode:
+        parsed = parsed.difference_update_query(['sslmode']).update_query_dict({'ssl': sslmode})
+    return parsed
+
+
+def _create_engine(url: str):
+    return create_async_engine(
+        to_async_url(url),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        echo=False,
+    )
+
+
+async_engine = _create_engine(DATABASE_URL)
+# Objects stay readable after commit: handlers may format them once the unit has ended
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+replica_engine = _create_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
+ReplicaSessionLocal = (async_sessionmaker(replica_engine, expire_on_commit=False, autoflush=False)
+                       if replica_engine is not None else None)
+
+user_cache = UserIdentityCache()
+read_router = ReadRouter()
+
+
+async def dispose_engine() -> None:
+    """Close pooled connections (bot shutdown)"""
+    await async_engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+
+class _UnitOfWork:
+    """Session of the running unit; cleared on exit so tasks spawned from it fall back to their own"""
+
+    def __init__(self, session: AsyncSession):
+        self.session: Optional[AsyncSession] = session
+        self.replica: Optional[AsyncSession] = None  # Opened by the first replica read
+        self.wrote = False  # Has uncommitted writes, only visible in its own session
+
+    async def release_replica(self) -> None:
+        """Hand the replica connection back to the pool (the session stays usable)"""
+        if self.replica is not None:
+            await self.replica.close()
+
+
+_current_unit: ContextVar[Optional[_UnitOfWork]] = ContextVar('db_unit_of_work', default=None)
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """
+    One session for the reads and writes done inside (e.g. one Telegram update),
+    committed by commit() or at the end. A failed write rolls back the uncommitted
+    part of the unit; nested calls join the outer unit.
+    """
+    outer = _current_unit.get()
+    if outer is not None and outer.session is not None:
+        yield outer.session
+        return
+
+    unit = _UnitOfWork(AsyncSessionLocal())
+    token = _current_unit.set(unit)
+    try:
+        yield unit.session
+        await unit.session.commit()
+    except BaseException:
+        await unit.session.rollback()
+        raise
+    finally:
+        session, unit.session = unit.session, None
+        _current_unit.reset(token)
+        await session.close()
+        await unit.release_replica()
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """Session of the current unit of work, or a short-lived one committed on exit"""
+    unit = _current_unit.get()
+    if unit is not None and unit.session is not None:
+        yield unit.session
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+        await db.commit()
+
+
+async def commit() -> None:
+    """
+    Commit the current unit's writes now, before telling the user they are saved
+    (a failure is raised to the caller). The unit's connections go back to the pool
+    until its next query. Outside a unit of work this does nothing.
+    """
+    unit = _current_unit.get()
+    if unit is None or unit.session is None:
+        return
+    try:
+        await unit.session.commit()
+    except BaseException:
+        await unit.session.rollback()
+        raise
+    unit.wrote = False
+    await unit.release_replica()
+
+
+@asynccontextmanager
+async def read_scope(user_id: Optional[int]) -> AsyncIterator[AsyncSession]:
+    """
+    Session for a read-only query on behalf of user_id: on the replica when
+    configured, unless the user wrote recently or the unit has uncommitted writes,
+    otherwise on the primary. Inside a unit of work this is the unit's session (or
+    its replica session), outside it a short-lived one.
+    """
+    unit = _current_unit.get()
+    if unit is None or unit.session is None:
+        unit = None
+    on_replica = False
+    if ReplicaSessionLocal is not None:
+        if unit is not None and unit.wrote:
+            read_router.record_primary_read()
+        elif user_id is not None:
+            on_replica = read_router.use_replica(user_id)
+        else:
+            read_router.record_primary_read()
+
+    if unit is None:
+        async with (ReplicaSessionLocal if on_replica else AsyncSessionLocal)() as db:
+            yield db
+    elif on_replica:
+        if unit.replica is None:
+            unit.replica = ReplicaSessionLocal()
+        yield unit.replica
+    else:
+        yield unit.session
+
+
+def mark_write(user_id: Optional[int]) -> None:
+    """Send the user's reads, and the rest of the current unit's, to the primary"""
+    unit = _current_unit.get()
+    if unit is not None:
+        unit.wrote = True
+    if user_id is not None:
+        read_router.mark_write(user_id)
+
+
+async def _paginate(db: AsyncSession, conditions: list, keyset: Keyset, page: int, limit: int,
+                    cursor: Optional[str], with_total: Optional[bool]) -> Dict[str, Any]:
+    """One keyset page of properties; COUNT only when with_total (default: first page)"""
+    if with_total is None:
+        with_total = cursor is None
+    total_items = await db.scalar(count_query(conditions)) if with_total else None
+
+    properties = property_summaries(await db.execute(page_query(conditions, keyset, cursor, limit)))
+    return build_page(keyset, properties, cursor, page, limit, total_items)
+
+
+# CRUD Operations for Users
+async def get_or_create_user(telegram_id: int, username: str = None, first_name: str = None, last_name: str = None) -> CachedUser:
+    """
+    Get existing user or create new one.
+    Known users come from the identity cache without a query; their last_active
+    touch is buffered and written by flush_user_activity.
+    """
+    cached = user_cache.get(telegram_id)
+    if cached is not None:
+        user_cache.touch(cached.id)
+        return cached
+
+    async with read_scope(None) as db:
+        try:
+            user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
+        except Exception as e:
+            logger.error(f"Error getting/creating user: {e}")
+            raise
+    if user:
+        # Update last_active (write-behind)
+        user_cache.touch(user.id)
+        cached = CachedUser.from_user(user)
+        user_cache.put(cached)
+        return cached
+
+    async with session_scope() as db:
+        try:
+            user = User(
+                telegram_id=telegram_id,
+                username=username,
+                first_name=first_name,
+                last_name=last_name
+            )
+            try:
+                # Savepoint: a concurrent insert must not roll back the whole unit of work
+                async with db.begin_nested():
+                    db.add(user)
+                mark_write(user.id)
+                logger.info(f"Created new user: {telegram_id}")
+            except IntegrityError:
+                # Created concurrently by another handler
+                user = await db.scalar(select(User).where(User.telegram_id == telegram_id))
+            # Not cached yet: the insert is only final once the unit of work commits
+            return CachedUser.from_user(user)
+        except Exception as e:
+            logger.error(f"Error getting/creating user: {e}")
+            await db.rollback()
+            raise
+
+
+async def flush_user_activity() -> int:
+    """Write buffered last_active touches in one UPDATE ... FROM (VALUES ...); returns rows written"""
+    pending = user_cache.drain_activity()
+    if not pending:
+        return 0
+    activity = values(
+        column('id', Integer), column('last_active', DateTime), name='activity'
+    ).data(list(pending.items()))
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(User)
+                .where(User.id == activity.c.id)
+                .values(last_active=activity.c.last_active)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Error flushing user activity: {e}")
+        user_cache.restore_activity(pending)
+        raise
+    user_cache.record_flush(len(pending))
+    return len(pending)
+
+
+async def run_user_activity_flusher(interval: float = USER_ACTIVITY_FLUSH_INTERVAL) -> None:
+    """Flush last_active touches every `interval` seconds until cancelled (final flush on exit)"""
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await flush_user_activity()
+            except Exception:
+                pass  # Already logged; touches are retried next round
+    finally:
+        try:
+            await flush_user_activity()
+        except Exception:
+            pass
+
+
+def get_user_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the user identity cache"""
+    return user_cache.stats()
+
+
+def get_read_router_stats() -> Dict[str, Any]:
+    """Replica/primary read counters of the read router"""
+    return read_router.stats()
+
+
+async def apply_stats_delta(db: AsyncSession, user_id: int, before: Optional[tuple], after: Optional[tuple]) -> None:
+    """Update the user's stats rollup in the same transaction as the listing write"""
+    delta = stats_delta(user_id, before, after)
+    if delta:
+        await db.execute(STATS_LOCK_SHARED_SQL, {'user_id': user_id})
+        await db.execute(STATS_DELTA_SQL, delta)
+
+
+async def seed_user_stats(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+    """
+    The user's stats, computing and storing their rollup if it is missing; the caller
+    commits (which releases the exclusive stats lock taken here)
+    """
+    await db.execute(STATS_LOCK_SQL, {'user_id': user_id})
+    rollup = await db.get(UserPropertyStats, user_id, populate_existing=True)
+    if rollup is not None:
+        return property_stats_from_rollup(rollup)
+    stats = property_stats_from_rows((await db.execute(property_stats_query(user_id))).all())
+    await db.execute(property_stats_rollup_insert(user_id, stats))
+    return stats
+
+
+# CRUD Operations for Properties
+async def create_property(user_id: int, property_data: Dict[str, Any]) -> Property:
+    """Create new property listing"""
+    async with session_scope() as db:
+        try:
+            property_obj = prepare_property(Property(user_id=user_id, **property_data))
+
+            db.add(property_obj)
+            await db.flush()
+            await apply_stats_delta(db, user_id, None, stats_key(property_obj))
+            mark_write(user_id)
+            logger.info(f"Created property {property_obj.id} for user {user_id}")
+            return property_obj
+        except Exception as e:
+            logger.error(f"Error creating property: {e}")
+            await db.rollback()
+            raise
+
+
+async def copy_properties(db: AsyncSession, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert prepared listing rows with asyncpg's COPY; returns their new ids in order"""
+    property_ids = (await db.execute(reserve_ids_query(Property, len(rows)))).scalars().all()
+    columns, data = property_copy_data(property_ids, rows)
+    connection = await (await db.connection()).get_raw_connection()
+    await connection.driver_connection.copy_to_table(Property.__tablename__, source=data, columns=columns)
+    return property_ids
+
+
+async def create_properties_bulk(user_id: int, properties_data: List[Dict[str, Any]]) -> List[int]:
+    """Create many listings with a single COPY; returns the new ids in order"""
+    if not properties_data:
+        return []
+    async with session_scope() as db:
+        try:
+            rows = property_bulk_rows(user_id, properties_data)
+            property_ids = await copy_properties(db, rows)
+            delta = stats_delta_created(user_id, [(row['property_type'], row['transaction_type'], row['status'])
+                                                  for row in rows])
+            if delta:
+                await db.execute(STATS_LOCK_SHARED_SQL, {'user_id': user_id})
+                await db.execute(STATS_DELTA_SQL, delta)
+            mark_write(user_id)
+            logger.info(f"Created {len(property_ids)} properties for user {user_id}")
+            return property_ids
+        except Exception as e:
+            logger.error(f"Error creating properties in bulk: {e}")
+            await db.rollback()
+            raise
+
+
+async def get_user_properties(user_id: int, page: int = 1, limit: int = PAGE_SIZE, cursor: Optional[str] = None,
+                              with_total: Optional[bool] = None) -> Dict[str, Any]:
+    """Get properties by user with pagination"""
+    async with read_scope(user_id) as db:
+        try:
+            return await _paginate(db, [Property.user_id == user_id], RECENT_FIRST, page, limit, cursor, with_total)
+        except Exception as e:
+            logger.error(f"Error getting user properties: {e}")
+            raise
+
+
+async def search_properties_advanced(user_id: int, filters: Dict[str, Any], page: int = 1, limit: int = PAGE_SIZE,
+                                     cursor: Optional[str] = None, with_total: Optional[bool] = None) -> Dict[str, Any]:
+    """Search properties using structured filters from AI"""
+    async with read_scope(user_id) as db:
+        try:
+            return await _paginate(db, advanced_search_conditions(user_id, filters),
+                                   RECENT_FIRST, page, limit, cursor, with_total)
+        except Exception as e:
+            logger.error(f"Error searching properties advanced: {e}")
+            raise
+
+
+async def search_properties(user_id: int, keyword: str, page: int = 1, limit: int = PAGE_SIZE, cursor: Optional[str] = None,
+                            with_total: Optional[bool] = None) -> Dict[str, Any]:
+    """Search user properties by keyword"""
+    async with read_scope(user_id) as db:
+        try:
+            return await _paginate(db, keyword_search_conditions(user_id, keyword),
+                                   RECENT_FIRST, page, limit, cursor, with_total)
+        except Exception as e:
+            logger.error(f"Error searching properties: {e}")
+            raise
+
+
+async def _property_ids(user_id: int, conditions: list, limit: int, rank=None) -> List[int]:
+    """Ids of matching properties, most relevant (if ranked) then newest first (for search sessions)"""
+    async with read_scope(user_id) as db:
+        result = await db.scalars(property_ids_query(conditions, limit, rank))
+        return list(result)
+
+
+async def search_property_ids_advanced(user_id: int, filters: Dict[str, Any], limit: int) -> List[int]:
+    """Ordered ids matching structured AI filters (same order as search_properties_advanced)"""
+    try:
+        return await _property_ids(user_id, advanced_search_conditions(user_id, filters), limit)
+    except Exception as e:
+        logger.error(f"Error materializing advanced search: {e}")
+        raise
+
+
+async def search_property_ids(user_id: int, keyword: str, limit: int) -> List[int]:
+    """Ids matching a keyword, ranked by relevance"""
+    try:
+        return await _property_ids(user_id, keyword_search_conditions(user_id, keyword), limit,
+                                   keyword_search_rank(keyword))
+    except Exception as e:
+        logger.error(f"Error materializing keyword search: {e}")
+        raise
+
+
+async def get_properties_by_ids(user_id: int, property_ids: List[int]) -> List[PropertySummary]:
+    """Summaries of a user's properties by primary key, in the given order (deleted ones are skipped)"""
+    if not property_ids:
+        return []
+    async with read_scope(user_id) as db:
+        try:
+            result = await db.execute(select(*PROPERTY_SUMMARY_COLUMNS).where(
+                Property.id.in_(property_ids),
+                Property.user_id == user_id
+            ))
+            by_id = {prop.id: prop for prop in property_summaries(result)}
+            return [by_id[pid] for pid in property_ids if pid in by_id]
+        except Exception as e:
+            logger.error(f"Error getting properties by ids: {e}")
+            raise
+
+
+async def get_property_by_id(property_id: int, with_images: bool = False,
+                             user_id: Optional[int] = None) -> Optional[Property]:
+    """
+    Get property by ID; with_images loads its photos too (primary first) in one
+    extra IN query, since the lazy relationship cannot load after the session ends.
+    user_id is the reader, for replica routing (None reads from the primary).
+    """
+    async with read_scope(user_id) as db:
+        try:
+            options = [selectinload(Property.images)] if with_images else []
+            return await db.get(Property, property_id, options=options, populate_existing=with_images)
+        except Exception as e:
+            logger.error(f"Error getting property: {e}")
+            raise
+
+
+async def update_property(property_id: int, update_data: Dict[str, Any]) -> Optional[Property]:
+    """Update property"""
+    async with session_scope() as db:
+        try:
+            property_obj = await db.get(Property, property_id)
+            if property_obj:
+                before = stats_key(property_obj)
+                for key, value in update_data.items():
+                    setattr(property_obj, key, value)
+                if any(field in update_data for field in LOCATION_FIELDS):
+                    apply_gazetteer(property_obj)
+                if 'facilities' in update_data:
+                    property_obj.facilities = normalize_facilities(property_obj.facilities)
+                await apply_stats_delta(db, property_obj.user_id, before, stats_key(property_obj))
+                await db.flush()
+                mark_write(property_obj.user_id)
+                logger.info(f"Updated property {property_id}")
+            return property_obj
+        except Exception as e:
+            logger.error(f"Error updating property: {e}")
+            await db.rollback()
+            raise
+
+
+async def delete_property(property_id: int, user_id: int) -> bool:
+    """Delete property securely (check ownership)"""
+    async with session_scope() as db:
+        try:
+            property_obj = await db.scalar(select(Property).where(
+                Property.id == property_id,
+                Property.user_id == user_id
+            ))
+
+            if property_obj:
+                await apply_stats_delta(db, user_id, stats_key(property_obj), None)
+                await db.delete(property_obj)
+                await db.flush()
+                mark_write(user_id)
+                logger.info(f"Deleted property {property_id} for user {user_id}")
+                return True
+            return False
+        except Exception as e:
+            logger.error(f"Error deleting property: {e}")
+            await db.rollback()
+            raise
+
+
+# CRUD Operations for Property Images
+async def _mark_image_write(db: AsyncSession, property_ids: List[int]) -> None:
+    """mark_write for the owners of the properties that got images (owners only needed with a replica)"""
+    mark_write(None)
+    if ReplicaSessionLocal is None:
+        return
+    owners = await db.scalars(select(Property.user_id).where(Property.id.in_(set(property_ids))).distinct())
+    for owner_id in owners:
+        mark_write(owner_id)
+
+
+async def add_property_image(property_id: int, file_id: str, caption: str = None, is_primary: bool = False) -> PropertyImage:
+    """Add image to property"""
+    async with session_scope() as db:
+        try:
+            image = PropertyImage(
+                property_id=property_id,
+                file_id=file_id,
+                caption=caption,
+                is_primary=is_primary
+            )
+            db.add(image)
+            await db.flush()
+            await _mark_image_write(db, [property_id])
+            logger.info(f"Added image to property {property_id}")
+            return image
+        except Exception as e:
+            logger.error(f"Error adding property image: {e}")
+            await db.rollback()
+            raise
+
+
+async def add_property_images_bulk(images: List[Dict[str, Any]]) -> List[int]:
+    """Add many images (see image_bulk_rows) with one multi-row INSERT; returns the new ids in order"""
+    if not images:
+        return []
+    async with session_scope() as db:
+        try:
+            image_ids = (await db.execute(bulk_insert(PropertyImage), image_bulk_rows(images))).scalars().all()
+            await _mark_image_write(db, [image['property_id'] for image in images])
+            logger.info(f"Added {len(image_ids)} images")
+            return image_ids
+        except Exception as e:
+            logger.error(f"Error adding property images in bulk: {e}")
+            await db.rollback()
+            raise
+
+
+async def get_property_images(property_id: int, user_id: int) -> List[PropertyImage]:
+    """Photos of a user's property, primary first, in one query"""
+    async with read_scope(user_id) as db:
+        try:
+            return (await db.scalars(property_images_query(property_id, user_id))).all()
+        except Exception as e:
+            logger.error(f"Error getting property images: {e}")
+            raise
+
+
+async def get_property_stats(user_id: int = None) -> Dict[str, Any]:
+    """
+    Get statistics about properties: a user's come from their rollup row (computed
+    once on the primary with the grouped query if missing), overall stats from the
+    grouped query
+    """
+    try:
+        if not user_id:
+            async with read_scope(None) as db:
+                return property_stats_from_rows((await db.execute(property_stats_query())).all())
+        async with read_scope(user_id) as db:
+            rollup = await db.get(UserPropertyStats, user_id, populate_existing=True)
+            if rollup is not None:
+                return property_stats_from_rollup(rollup)
+        # On the unit's session: it may hold the shared stats lock of its writes, which
+        # a seed on another connection would wait for
+        unit = _current_unit.get()
+        async with session_scope() as db:
+            stats = await seed_user_stats(db, user_id)
+        if unit is not None and not unit.wrote:
+            # Nothing else pending: release the exclusive seed lock now, not at the end of the update
+            await commit()
+        return stats
+    except Exception as e:
+        logger.error(f"Error getting property stats: {e}")
+        raise
+
+
+async def get_unique_cities(user_id: int) -> List[str]:
+    """Get list of unique cities for user's properties"""
+    async with read_scope(user_id) as db:
+        cities = await db.execute(
+            select(Property.city_id, Property.city)
+            .where(Property.user_id == user_id, Property.city.isnot(None), Property.city != '')
+            .distinct()
+        )
+        return unique_location_names(cities)
+
+
+async def get_unique_districts(user_id: int, city: str) -> List[str]:
+    """Get list of unique districts for a city"""
+    async with read_scope(user_id) as db:
+        districts = await db.execute(
+            select(Property.district_id, Property.district)
+            .where(Property.user_id == user_id, city_condition(city),
+                   Property.district.isnot(None), Property.district != '')
+            .distinct()
+        )
+        return unique_location_names(districts)
+
+
+async def get_properties_by_location(user_id: int, city: str = None, district: str = None, min_price: int = None, max_price: int = None, page: int = 1, limit: int = PAGE_SIZE,
+                                     cursor: Optional[str] = None, with_total: Optional[bool] = None) -> Dict[str, Any]:
+    """Get properties filtered by city/district/price with pagination"""
+    async with read_scope(user_id) as db:
+        try:
+            # Sort by LOWEST PRICE first
+            return await _paginate(db, location_conditions(user_id, city, district, min_price, max_price),
+                                   CHEAPEST_FIRST, page, limit, cursor, with_total)
+        except Exception as e:
+            logger.error(f"Error getting properties by location: {e}")
+            raise
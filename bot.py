@@ -4,18 +4,23 @@ Powered by Google Gemini AI
 """
 
 import os
+import asyncio
 import logging
-from typing import Dict, Any
+from typing import Any, Awaitable, Dict, Optional, Tuple
 from telegram import (
+    Bot,
     Update, 
     ReplyKeyboardMarkup, 
     ReplyKeyboardRemove,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InputMediaPhoto,
     CallbackQuery
 )
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     ConversationHandler,
@@ -28,25 +33,34 @@ from PIL import Image
 import io
 
 # Import our modules
-from database import (
-    init_db,
+from database import init_db
+from async_database import (
+    dispose_engine,
+    run_user_activity_flusher,
+    unit_of_work,
+    commit,
     get_or_create_user,
     create_property,
     get_user_properties,
     get_property_stats,
     add_property_image,
-    search_properties,
-    search_properties_advanced,
     delete_property,
     get_property_by_id,
+    get_property_images,
+    get_properties_by_ids,
+    search_property_ids,
+    search_property_ids_advanced,
     get_unique_cities,
     get_unique_districts,
     get_properties_by_location,
 )
+from pagination import PAGE_SIZE, page_count
+from search_sessions import SearchSession, search_sessions
 from ai_processor import (
-    extract_property_info, 
+    extract_property_draft,
+    extract_property_info_async,
     generate_property_summary,
-    parse_search_query,
+    parse_search_query_async,
     QuotaExceededError
 )
 
@@ -155,6 +169,70 @@ FILTER_CITY, FILTER_DISTRICT, FILTER_PRICE = range(10, 13)
 # Temporary storage for property data during conversation
 user_property_data: Dict[int, Dict[str, Any]] = {}
 
+# Max seconds /add waits for the AI before showing the local parser's draft
+EXTRACTION_DEADLINE = float(os.getenv('EXTRACTION_DEADLINE', '1.5'))
+
+# Max updates processed at the same time (across different users)
+BOT_CONCURRENT_UPDATES = int(os.getenv('BOT_CONCURRENT_UPDATES', '64'))
+
+# Telegram albums hold at most 10 photos
+MEDIA_GROUP_SIZE = 10
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates from different users concurrently, but updates from the same
+    user one by one so ConversationHandler state transitions stay ordered.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._waiters: Dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            await self._process_in_unit_of_work(update, coroutine)
+            return
+
+        lock = self._user_locks.setdefault(user.id, asyncio.Lock())
+        self._waiters[user.id] = self._waiters.get(user.id, 0) + 1
+        try:
+            async with lock:
+                await self._process_in_unit_of_work(update, coroutine)
+        finally:
+            self._waiters[user.id] -= 1
+            if not self._waiters[user.id]:
+                del self._waiters[user.id]
+                del self._user_locks[user.id]
+
+    @staticmethod
+    async def _process_in_unit_of_work(update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        Database reads and writes of one update share a session (one pooled
+        connection); handlers commit() before confirming a save, which also returns
+        the connection, anything left is committed at the end
+        """
+        try:
+            async with unit_of_work():
+                await coroutine
+        except Exception as e:
+            logger.error(f"Error committing update: {e}")
+            chat = getattr(update, 'effective_chat', None)
+            if chat is not None:
+                try:
+                    await chat.send_message("❌ Maaf, perubahan terakhir gagal disimpan. Silakan coba lagi.")
+                except Exception as send_error:
+                    logger.error(f"Could not report failed commit: {send_error}")
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
 def generate_verification_message(data: Dict[str, Any]) -> str:
     """Generate a detailed list view for verification"""
     text = "📋 *Verifikasi Data Property*\n"
@@ -245,7 +323,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     
     # Create or update user in database
-    get_or_create_user(
+    await get_or_create_user(
         telegram_id=user.id,
         username=user.username,
         first_name=user.first_name,
@@ -314,13 +392,12 @@ Ketik /cancel untuk membatalkan.
     return COLLECTING_INFO
 
 
-async def send_verification_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Helper to send/update verification view with edit buttons"""
-    user_id = update.effective_user.id
-    data = user_property_data.get(user_id, {})
-    
+def build_verification_view(data: Dict[str, Any], ai_pending: bool = False) -> Tuple[str, InlineKeyboardMarkup]:
+    """Verification text and edit buttons for the collected data"""
     # Generate verbose checklist
     message = generate_verification_message(data)
+    if ai_pending:
+        message += "\n⏳ _Draft awal, AI masih memproses. Data akan diperbarui otomatis..._\n"
     message += "\n👇 *Menu Aksi:*"
     
     # Inline Keyboard for edits
@@ -346,20 +423,71 @@ async def send_verification_view(update: Update, context: ContextTypes.DEFAULT_T
             InlineKeyboardButton("✅ SIMPAN DATA", callback_data="save_property")
         ]
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return message, InlineKeyboardMarkup(keyboard)
+
+
+async def send_verification_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Helper to send/update verification view with edit buttons"""
+    user_id = update.effective_user.id
+    data = user_property_data.get(user_id, {})
+    message, reply_markup = build_verification_view(data, context.user_data.get('ai_pending', False))
     
     if update.callback_query:
-        await update.callback_query.edit_message_text(
+        sent = await update.callback_query.edit_message_text(
             message, 
             parse_mode='Markdown', 
             reply_markup=reply_markup
         )
     else:
-        await update.message.reply_text(
+        sent = await update.message.reply_text(
             message, 
             parse_mode='Markdown', 
             reply_markup=reply_markup
         )
+    
+    # Remember where the view is so a late AI result can update it in place
+    if hasattr(sent, 'message_id'):
+        context.user_data['verification_message'] = (sent.chat_id, sent.message_id)
+
+
+async def upgrade_with_ai_result(bot: Bot, user_data: Dict[str, Any], user_id: int,
+                                 draft: Dict[str, Any], extraction: "asyncio.Future[Dict[str, Any]]") -> None:
+    """
+    Merge a late AI extraction into the draft shown to the user and edit the view in place.
+    Fields the user edited in the meantime keep the user's value.
+    """
+    try:
+        ai_data = await extraction
+    except QuotaExceededError:
+        ai_data = {}
+    except Exception as e:
+        logger.error(f"Background AI extraction failed: {e}")
+        ai_data = {}
+    
+    if user_property_data.get(user_id) is not draft:
+        return  # Saved, cancelled or restarted meanwhile
+    
+    user_data['ai_pending'] = False
+    edited = user_data.get('edited_fields', set())
+    for key, value in ai_data.items():
+        if key not in edited and value is not None:
+            draft[key] = value
+    
+    location = user_data.get('verification_message')
+    if location is None:
+        return  # A field is being edited; the view is rendered again after the edit
+    
+    message, reply_markup = build_verification_view(draft)
+    try:
+        await bot.edit_message_text(
+            message,
+            chat_id=location[0],
+            message_id=location[1],
+            parse_mode='Markdown',
+            reply_markup=reply_markup
+        )
+    except BadRequest as e:
+        logger.info(f"Could not update verification view: {e}")
 
 async def collect_property_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Collect and extract property information using AI"""
@@ -367,17 +495,36 @@ async def collect_property_info(update: Update, context: ContextTypes.DEFAULT_TY
     user_input = update.message.text
     
     status_msg = await update.message.reply_text("🤔 Memproses informasi dengan AI...")
+    context.user_data['edited_fields'] = set()
+    context.user_data['ai_pending'] = False
+    
+    # Extract property data using Gemini AI, waiting at most EXTRACTION_DEADLINE seconds
+    extraction = asyncio.ensure_future(extract_property_info_async(user_input))
+    done, _ = await asyncio.wait({extraction}, timeout=EXTRACTION_DEADLINE)
+    
+    if not done:
+        # Show the local parser's draft now, the AI result updates it when it arrives
+        draft = extract_property_draft(user_input)
+        user_property_data[user_id] = draft
+        context.user_data['ai_pending'] = True
+        await status_msg.delete()
+        await send_verification_view(update, context)
+        context.application.create_task(
+            upgrade_with_ai_result(context.bot, context.user_data, user_id, draft, extraction),
+            update=update
+        )
+        return CONFIRM_DATA
     
     try:
-        # Extract property data using Gemini AI
-        extracted_data = extract_property_info(user_input)
+        extracted_data = extraction.result()
         # Delete processing message
         await status_msg.delete()
         
-    except QuotaExceededError:
+    except QuotaExceededError as e:
+        wait_hint = f"sekitar {max(int(e.retry_after), 1)} detik" if e.retry_after else "beberapa saat"
         await status_msg.edit_text(
-            "⚠️ *Limit Kuota AI Harian Tercapai*\n\n"
-            "Mohon maaf, layanan AI sedang sibuk. Silakan tunggu sekitar 15-30 menit.\n"
+            "⚠️ *Limit Kuota AI Tercapai*\n\n"
+            f"Mohon maaf, layanan AI sedang sibuk. Silakan coba lagi dalam {wait_hint}.\n"
             "Atau hubungi admin untuk upgrade layanan. 🙏",
             parse_mode='Markdown'
         )
@@ -409,16 +556,25 @@ async def handle_confirmation_action(update: Update, context: ContextTypes.DEFAU
     
     if action == "save_property":
         # Save to DB logic
-        user = get_or_create_user(
+        user = await get_or_create_user(
             telegram_id=user_id,
             username=update.effective_user.username,
             first_name=update.effective_user.first_name,
             last_name=update.effective_user.last_name
         )
         
+        property_data = user_property_data.get(user_id, {})
+        if not property_data.get('property_type'):
+            # Draft without a type (AI still working) cannot be saved yet
+            await query.message.reply_text(
+                "⏳ Jenis properti belum terdeteksi. Tunggu hasil AI sebentar, "
+                "atau /cancel lalu sebutkan jenis properti (rumah/apartemen/tanah/ruko/villa)."
+            )
+            return CONFIRM_DATA
+        
         try:
-            property_data = user_property_data.get(user_id, {})
-            property_obj = create_property(user.id, property_data)
+            property_obj = await create_property(user.id, property_data)
+            await commit()
             
             # Store property_id in context
             context.user_data['current_property_id'] = property_obj.id
@@ -463,6 +619,8 @@ async def handle_confirmation_action(update: Update, context: ContextTypes.DEFAU
         # Handle Edit Request
         field = action.replace("edit_", "")
         context.user_data['editing_field'] = field
+        # The view is replaced by the edit prompt until the edit is done
+        context.user_data.pop('verification_message', None)
         
         field_names = {
             'price': 'Harga Jual (angka)',
@@ -536,6 +694,9 @@ async def handle_edit_value(update: Update, context: ContextTypes.DEFAULT_TYPE)
             # Text fields
             data[field] = new_value
             
+        # A late AI result must not overwrite what the user typed
+        context.user_data.setdefault('edited_fields', set()).add(field)
+        
         # Update successful
         await update.message.reply_text(f"✅ {field} berhasil diupdate!")
         
@@ -590,7 +751,8 @@ async def handle_photo_upload(update: Update, context: ContextTypes.DEFAULT_TYPE
             
             # Save compressed photo file_id to database
             compressed_file_id = sent_message.photo[-1].file_id
-            add_property_image(property_id, compressed_file_id, caption)
+            await add_property_image(property_id, compressed_file_id, caption)
+            await commit()
             
             await update.message.reply_text(
                 "✅ Foto berhasil ditambahkan dan dikompresi!\n\n"
@@ -646,7 +808,7 @@ def compress_image(image_bytes: bytes, target_size_kb: int = 100, max_dimension:
 async def list_properties(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """List user's properties with pagination"""
     # Get database user (not telegram_id!)
-    user = get_or_create_user(
+    user = await get_or_create_user(
         telegram_id=update.effective_user.id,
         username=update.effective_user.username,
         first_name=update.effective_user.first_name,
@@ -657,7 +819,7 @@ async def list_properties(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     page = 1
     
     # Fetch properties using database user.id
-    result = get_user_properties(user.id, page=page, limit=5)
+    result = await get_user_properties(user.id, page=page, limit=PAGE_SIZE)
     
     if not result['items']:
         await update.message.reply_text(
@@ -672,8 +834,6 @@ async def list_properties(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Search properties by keyword or AI Intent"""
-    user_id = update.effective_user.id
-    
     if not context.args:
         await update.message.reply_text(
             "🔍 *Pencarian Pintar*\n\n"
@@ -690,20 +850,7 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     try:
         # Try AI Smart Search first
-        filters = parse_search_query(query_text)
-        
-        if filters:
-            # Use advanced search
-            result = search_properties_advanced(user_id, filters, page=1, limit=5)
-            mode = "search_adv"
-            # Store filters for pagination (need to serialize/store in user_data properly)
-            context.user_data['search_filters'] = filters
-        else:
-            # Fallback to basic keyword search
-            result = search_properties(user_id, query_text, page=1, limit=5)
-            mode = "search"
-            context.user_data['search_keyword'] = query_text
-            
+        filters = await parse_search_query_async(query_text)
     except QuotaExceededError:
         # Fallback to basic search if quota exceeded
         await update.message.reply_text(
@@ -711,9 +858,30 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "Mengalihkan ke pencarian kata kunci manual...",
             parse_mode='Markdown'
         )
-        result = search_properties(user_id, query_text, page=1, limit=5)
+        filters = None
+    
+    # Database work starts after the AI call so no connection sits idle while Gemini answers.
+    # Properties are owned by the database user, not the telegram_id
+    user = await get_or_create_user(
+        telegram_id=update.effective_user.id,
+        username=update.effective_user.username,
+        first_name=update.effective_user.first_name,
+        last_name=update.effective_user.last_name
+    )
+    
+    if filters:
+        # Use advanced search
+        mode = "search_adv"
+        # Kept to run the search again if its session expires
+        context.user_data['search_filters'] = filters
+    else:
+        # Fallback to basic keyword search
         mode = "search"
         context.user_data['search_keyword'] = query_text
+    
+    # Materialize the ordered result ids once; Next/Prev only fetch their page by id
+    session = await open_search_session(user.id, mode, filters or query_text)
+    result = await search_session_page(user.id, session, 1)
 
     if not result['items']:
         await update.message.reply_text(f"❌ Tidak ditemukan properti yang cocok.")
@@ -722,15 +890,91 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await send_property_list(update, context, result, mode)
 
 
+async def open_search_session(user_id: int, mode: str, search_query: Any) -> SearchSession:
+    """Run a search once (keyword for 'search', AI filters for 'search_adv') and keep its ordered ids"""
+    limit = search_sessions.max_ids + 1  # One extra id tells whether the list was capped
+    if mode == "search_adv":
+        ids = await search_property_ids_advanced(user_id, search_query, limit)
+    else:
+        ids = await search_property_ids(user_id, search_query, limit)
+    return search_sessions.create(user_id, ids)
+
+
+async def search_session_page(user_id: int, session: SearchSession, page: int, limit: int = PAGE_SIZE) -> Dict[str, Any]:
+    """One page of a materialized search, fetched by primary key"""
+    total_pages = max(page_count(session.total, limit), 1)
+    page = min(max(page, 1), total_pages)
+    items = await get_properties_by_ids(user_id, session.page_ids(page, limit))
+    cursor = f"s{session.token}"
+    return {
+        'items': items,
+        'total_items': session.total,
+        'total_pages': total_pages,
+        'current_page': page,
+        'truncated': session.truncated,
+        'next_cursor': cursor if page < total_pages else None,
+        'prev_cursor': cursor if page > 1 else None,
+    }
+
+
+def remember_total(context: ContextTypes.DEFAULT_TYPE, mode: str, result: Dict[str, Any]) -> None:
+    """
+    Later pages skip the COUNT query: reuse the total counted on the first page
+    (approximate if listings changed meanwhile)
+    """
+    totals = context.user_data.setdefault('page_totals', {})
+    if result['total_items'] is not None:
+        totals[mode] = result['total_items']
+    elif mode in totals:
+        result['total_items'] = totals[mode]
+        result['total_pages'] = max(page_count(totals[mode]), result['current_page'])
+
+
+def page_label(result: Dict[str, Any]) -> str:
+    """'Halaman 2/7', or just 'Halaman 2' when the total is unknown"""
+    if result['total_pages'] is None:
+        return f"Halaman {result['current_page']}"
+    return f"Halaman {result['current_page']}/{result['total_pages']}"
+
+
+def pagination_buttons(mode: str, result: Dict[str, Any]) -> list:
+    """Prev/Next buttons carrying the keyset cursor: page_<mode>_<page>_<cursor>"""
+    page = result['current_page']
+    nav_buttons = []
+    if result['prev_cursor']:
+        nav_buttons.append(InlineKeyboardButton(
+            "⬅️ Prev", callback_data=f"page_{mode}_{page-1}_{result['prev_cursor']}"))
+    if result['next_cursor']:
+        nav_buttons.append(InlineKeyboardButton(
+            "Next ➡️", callback_data=f"page_{mode}_{page+1}_{result['next_cursor']}"))
+    return nav_buttons
+
+
+def parse_page_callback(data: str) -> Tuple[str, int, Optional[str]]:
+    """
+    (mode, page, cursor) of page_<mode>_<page>_<cursor>; mode may itself contain '_'
+    (search_adv). Buttons sent before keyset pagination carry no cursor: page_<mode>_<page>
+    """
+    parts = data[len("page_"):].split("_")
+    for i, part in enumerate(parts[1:], start=1):
+        if part.isdigit():
+            return "_".join(parts[:i]), int(part), "_".join(parts[i + 1:]) or None
+    raise ValueError(f"Invalid page callback: {data}")
+
+
 async def send_property_list(update: Update, context: ContextTypes.DEFAULT_TYPE, result: Dict[str, Any], mode: str):
     """Helper to send interactive property list"""
+    remember_total(context, mode, result)
     items = result['items']
     page = result['current_page']
-    total_pages = result['total_pages']
     total_items = result['total_items']
     
     title = "🏠 *Daftar Properti Anda*" if mode == "list" else f"🔍 *Hasil Pencarian*"
-    message = f"{title} (Halaman {page}/{total_pages})\nTotal: {total_items} properti\n\n"
+    message = f"{title} ({page_label(result)})\n"
+    if total_items is not None:
+        more = "+" if result.get('truncated') else ""
+        message += f"Total: {total_items}{more} properti\n"
+    message += "\n"
     
     keyboard = []
     row_buttons = []
@@ -775,11 +1019,7 @@ async def send_property_list(update: Update, context: ContextTypes.DEFAULT_TYPE,
         keyboard.append(row_buttons)
         
     # Pagination buttons
-    nav_buttons = []
-    if page > 1:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"page_{mode}_{page-1}"))
-    if page < total_pages:
-        nav_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"page_{mode}_{page+1}"))
+    nav_buttons = pagination_buttons(mode, result)
         
     if nav_buttons:
         keyboard.append(nav_buttons)
@@ -799,7 +1039,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     telegram_id = query.from_user.id
     
     # Get database user for queries
-    user = get_or_create_user(
+    user = await get_or_create_user(
         telegram_id=telegram_id,
         username=query.from_user.username,
         first_name=query.from_user.first_name,
@@ -813,7 +1053,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # 1. Show Detail
     if data.startswith("detail_"):
         prop_id = int(data.split("_")[1])
-        prop = get_property_by_id(prop_id)
+        prop = await get_property_by_id(prop_id, with_images=True, user_id=user.id)
         
         if not prop:
             await query.edit_message_text("❌ Properti tidak ditemukan atau sudah dihapus.")
@@ -826,6 +1066,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             [InlineKeyboardButton("🔙 Kembali", callback_data="back_to_list"), 
              InlineKeyboardButton("❌ Hapus", callback_data=f"delete_confirm_{prop_id}")]
         ]
+        if prop.images:
+            keyboard.insert(0, [InlineKeyboardButton(f"📷 Foto ({len(prop.images)})", callback_data=f"gallery_{prop_id}")])
         
         # Add external link buttons if exist
         link_buttons = []
@@ -840,40 +1082,63 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup, disable_web_page_preview=True)
 
+    # 1b. Photo gallery (albums of up to 10, primary photo first)
+    elif data.startswith("gallery_"):
+        prop_id = int(data.split("_")[1])
+        images = await get_property_images(prop_id, user.id)
+        
+        if not images:
+            await query.message.reply_text("📷 Belum ada foto untuk properti ini.")
+            return
+        
+        for start in range(0, len(images), MEDIA_GROUP_SIZE):
+            await query.message.reply_media_group([
+                InputMediaPhoto(image.file_id, caption=image.caption or None)
+                for image in images[start:start + MEDIA_GROUP_SIZE]
+            ])
+
     # 2. Pagination
     elif data.startswith("page_"):
-        _, mode, page_num = data.split("_")
-        page = int(page_num)
+        mode, page, cursor = parse_page_callback(data)
+        if cursor is None and mode not in ("search", "search_adv"):
+            # Old button without a keyset cursor: start over at the first page
+            page = 1
         
-        if mode == "search":
-            keyword = context.user_data.get('search_keyword', "")
-            result = search_properties(user.id, keyword, page=page, limit=5)
-        elif mode == "search_adv":
-            filters = context.user_data.get('search_filters', {})
-            result = search_properties_advanced(user.id, filters, page=page, limit=5)
+        if mode in ("search", "search_adv"):
+            # Search pages carry the session token: s<token>
+            session = search_sessions.get(cursor[1:], user.id) if cursor and cursor.startswith("s") else None
+            if session is None:
+                # Session expired: run the search again from the stored query
+                if mode == "search_adv":
+                    session_query = context.user_data.get('search_filters', {})
+                else:
+                    session_query = context.user_data.get('search_keyword', "")
+                session = await open_search_session(user.id, mode, session_query)
+            result = await search_session_page(user.id, session, page)
         elif mode == "filter":
             city = context.user_data.get('filter_city')
             district = context.user_data.get('filter_district')
             min_price = context.user_data.get('filter_min_price')
             max_price = context.user_data.get('filter_max_price')
-            result = get_properties_by_location(
+            result = await get_properties_by_location(
                 user.id, 
                 city=city, 
                 district=district,
                 min_price=min_price,
                 max_price=max_price,
                 page=page, 
-                limit=5
+                limit=PAGE_SIZE,
+                cursor=cursor
             )
         else:
-            result = get_user_properties(user.id, page=page, limit=5)
+            result = await get_user_properties(user.id, page=page, limit=PAGE_SIZE, cursor=cursor)
             
         await send_property_list(update, context, result, mode)
 
     # 3. Back to list
     elif data == "back_to_list":
         # Default back to page 1 list
-        result = get_user_properties(user.id, page=1, limit=5)
+        result = await get_user_properties(user.id, page=1, limit=PAGE_SIZE)
         await send_property_list(update, context, result, "list")
 
     # 4. Delete Confirmation
@@ -896,12 +1161,18 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     elif data.startswith("delete_"):
         prop_id = int(data.split("_")[1])
         
-        success = delete_property(prop_id, telegram_id)
+        try:
+            success = await delete_property(prop_id, user.id)
+            await commit()
+        except Exception as e:
+            logger.error(f"Error deleting property: {e}")
+            await query.edit_message_text("❌ Gagal menghapus properti. Silakan coba lagi.")
+            return
         
         if success:
             await query.answer("✅ Properti berhasil dihapus!")
             # Back to list
-            result = get_user_properties(user.id, page=1, limit=5)
+            result = await get_user_properties(user.id, page=1, limit=PAGE_SIZE)
             await send_property_list(update, context, result, "list")
         else:
             await query.edit_message_text("❌ Gagal menghapus properti. Pastikan Anda pemiliknya.")
@@ -912,14 +1183,14 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def start_location_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start location filter - show cities"""
-    user = get_or_create_user(
+    user = await get_or_create_user(
         telegram_id=update.effective_user.id,
         username=update.effective_user.username,
         first_name=update.effective_user.first_name,
         last_name=update.effective_user.last_name
     )
     
-    cities = get_unique_cities(user.id)
+    cities = await get_unique_cities(user.id)
     
     if not cities:
         await update.message.reply_text(
@@ -951,18 +1222,18 @@ async def handle_filter_city_selection(update: Update, context: ContextTypes.DEF
     city = query.data.replace("filter_city_", "")
     context.user_data['filter_city'] = city
     
-    user = get_or_create_user(
+    user = await get_or_create_user(
         telegram_id=query.from_user.id,
         username=query.from_user.username,
         first_name=query.from_user.first_name,
         last_name=query.from_user.last_name
     )
     
-    districts = get_unique_districts(user.id, city)
+    districts = await get_unique_districts(user.id, city)
     
     if not districts:
         # No districts, show all properties in city
-        result = get_properties_by_location(user.id, city=city, page=1, limit=5)
+        result = await get_properties_by_location(user.id, city=city, page=1, limit=PAGE_SIZE)
         context.user_data['filter_mode'] = 'city'
         
         await query.delete_message()
@@ -1022,7 +1293,7 @@ async def handle_filter_price_selection(update: Update, context: ContextTypes.DE
     city = context.user_data.get('filter_city')
     district = context.user_data.get('filter_district')
     
-    user = get_or_create_user(
+    user = await get_or_create_user(
         telegram_id=query.from_user.id,
         username=query.from_user.username,
         first_name=query.from_user.first_name,
@@ -1038,14 +1309,14 @@ async def handle_filter_price_selection(update: Update, context: ContextTypes.DE
         min_price, max_price = map(int, price_range.split("-"))
     
     # Get filtered properties
-    result = get_properties_by_location(
+    result = await get_properties_by_location(
         user.id, 
         city=city, 
         district=district,
         min_price=min_price,
         max_price=max_price,
         page=1, 
-        limit=5
+        limit=PAGE_SIZE
     )
     
     # Store filter for pagination
@@ -1081,9 +1352,9 @@ async def cancel_location_filter(update: Update, context: ContextTypes.DEFAULT_T
 
 async def send_property_list_from_query(query, context, result, mode):
     """Helper to send property list after callback query (for filter results)"""
+    remember_total(context, mode, result)
     items = result['items']
     page = result['current_page']
-    total_pages = result['total_pages']
     total_items = result['total_items']
     
     # Get filter info for header
@@ -1092,7 +1363,10 @@ async def send_property_list_from_query(query, context, result, mode):
     filter_location = f"{city}, {district}" if district else city
     
     title = f"🔍 *Hasil Filter: {filter_location}*"
-    message = f"{title}\nTotal: {total_items} properti (Halaman {page}/{total_pages})\n\n"
+    message = f"{title} ({page_label(result)})\n"
+    if total_items is not None:
+        message += f"Total: {total_items} properti\n"
+    message += "\n"
     
     keyboard = []
     row_buttons = []
@@ -1142,11 +1416,7 @@ async def send_property_list_from_query(query, context, result, mode):
         keyboard.append(row_buttons)
         
     # Pagination buttons
-    nav_buttons = []
-    if page > 1:
-        nav_buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"page_{mode}_{page-1}"))
-    if page < total_pages:
-        nav_buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"page_{mode}_{page+1}"))
+    nav_buttons = pagination_buttons(mode, result)
         
     if nav_buttons:
         keyboard.append(nav_buttons)
@@ -1159,13 +1429,13 @@ async def send_property_list_from_query(query, context, result, mode):
 
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Show property statistics"""
-    user = get_or_create_user(
+    user = await get_or_create_user(
         telegram_id=update.effective_user.id,
         username=update.effective_user.username,
         first_name=update.effective_user.first_name
     )
     
-    stats = get_property_stats(user.id)
+    stats = await get_property_stats(user.id)
     
     message = "📊 *Statistik Properti Anda*\n\n"
     message += f"📝 Total Properti: *{stats['total']}*\n"
@@ -1241,6 +1511,20 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
 
 
+async def start_database_tasks(application: Application) -> None:
+    """Start the background writer for buffered last_active touches"""
+    application.bot_data['activity_flusher'] = asyncio.create_task(run_user_activity_flusher())
+
+
+async def shutdown_database(application: Application) -> None:
+    """Write pending last_active touches and close the async database pool when the bot stops"""
+    flusher = application.bot_data.pop('activity_flusher', None)
+    if flusher:
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+    await dispose_engine()
+
+
 def main():
     """Start the bot"""
     # Get bot token
@@ -1254,7 +1538,15 @@ def main():
     init_db()
     
     # Create application
-    application = Application.builder().token(token).build()
+    # AI and database calls are awaited, so other users keep being served while one waits
+    application = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        .post_init(start_database_tasks)
+        .post_shutdown(shutdown_database)
+        .build()
+    )
     
     # Add conversation handler for adding properties
     conv_handler = ConversationHandler(
@@ -0,0 +1,237 @@
+"""
+Content-addressed cache for AI extraction results
+
+Two tiers: an in-process LRU and a persistent table (see database.ExtractionCacheEntry).
+Identical concurrent requests share one in-flight computation.
+"""
+
+import os
+import copy
+import asyncio
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from database import get_cached_extraction, save_cached_extraction, purge_expired_extractions
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+CACHE_MAX_ENTRIES = int(os.getenv('EXTRACTION_CACHE_SIZE', '1024'))
+CACHE_TTL_SECONDS = int(os.getenv('EXTRACTION_CACHE_TTL', str(30 * 24 * 3600)))
+CACHE_PERSISTENT = os.getenv('EXTRACTION_CACHE_PERSISTENT', 'true').lower() == 'true'
+PURGE_EVERY_N_WRITES = 200
+
+# Characters stripped during normalization: bullets plus emoji/symbols and invisible format chars
+_BULLET_CHARS = set('•·◦‣⁃∙●○▪▫■□►▸*')
+_SYMBOL_CATEGORIES = {'So', 'Sk', 'Cf', 'Co', 'Cs'}
+
+
+def normalize_listing_text(text: str) -> str:
+    """
+    Normalize listing text so trivially different forwards share one cache key
+    (unicode form, emoji/bullets, case and whitespace are folded)
+    """
+    text = unicodedata.normalize('NFKC', text or '')
+    chars = []
+    for ch in text:
+        if ch in _BULLET_CHARS or unicodedata.category(ch) in _SYMBOL_CATEGORIES:
+            chars.append(' ')
+        else:
+            chars.append(ch)
+    return ' '.join(''.join(chars).casefold().split())
+
+
+def make_cache_key(text: str, version: str) -> str:
+    """Build the content-addressed key for a listing under a prompt/model version"""
+    normalized = normalize_listing_text(text)
+    return hashlib.sha256(f"{version}\x00{normalized}".encode('utf-8')).hexdigest()
+
+
+class ExtractionCache:
+    """LRU + persistent cache with single-flight computation"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 persistent: bool = CACHE_PERSISTENT):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persistent = persistent
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._async_inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {
+            'memory_hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'shared_inflight': 0,
+        }
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        """Put value in the LRU tier (caller holds the lock)"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        """LRU tier lookup"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                return None
+            self._entries.move_to_end(key)
+            self._stats['memory_hits'] += 1
+            return copy.deepcopy(value)
+
+    def _get_persistent(self, key: str) -> Optional[Dict[str, Any]]:
+        """Persistent tier lookup, promotes hits into the LRU"""
+        if not self.persistent:
+            return None
+        try:
+            value = get_cached_extraction(key)
+        except Exception as e:
+            logger.warning(f"Persistent extraction cache unavailable: {e}")
+            return None
+        if value is None:
+            return None
+        with self._lock:
+            self._remember(key, value)
+            self._stats['persistent_hits'] += 1
+        return copy.deepcopy(value)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a key in the LRU tier, then the persistent tier"""
+        value = self._get_memory(key)
+        if value is None:
+            value = self._get_persistent(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store value in both tiers"""
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._remember(key, value)
+            self._writes += 1
+            purge = self._writes % PURGE_EVERY_N_WRITES == 0
+
+        if self.persistent:
+            try:
+                save_cached_extraction(key, value, self.ttl_seconds)
+                if purge:
+                    purge_expired_extractions()
+            except Exception as e:
+                logger.warning(f"Could not persist extraction cache entry: {e}")
+
+    def get_or_compute(self, key: str, compute: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached value for key, or run compute() once and cache a non-empty result.
+        Concurrent callers with the same key wait for the first caller's result.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                # A computation may have finished (and left _inflight) since the lookup above
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return copy.deepcopy(value)
+                future = Future()
+                self._inflight[key] = future
+                self._stats['misses'] += 1
+            else:
+                self._stats['shared_inflight'] += 1
+
+        if not owner:
+            result = future.result()
+            return copy.deepcopy(result) if result is not None else None
+
+        try:
+            result = compute()
+            if result:
+                self.set(key, result)
+            future.set_result(result or None)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        return copy.deepcopy(result) if result else result
+
+    async def aget_or_compute(self, key: str,
+                              compute: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        """
+        Async variant of get_or_compute; compute is a coroutine function.
+        Database access for the persistent tier runs in a worker thread.
+        """
+        cached = self._get_memory(key)
+        if cached is None:
+            cached = await asyncio.to_thread(self._get_persistent, key)
+        if cached is not None:
+            return cached
+
+        future = self._async_inflight.get(key)
+        if future is not None:
+            with self._lock:
+                self._stats['shared_inflight'] += 1
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The owning call was cancelled, compute it ourselves
+                return await self.aget_or_compute(key, compute)
+            return copy.deepcopy(result) if result is not None else None
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[key] = future
+
+        try:
+            # A computation may have finished (and left _async_inflight) during the persistent lookup
+            result = self._get_memory(key)
+            if result is None:
+                with self._lock:
+                    self._stats['misses'] += 1
+                result = await compute()
+                if result:
+                    await asyncio.to_thread(self.set, key, result)
+            future.set_result(result or None)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unwaited failure does not log "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._async_inflight.pop(key, None)
+
+        return copy.deepcopy(result) if result else result
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current LRU size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_size'] = len(self._entries)
+        lookups = stats['memory_hits'] + stats['persistent_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """Drop the in-process tier (persistent rows expire by TTL)"""
+        with self._lock:
+            self._entries.clear()
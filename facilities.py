@@ -0,0 +1,83 @@
+"""
+Canonical facility vocabulary
+
+Listings arrive with facilities like "AC", "ac", "Kolam Renang Pribadi" or
+"swimming pool". They are normalized here on every write so the JSONB
+facilities column holds one spelling per facility, and a must-have filter is a
+single GIN-indexed containment (facilities @> '["ac", "kolam renang"]').
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+# Canonical name -> other ways listings and queries say it
+FACILITY_VOCABULARY = {
+    'ac': ['air conditioner', 'pendingin ruangan'],
+    'kolam renang': ['swimming pool', 'pool', 'private pool'],
+    'taman': ['garden'],
+    'playground': ['taman bermain', 'area bermain'],
+    'garasi': ['garage'],
+    'carport': ['car port'],
+    'cctv': [],
+    'wifi': ['wi fi', 'internet'],
+    'water heater': ['pemanas air'],
+    'one gate': ['one gate system', 'satu gerbang'],
+    'security': ['keamanan', 'satpam', 'security 24 jam'],
+    'lift': ['elevator'],
+    'mushola': ['musholla', 'musala', 'musholah'],
+    'gym': ['fitness', 'fitness center'],
+    'rooftop': ['roof top'],
+    'balkon': ['balcony'],
+    'furnished': ['full furnished', 'fully furnished'],
+    'dapur': ['kitchen'],
+    'kitchen set': [],
+    'clubhouse': ['club house'],
+    'gudang': ['storage'],
+    'jogging track': [],
+}
+
+
+def facility_key(text: str) -> str:
+    """Lookup form of a facility ('Wi-Fi' -> 'wi fi')"""
+    return ' '.join(re.sub(r'[^\w]+', ' ', (text or '').lower()).split())
+
+
+# Every alias (and canonical name) -> canonical name, in lookup form
+FACILITY_ALIASES: Dict[str, str] = {}
+for _canonical, _aliases in FACILITY_VOCABULARY.items():
+    for _alias in [_canonical, *_aliases]:
+        FACILITY_ALIASES[facility_key(_alias)] = _canonical
+_MAX_ALIAS_WORDS = max(len(alias.split()) for alias in FACILITY_ALIASES)
+
+
+def normalize_facility(text: str) -> Optional[str]:
+    """
+    Canonical name of a facility: the alias itself, else the longest alias inside it
+    ("Kolam Renang Pribadi" -> "kolam renang"), else the cleaned text
+    """
+    key = facility_key(text)
+    if not key:
+        return None
+    if key in FACILITY_ALIASES:
+        return FACILITY_ALIASES[key]
+    words = key.split()
+    for size in range(min(_MAX_ALIAS_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            canonical = FACILITY_ALIASES.get(' '.join(words[start:start + size]))
+            if canonical:
+                return canonical
+    return key
+
+
+def normalize_facilities(facilities: Optional[Iterable[str]]) -> Optional[List[str]]:
+    """Canonical, de-duplicated facility list in the original order (None stays None)"""
+    if facilities is None:
+        return None
+    if isinstance(facilities, str):
+        facilities = facilities.split(',')
+    normalized = []
+    for facility in facilities:
+        canonical = normalize_facility(facility) if isinstance(facility, str) else None
+        if canonical and canonical not in normalized:
+            normalized.append(canonical)
+    return normalized
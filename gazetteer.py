@@ -0,0 +1,174 @@
+"""
+Offline gazetteer of Indonesian provinces, cities and districts
+
+Listing locations are resolved here at write time so properties carry integer
+province_id / city_id / district_id and canonical names: "Jaksel", "jakarta
+selatan" and "JAKARTA SELATAN" all become Jakarta Selatan (3171), and location
+filters compare indexed integers instead of free text.
+
+Data lives in gazetteer.json. Province and city ids follow the Kemendagri
+administrative codes (35 Jawa Timur, 3578 Surabaya); district ids are the city
+code * 100 + a running number and, like all ids, must never be renumbered once
+stored. Places that are not in the file keep their free text and are matched
+by text as before.
+"""
+
+import os
+import re
+import json
+import logging
+from difflib import get_close_matches
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Gazetteer configuration (relative paths are taken from this directory)
+GAZETTEER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv('GAZETTEER_FILE', 'gazetteer.json'))
+GAZETTEER_FUZZY_CUTOFF = float(os.getenv('GAZETTEER_FUZZY_CUTOFF', '0.85'))
+
+PROVINCE, CITY, DISTRICT = 'province', 'city', 'district'
+
+# Administrative prefixes that do not distinguish places ("Kota Surabaya" == "Surabaya");
+# "Kabupaten" does (Kabupaten Malang != Malang) so it is only normalized
+_DROP_PREFIXES = ('kota ', 'kotamadya ', 'kecamatan ', 'kec ', 'provinsi ', 'prov ')
+_KABUPATEN_PREFIXES = ('kab ', 'kabupaten ')
+
+
+class Location(NamedTuple):
+    """One place of the gazetteer"""
+    id: int
+    level: str
+    name: str
+    parent_id: Optional[int]
+
+
+class ResolvedLocation(NamedTuple):
+    """Canonical ids and names of a listing location (None where unresolved)"""
+    province_id: Optional[int]
+    city_id: Optional[int]
+    district_id: Optional[int]
+    province: Optional[str]
+    city: Optional[str]
+    district: Optional[str]
+
+
+def normalize_key(text: str) -> str:
+    """Lookup key of a place name ('Kab. Malang' -> 'kabupaten malang', 'KOTA Surabaya' -> 'surabaya')"""
+    key = ' '.join(re.sub(r'[^\w\s]', ' ', (text or '').lower()).split())
+    for prefix in _KABUPATEN_PREFIXES:
+        if key.startswith(prefix):
+            return 'kabupaten ' + key[len(prefix):]
+    for prefix in _DROP_PREFIXES:
+        if key.startswith(prefix):
+            return key[len(prefix):]
+    return key
+
+
+class Gazetteer:
+    """Places by id plus an alias index per level, with a fuzzy fallback for typos"""
+
+    def __init__(self, data: Dict[str, list]):
+        self.by_id: Dict[int, Location] = {}
+        self._keys: Dict[str, Dict[str, List[int]]] = {PROVINCE: {}, CITY: {}, DISTRICT: {}}
+        for row in data.get('provinces', []):
+            self._add(Location(row[0], PROVINCE, row[1], None), row[2])
+        for row in data.get('cities', []):
+            self._add(Location(row[0], CITY, row[1], row[2]), row[3])
+        for row in data.get('districts', []):
+            self._add(Location(row[0], DISTRICT, row[1], row[2]), row[3])
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_FILE) -> 'Gazetteer':
+        try:
+            with open(path, encoding='utf-8') as f:
+                return cls(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load gazetteer {path}, locations stay free text: {e}")
+            return cls({})
+
+    def _add(self, location: Location, aliases: List[str]) -> None:
+        self.by_id[location.id] = location
+        index = self._keys[location.level]
+        for alias in [location.name, *aliases]:
+            ids = index.setdefault(normalize_key(alias), [])
+            if location.id not in ids:
+                ids.append(location.id)
+
+    def get(self, location_id: Optional[int]) -> Optional[Location]:
+        return self.by_id.get(location_id) if location_id is not None else None
+
+    def lookup(self, text: str, level: str, parent_id: Optional[int] = None, fuzzy: bool = True) -> Optional[Location]:
+        """
+        The place of level named text (optionally under parent_id), by name or alias,
+        else by the closest spelling. Names shared by several places resolve only
+        when the parent tells them apart.
+        """
+        key = normalize_key(text)
+        if not key:
+            return None
+        index = self._keys[level]
+        match = self._pick(index.get(key, []), parent_id)
+        if match is None and fuzzy:
+            for close in get_close_matches(key, index, n=3, cutoff=GAZETTEER_FUZZY_CUTOFF):
+                match = self._pick(index[close], parent_id)
+                if match is not None:
+                    break
+        return match
+
+    def _pick(self, ids: List[int], parent_id: Optional[int]) -> Optional[Location]:
+        candidates = [self.by_id[i] for i in ids if parent_id is None or self._within(i, parent_id)]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _within(self, location_id: int, ancestor_id: int) -> bool:
+        location = self.by_id.get(location_id)
+        while location is not None and location.parent_id is not None:
+            if location.parent_id == ancestor_id:
+                return True
+            location = self.by_id.get(location.parent_id)
+        return False
+
+    def find(self, text: str) -> Optional[Location]:
+        """A place of any level named text (search keywords): city, then province, then district"""
+        for level in (CITY, PROVINCE, DISTRICT):
+            location = self.lookup(text, level, fuzzy=False)
+            if location is not None:
+                return location
+        for level in (CITY, PROVINCE, DISTRICT):
+            location = self.lookup(text, level)
+            if location is not None:
+                return location
+        return None
+
+    def resolve(self, city: Optional[str], district: Optional[str] = None,
+                province: Optional[str] = None) -> ResolvedLocation:
+        """
+        Canonical location of a listing. The city may also name a province
+        ("Jakarta") or a district ("Waru"); the district then pins down the city.
+        """
+        city_loc = self.lookup(city, CITY) if city else None
+        province_loc = None
+        district_loc = None
+        if city and city_loc is None:
+            province_loc = self.lookup(city, PROVINCE)
+            if province_loc is None and not district:
+                district_loc = self.lookup(city, DISTRICT)
+        if district:
+            parent = city_loc or province_loc
+            district_loc = self.lookup(district, DISTRICT, parent.id if parent else None)
+        if district_loc is not None and city_loc is None:
+            city_loc = self.get(district_loc.parent_id)
+        if city_loc is not None:
+            province_loc = self.get(city_loc.parent_id)
+        elif province_loc is None and province:
+            province_loc = self.lookup(province, PROVINCE)
+        return ResolvedLocation(
+            province_loc.id if province_loc else None,
+            city_loc.id if city_loc else None,
+            district_loc.id if district_loc else None,
+            province_loc.name if province_loc else None,
+            city_loc.name if city_loc else None,
+            district_loc.name if district_loc else None,
+        )
+
+
+gazetteer = Gazetteer.load()
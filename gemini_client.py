@@ -0,0 +1,253 @@
+"""
+Pluggable Gemini client layer
+
+ai_processor talks to whatever client this module provides:
+- live: google-genai Client (needs GEMINI_API_KEY and network)
+- record: live client that also appends every request/response pair to a JSONL file
+- replay: offline stand-in answering from a recording or a responder function, with
+  configurable latency and injected faults (429s, timeouts, malformed JSON)
+
+Only the surface ai_processor uses is implemented: models.generate_content,
+models.count_tokens, caches.create and their aio counterparts.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+from google import genai
+from google.genai import errors
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CLIENT_MODE = os.getenv('GEMINI_CLIENT_MODE', 'live')  # live | record | replay
+GEMINI_RECORDING_FILE = os.getenv('GEMINI_RECORDING_FILE', 'gemini_recording.jsonl')
+
+USAGE_FIELDS = ('prompt_token_count', 'candidates_token_count', 'cached_content_token_count', 'total_token_count')
+
+
+def request_key(model: str, contents: Any) -> str:
+    """Lookup key of a recorded request (the static prompt prefix is not part of it)"""
+    if not isinstance(contents, str):
+        contents = json.dumps(contents, sort_keys=True, default=str)
+    return hashlib.sha256(f"{model}\x00{contents}".encode('utf-8')).hexdigest()
+
+
+def _usage_dict(usage_metadata: Any) -> Dict[str, Optional[int]]:
+    return {field: getattr(usage_metadata, field, None) for field in USAGE_FIELDS}
+
+
+def _fake_response(text: str, usage: Optional[Dict[str, Optional[int]]] = None) -> SimpleNamespace:
+    """Object with the attributes ai_processor reads from a GenerateContentResponse"""
+    return SimpleNamespace(text=text, usage_metadata=SimpleNamespace(**{
+        field: (usage or {}).get(field) for field in USAGE_FIELDS
+    }))
+
+
+# Recorder
+
+class RecordingClient:
+    """Wraps a live client and appends each generate_content exchange to a JSONL file"""
+
+    def __init__(self, inner: Any, path: str = GEMINI_RECORDING_FILE):
+        self._inner = inner
+        self._path = path
+        self._lock = threading.Lock()
+        self.models = SimpleNamespace(generate_content=self._generate, count_tokens=inner.models.count_tokens)
+        self.caches = inner.caches
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(generate_content=self._agenerate, count_tokens=inner.aio.models.count_tokens),
+            caches=inner.aio.caches,
+        )
+
+    def _write(self, model: str, contents: Any, response: Any = None, error: Optional[BaseException] = None) -> None:
+        record = {
+            'key': request_key(model, contents),
+            'model': model,
+            'contents': contents if isinstance(contents, str) else json.dumps(contents, default=str),
+        }
+        if error is not None:
+            record['error'] = repr(error)
+        else:
+            record['text'] = response.text
+            record['usage'] = _usage_dict(response.usage_metadata)
+        with self._lock, open(self._path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _generate(self, model: str, contents: Any, config: Any = None):
+        try:
+            response = self._inner.models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            self._write(model, contents, error=e)
+            raise
+        self._write(model, contents, response)
+        return response
+
+    async def _agenerate(self, model: str, contents: Any, config: Any = None):
+        try:
+            response = await self._inner.aio.models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            self._write(model, contents, error=e)
+            raise
+        self._write(model, contents, response)
+        return response
+
+
+# Replay
+
+class ReplayMissError(KeyError):
+    """Raised when a replayed request has no recording and no responder"""
+
+
+class ReplayClient:
+    """
+    Offline stand-in for the Gemini client.
+
+    Answers come from recorded exchanges (matched by model + contents) or from
+    responder(model, contents) -> text. Latency and faults are drawn per call:
+    latency seconds +- jitter, then a 429, a timeout or a truncated/garbled answer
+    with the configured probabilities.
+    """
+
+    def __init__(self, records: Optional[Dict[str, Dict[str, Any]]] = None,
+                 responder: Optional[Callable[[str, Any], str]] = None,
+                 latency: float = 0.0, jitter: float = 0.0,
+                 rate_429: float = 0.0, rate_timeout: float = 0.0, rate_malformed: float = 0.0,
+                 retry_delay: float = 1.0, timeout_after: float = 30.0, seed: Optional[int] = None):
+        self.records = records or {}
+        self.responder = responder
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.rate_timeout = rate_timeout
+        self.rate_malformed = rate_malformed
+        self.retry_delay = retry_delay
+        self.timeout_after = timeout_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.injected = {'429': 0, 'timeout': 0, 'malformed': 0}
+
+        self.models = SimpleNamespace(generate_content=self._generate, count_tokens=self._count_tokens)
+        self.caches = SimpleNamespace(create=self._create_cache)
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(generate_content=self._agenerate, count_tokens=self._acount_tokens),
+            caches=SimpleNamespace(create=self._acreate_cache),
+        )
+
+    @classmethod
+    def from_file(cls, path: str = GEMINI_RECORDING_FILE, **kwargs) -> 'ReplayClient':
+        """Load a recording written by RecordingClient (failed exchanges are skipped)"""
+        records = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if 'text' in record:
+                        records[record['key']] = record
+        logger.info(f"Loaded {len(records)} recorded Gemini exchanges from {path}")
+        return cls(records=records, **kwargs)
+
+    # Fault model
+
+    def _draw(self) -> tuple:
+        """Latency and fault for one call"""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            roll = self._random.random()
+            if roll < self.rate_429:
+                fault = '429'
+            elif roll < self.rate_429 + self.rate_timeout:
+                fault = 'timeout'
+            elif roll < self.rate_429 + self.rate_timeout + self.rate_malformed:
+                fault = 'malformed'
+            else:
+                fault = None
+            if fault:
+                self.injected[fault] += 1
+            cut = self._random.random()
+        return delay, fault, cut
+
+    def _quota_error(self) -> errors.ClientError:
+        return errors.ClientError(429, {'error': {
+            'code': 429,
+            'status': 'RESOURCE_EXHAUSTED',
+            'message': 'Injected quota error (replay)',
+            'details': [{'@type': 'type.googleapis.com/google.rpc.RetryInfo',
+                         'retryDelay': f"{self.retry_delay:g}s"}],
+        }})
+
+    def _answer(self, model: str, contents: Any, fault: Optional[str], cut: float) -> SimpleNamespace:
+        record = self.records.get(request_key(model, contents))
+        if record is not None:
+            text, usage = record['text'], record.get('usage')
+        elif self.responder is not None:
+            text = self.responder(model, contents)
+            usage = {'prompt_token_count': len(str(contents)) // 4, 'candidates_token_count': len(text) // 4}
+        else:
+            raise ReplayMissError(f"No recording for request {request_key(model, contents)[:12]}")
+        if fault == 'malformed':
+            # Truncated answer, or prose around it, or garbage
+            if cut < 0.5:
+                text = text[:max(1, int(len(text) * cut * 2))]
+            elif cut < 0.8:
+                text = f"Berikut hasilnya:\n```json\n{text}\n```"
+            else:
+                text = "maaf, saya tidak bisa"
+        return _fake_response(text, usage)
+
+    # Client surface
+
+    def _generate(self, model: str, contents: Any, config: Any = None):
+        delay, fault, cut = self._draw()
+        if fault == 'timeout':
+            time.sleep(delay)
+            raise TimeoutError("Injected timeout (replay)")
+        time.sleep(delay)
+        if fault == '429':
+            raise self._quota_error()
+        return self._answer(model, contents, fault, cut)
+
+    async def _agenerate(self, model: str, contents: Any, config: Any = None):
+        delay, fault, cut = self._draw()
+        if fault == 'timeout':
+            # Hangs until the caller's timeout fires, like a stuck request
+            await asyncio.sleep(self.timeout_after)
+            raise asyncio.TimeoutError("Injected timeout (replay)")
+        await asyncio.sleep(delay)
+        if fault == '429':
+            raise self._quota_error()
+        return self._answer(model, contents, fault, cut)
+
+    def _count_tokens(self, model: str, contents: Any, config: Any = None):
+        return SimpleNamespace(total_tokens=max(len(str(contents)) // 4, 1))
+
+    async def _acount_tokens(self, model: str, contents: Any, config: Any = None):
+        return self._count_tokens(model, contents, config)
+
+    def _create_cache(self, model: str, config: Any = None):
+        raise errors.ClientError(400, {'error': {'code': 400, 'message': 'Cached content not available in replay'}})
+
+    async def _acreate_cache(self, model: str, config: Any = None):
+        return self._create_cache(model, config)
+
+
+def create_client(api_key: Optional[str], mode: str = GEMINI_CLIENT_MODE, path: str = GEMINI_RECORDING_FILE) -> Any:
+    """Client for the configured mode; live and record modes need an API key"""
+    if mode == 'replay':
+        return ReplayClient.from_file(path)
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY is required")
+    live = genai.Client(api_key=api_key)
+    if mode == 'record':
+        logger.info(f"Recording Gemini exchanges to {path}")
+        return RecordingClient(live, path)
+    return live
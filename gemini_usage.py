@@ -0,0 +1,110 @@
+"""
+Token, latency and cost accounting for Gemini calls
+
+Every ai_processor call records the usage metadata Gemini returns, grouped by the
+calling function, so cost and latency per listing can be read off at runtime.
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+# USD per 1M tokens (defaults: Gemini Flash paid tier, adjust to the configured model)
+PRICE_INPUT_PER_M = float(os.getenv('GEMINI_PRICE_INPUT_PER_M', '0.30'))
+PRICE_OUTPUT_PER_M = float(os.getenv('GEMINI_PRICE_OUTPUT_PER_M', '2.50'))
+PRICE_CACHED_PER_M = float(os.getenv('GEMINI_PRICE_CACHED_PER_M', '0.075'))
+
+LATENCY_SAMPLES = 1000  # Latencies kept per function for percentiles
+
+
+def _percentile(samples, fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty sample list"""
+    ordered = sorted(samples)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class UsageTracker:
+    """Thread-safe per-function counters of calls, tokens and latency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._functions: Dict[str, Dict[str, Any]] = {}
+
+    def _entry(self, function: str) -> Dict[str, Any]:
+        entry = self._functions.get(function)
+        if entry is None:
+            entry = {
+                'calls': 0,
+                'errors': 0,
+                'items': 0,
+                'input_tokens': 0,
+                'output_tokens': 0,
+                'cached_tokens': 0,
+                'latency_total': 0.0,
+                'latencies': deque(maxlen=LATENCY_SAMPLES),
+            }
+            self._functions[function] = entry
+        return entry
+
+    def record(self, function: str, usage_metadata: Optional[Any], latency: float, items: int = 1) -> None:
+        """Record one successful call; items is the number of listings it covered"""
+        input_tokens = getattr(usage_metadata, 'prompt_token_count', None) or 0
+        output_tokens = getattr(usage_metadata, 'candidates_token_count', None) or 0
+        cached_tokens = getattr(usage_metadata, 'cached_content_token_count', None) or 0
+        with self._lock:
+            entry = self._entry(function)
+            entry['calls'] += 1
+            entry['items'] += items
+            entry['input_tokens'] += input_tokens
+            entry['output_tokens'] += output_tokens
+            entry['cached_tokens'] += cached_tokens
+            entry['latency_total'] += latency
+            entry['latencies'].append(latency)
+
+    def record_error(self, function: str) -> None:
+        """Count a failed call (quota, timeout, transport error)"""
+        with self._lock:
+            self._entry(function)['errors'] += 1
+
+    @staticmethod
+    def cost(input_tokens: int, output_tokens: int, cached_tokens: int) -> float:
+        """Estimated USD cost; cached prompt tokens are billed at the cached rate"""
+        uncached = max(input_tokens - cached_tokens, 0)
+        return (uncached * PRICE_INPUT_PER_M
+                + cached_tokens * PRICE_CACHED_PER_M
+                + output_tokens * PRICE_OUTPUT_PER_M) / 1_000_000
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-function totals plus per-listing cost and latency"""
+        result = {}
+        with self._lock:
+            for function, entry in self._functions.items():
+                items = entry['items'] or 1
+                cost = self.cost(entry['input_tokens'], entry['output_tokens'], entry['cached_tokens'])
+                latencies = list(entry['latencies'])
+                result[function] = {
+                    'calls': entry['calls'],
+                    'errors': entry['errors'],
+                    'items': entry['items'],
+                    'input_tokens': entry['input_tokens'],
+                    'output_tokens': entry['output_tokens'],
+                    'cached_tokens': entry['cached_tokens'],
+                    'cached_ratio': round(entry['cached_tokens'] / entry['input_tokens'], 3)
+                    if entry['input_tokens'] else 0.0,
+                    'cost_usd': round(cost, 6),
+                    'cost_per_item_usd': round(cost / items, 6),
+                    'latency_per_item_ms': round(entry['latency_total'] / items * 1000, 1),
+                    'latency_p50_ms': round(_percentile(latencies, 0.5) * 1000, 1) if latencies else 0.0,
+                    'latency_p99_ms': round(_percentile(latencies, 0.99) * 1000, 1) if latencies else 0.0,
+                }
+        return result
+
+    def reset(self) -> None:
+        """Drop all counters"""
+        with self._lock:
+            self._functions.clear()
+
+
+usage_tracker = UsageTracker()
@@ -0,0 +1,128 @@
+"""
+Tolerant JSON parser for model output
+
+Model answers can be cut off mid-object (max_output_tokens, timeouts, dropped streams).
+PartialJSONParser is fed text incrementally and can return the largest valid prefix at any
+point: open brackets are closed and a half-written trailing member is dropped (a cut-off
+number or string could be wrong by orders of magnitude, so partial scalars are never kept).
+"""
+
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {'{': '}', '[': ']'}
+_decoder = json.JSONDecoder()
+
+
+class PartialJSONParser:
+    """Incremental JSON reader that can snapshot a repaired value at any time"""
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._length = 0
+        self._started = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        # (offset, open brackets) where the buffer is a complete prefix once closed
+        self._cuts: List[Tuple[int, str]] = []
+        # False when the last snapshot had to drop or close anything
+        self.complete = False
+
+    def feed(self, chunk: Optional[str]) -> None:
+        """Consume the next piece of model output"""
+        if not chunk:
+            return
+        if not self._started:
+            # Skip prose or a ```json fence in front of the value
+            starts = [pos for pos in (chunk.find('{'), chunk.find('[')) if pos >= 0]
+            if not starts:
+                return
+            chunk = chunk[min(starts):]
+            self._started = True
+
+        for offset, ch in enumerate(chunk, self._length):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if not self._expect_key:
+                        # A finished string value is a complete member
+                        self._cuts.append((offset + 1, ''.join(self._stack)))
+            elif ch == '"':
+                self._in_string = True
+            elif ch == ':':
+                self._expect_key = False
+            elif ch in _CLOSERS:
+                self._stack.append(ch)
+                self._expect_key = ch == '{'
+                self._cuts.append((offset + 1, ''.join(self._stack)))
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+                self._expect_key = False
+                self._cuts.append((offset + 1, ''.join(self._stack)))
+            elif ch == ',':
+                # A structural comma always follows a complete member
+                self._cuts.append((offset, ''.join(self._stack)))
+                self._expect_key = bool(self._stack) and self._stack[-1] == '{'
+
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+
+    @property
+    def text(self) -> str:
+        """Everything consumed so far, starting at the first bracket"""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    @staticmethod
+    def _close(stack: str) -> str:
+        return ''.join(_CLOSERS[ch] for ch in reversed(stack))
+
+    @staticmethod
+    def _try(candidate: str) -> Tuple[bool, Any]:
+        try:
+            return True, json.loads(candidate)
+        except json.JSONDecodeError:
+            return False, None
+
+    def snapshot(self) -> Any:
+        """
+        Best-effort value for the text consumed so far.
+        Returns None if no bracket has been seen yet.
+        """
+        text = self.text
+        if not text:
+            return None
+
+        try:
+            # raw_decode ignores a closing ``` fence or chatter after the value
+            value, _ = _decoder.raw_decode(text)
+            self.complete = True
+            return value
+        except json.JSONDecodeError:
+            self.complete = False
+
+        # Close at the last member boundary, dropping the unfinished member
+        for offset, cut_stack in reversed(self._cuts):
+            ok, value = self._try(text[:offset] + self._close(cut_stack))
+            if ok:
+                logger.debug(f"Repaired truncated JSON, dropped {len(text) - offset} trailing chars")
+                return value
+        return None
+
+
+def repair_json(text: Optional[str]) -> Any:
+    """Parse a complete or truncated JSON answer, None if nothing is salvageable"""
+    parser = PartialJSONParser()
+    parser.feed(text)
+    return parser.snapshot()
@@ -0,0 +1,507 @@
+"""
+Deterministic pre-extractor for Indonesian property listings
+
+Encodes the rules of ai_processor.EXTRACTION_SYSTEM_PROMPT as a compiled tokenizer
+plus keyword rules. Every field gets a confidence score so the caller can decide
+whether the AI is needed at all (structured broker posts usually are not).
+"""
+
+import os
+import re
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Tuple
+
+# Minimum per-field confidence to trust the local result without calling the AI
+LOCAL_EXTRACTION_MIN_CONFIDENCE = float(os.getenv('LOCAL_EXTRACTION_MIN_CONFIDENCE', '0.8'))
+
+# Fields that must be confidently found before the AI can be skipped
+REQUIRED_FIELDS = ('property_type', 'transaction_type', 'price', 'city')
+SPEC_FIELDS = ('land_area', 'building_area', 'bedrooms', 'bathrooms')
+MIN_SPEC_FIELDS = 2
+
+Token = namedtuple('Token', ['kind', 'text', 'line', 'start'])
+
+_TOKEN_RE = re.compile(r"""
+    (?P<url>https?://[^\s<>()]+)
+  | (?P<dim>\d+(?:[.,]\d+)?\s*[x×]\s*\d+(?:[.,]\d+)?)
+  | (?P<num>\d+(?:[.,]\d+)*)
+  | (?P<unit>(?:m2|m²|meter2|meter|mtr)(?![^\W\d_]))
+  | (?P<word>[^\W\d_]+)
+  | (?P<plus>\+)
+  | (?P<arrow>>+|》|»|→)
+  | (?P<eq>=)
+""", re.VERBOSE | re.IGNORECASE)
+
+_GROUPED_THOUSANDS_RE = re.compile(r'\d{1,3}(?:[.,]\d{3})+')
+_PHONE_RE = re.compile(r'(?:\+62|62|0)8\d{1,3}[-\s]?\d{3,4}[-\s]?\d{3,5}')
+_LOCATION_LINE_RE = re.compile(r"^\s*([\w .,'/&()]+?)\s+-\s+([^\W\d_][\w .]*?)\s*$")
+_VIDEO_HOSTS = ('youtube.com', 'youtu.be', 'tiktok.com', 'instagram.com')
+
+PROPERTY_TYPES = {
+    'rumah': 'rumah', 'house': 'rumah',
+    'apartemen': 'apartemen', 'apartment': 'apartemen', 'apartement': 'apartemen',
+    'tanah': 'tanah', 'kavling': 'tanah', 'kaveling': 'tanah',
+    'ruko': 'ruko', 'rukan': 'ruko',
+    'villa': 'villa', 'vila': 'villa',
+    'gudang': 'gudang', 'warehouse': 'gudang',
+    'kantor': 'kantor', 'office': 'kantor',
+    'kost': 'kost', 'kos': 'kost', 'kosan': 'kost',
+}
+# A type word right after these is not the listing type ("luas tanah", "dekat kantor")
+TYPE_BLOCKERS = {'luas', 'hitung', 'harga', 'per', 'dekat', 'ke', 'depan', 'samping', 'belakang'}
+
+SALE_WORDS = {'jual', 'dijual', 'djual'}
+RENT_WORDS = {'sewa', 'disewa', 'disewakan', 'kontrak', 'dikontrakkan', 'dikontrakan'}
+
+PRICE_KEYWORDS = {'rp', 'harga', 'hrg', 'idr'}
+AREA_KEYWORDS = {'lt', 'lb', 'luas', 'dimensi', 'panjang', 'lebar', 'ukuran'}
+PRICE_MULTIPLIERS = {
+    'm': 1_000_000_000, 'miliar': 1_000_000_000, 'milyar': 1_000_000_000, 'milliar': 1_000_000_000,
+    'jt': 1_000_000, 'juta': 1_000_000, 'jta': 1_000_000,
+    'rb': 1_000, 'ribu': 1_000,
+}
+# Multipliers that can never mean meters
+UNAMBIGUOUS_MULTIPLIERS = set(PRICE_MULTIPLIERS) - {'m'}
+MIN_PLAUSIBLE_PRICE = 1_000_000
+
+HELPER_WORDS = {'pembantu', 'art', 'asisten'}
+# Words that claim the number in front of them ("3 kamar mandi", "2 lantai")
+COUNT_WORDS = {'kamar', 'kt', 'km', 'lantai', 'carport', 'garasi', 'garage'}
+# Lines at the top of a post that usually hold title, type and location
+HEADER_LINES = 5
+ORIENTATIONS = {'utara', 'selatan', 'timur', 'barat'}
+CERTIFICATES = {
+    'shm': 'SHM', 'shgb': 'SHGB', 'hgb': 'SHGB', 'ajb': 'AJB', 'girik': 'Girik',
+    'petok': 'Petok D', 'ppjb': 'PPJB', 'strata': 'Strata Title',
+}
+ELECTRICITY_UNITS = {'watt', 'va', 'v', 'w', 'kwh'}
+
+
+def _to_number(raw: str, scaled: bool) -> float:
+    """
+    Parse an Indonesian-formatted number.
+    With a unit multiplier ("1.3M", "2,1 M") a single separator is a decimal point;
+    otherwise "1.400.000.000" style grouping is removed.
+    """
+    if _GROUPED_THOUSANDS_RE.fullmatch(raw) and (not scaled or len(re.split('[.,]', raw)) > 2):
+        return float(re.sub('[.,]', '', raw))
+    return float(raw.replace(',', '.'))
+
+
+def _clean_text(text: str) -> str:
+    """Collapse whitespace and strip separators around a captured phrase"""
+    return ' '.join(text.split()).strip(' -:,')
+
+
+class _ListingRules:
+    """One pass of the keyword rules over a tokenized listing"""
+
+    def __init__(self, text: str):
+        self.lines = text.splitlines()
+        self.tokens: List[Token] = []
+        for line_no, line in enumerate(self.lines):
+            for match in _TOKEN_RE.finditer(line):
+                kind = match.lastgroup
+                value = match.group(kind)
+                self.tokens.append(Token(kind, value.lower() if kind in ('word', 'unit') else value, line_no, match.start()))
+        self.votes: Dict[str, List[Tuple[Any, float]]] = {}
+        self.prices: List[Tuple[float, float]] = []
+        self.consumed = set()
+        self.has_sale = False
+        self.has_rent = False
+        self.dual_keyword = False
+
+    # Token helpers
+    def tok(self, i: int) -> Optional[Token]:
+        return self.tokens[i] if 0 <= i < len(self.tokens) else None
+
+    def same_line(self, i: int, j: int) -> bool:
+        a, b = self.tok(i), self.tok(j)
+        return a is not None and b is not None and a.line == b.line
+
+    def word_at(self, i: int) -> Optional[str]:
+        t = self.tok(i)
+        return t.text if t is not None and t.kind == 'word' else None
+
+    def num_at(self, i: int, origin: int) -> Optional[float]:
+        t = self.tok(i)
+        if t is None or t.kind != 'num' or not self.same_line(i, origin):
+            return None
+        return _to_number(t.text, scaled=False)
+
+    def vote(self, field: str, value: Any, confidence: float) -> None:
+        self.votes.setdefault(field, []).append((value, confidence))
+
+    def line_has_area_context(self, i: int) -> bool:
+        """True when an area keyword, dimension or '=' precedes token i on its line"""
+        j = i - 1
+        while j >= 0 and self.same_line(i, j):
+            t = self.tokens[j]
+            if t.kind in ('dim', 'eq') or (t.kind == 'word' and t.text in AREA_KEYWORDS):
+                return True
+            j -= 1
+        return False
+
+    def claims_number_before(self, i: int) -> bool:
+        """True when word i takes the number in front of it ("3 kamar mandi", "2 lantai")"""
+        w = self.word_at(i)
+        if w in ('kt', 'km'):
+            # "KT 3 KM 2": km has its own number after it
+            return self.num_at(i + 1, i) is None
+        return w in COUNT_WORDS
+
+    # Field readers
+    def read_count(self, field: str, i: int, confidence: float) -> None:
+        """'KT 3+1' style: keyword then the first number (helper rooms ignored)"""
+        if self.word_at(i + 1) in HELPER_WORDS:
+            return
+        j = i + 1
+        if self.tok(j) is not None and self.tok(j).kind == 'eq':
+            j += 1
+        value = self.num_at(j, i)
+        if value is None or value >= 100 or self.claims_number_before(j + 1):
+            return
+        self.vote(field, int(value), confidence)
+        self.consumed.add(j)
+        # "3+1": the number after '+' is a helper room
+        if self.tok(j + 1) is not None and self.tok(j + 1).kind == 'plus' and self.num_at(j + 2, j) is not None:
+            self.consumed.update((j + 1, j + 2))
+
+    def read_area(self, field: str, i: int, confidence: float) -> None:
+        """'LT 180' / 'Luas Tanah 200 m2'"""
+        j = i + 1
+        if self.tok(j) is not None and self.tok(j).kind == 'eq':
+            j += 1
+        value = self.num_at(j, i)
+        if value is not None and 0 < value < 1_000_000:
+            self.vote(field, int(value), confidence)
+            self.consumed.add(j)
+
+    def read_price(self, i: int, confidence: float) -> Optional[int]:
+        """
+        Read a price starting at number token i, following discount chains
+        ("1.650M >> 1.350M >> 1.300") to their final value
+        """
+        multiplier = None
+        value = None
+        j = i
+        while True:
+            t = self.tok(j)
+            if t is None or t.kind != 'num':
+                break
+            unit = self.word_at(j + 1)
+            if unit in PRICE_MULTIPLIERS and self.same_line(j, j + 1):
+                multiplier = PRICE_MULTIPLIERS[unit]
+                self.consumed.add(j + 1)
+                nxt = j + 2
+            else:
+                nxt = j + 1
+            number = _to_number(t.text, scaled=multiplier is not None)
+            value = number * multiplier if multiplier else number
+            self.consumed.add(j)
+            arrow = self.tok(nxt)
+            if arrow is not None and arrow.kind == 'arrow' and self.tok(nxt + 1) is not None \
+                    and self.tok(nxt + 1).kind == 'num':
+                j = nxt + 1
+                continue
+            break
+        if value is None or value < MIN_PLAUSIBLE_PRICE:
+            return None
+        self.prices.append((int(value), confidence))
+        return int(value)
+
+    def rest_of_line(self, i: int) -> str:
+        """Raw text after token i on the same line"""
+        t = self.tokens[i]
+        line = self.lines[t.line]
+        return _clean_text(line[t.start + len(t.text):])
+
+    # Main pass
+    def run(self) -> None:
+        for i, t in enumerate(self.tokens):
+            if i in self.consumed:
+                continue
+            if t.kind == 'word':
+                self.on_word(i, t.text)
+            elif t.kind == 'num':
+                self.on_number(i, t)
+            elif t.kind == 'dim':
+                a, b = re.split(r'\s*[x×]\s*', t.text, flags=re.IGNORECASE)
+                confidence = 0.95 if self.word_at(i - 1) in ('dimensi', 'ukuran', 'luas') else 0.8
+                self.vote('dimensions', f"{a} x {b}", confidence)
+                self.vote('_dimension_area', int(_to_number(a, True) * _to_number(b, True)), confidence)
+
+    def on_word(self, i: int, w: str) -> None:
+        prev = self.word_at(i - 1) if self.same_line(i, i - 1) else None
+        nxt = self.word_at(i + 1) if self.same_line(i, i + 1) else None
+
+        if w in PROPERTY_TYPES and prev not in TYPE_BLOCKERS:
+            # "Jual Rumah" / "Rumah Dijual" is the strongest signal, body mentions the weakest
+            if prev in SALE_WORDS | RENT_WORDS | {'jualsewa'} or nxt in SALE_WORDS | RENT_WORDS:
+                confidence = 0.95
+            elif self.tokens[i].line < HEADER_LINES:
+                confidence = 0.9
+            else:
+                confidence = 0.6
+            self.vote('property_type', PROPERTY_TYPES[w], confidence)
+
+        if w == 'jualsewa':
+            self.dual_keyword = True
+        elif w in SALE_WORDS:
+            self.has_sale = True
+        elif w in RENT_WORDS and prev not in ('harga', 'hrg'):
+            self.has_rent = True
+
+        if w == 'kt':
+            self.read_count('bedrooms', i, 0.95)
+        elif w == 'km' and nxt is None:
+            self.read_count('bathrooms', i, 0.95)
+        elif w == 'kamar' and nxt == 'tidur':
+            self.read_count('bedrooms', i + 1, 0.95)
+        elif w == 'kamar' and nxt == 'mandi':
+            self.read_count('bathrooms', i + 1, 0.95)
+        elif w == 'lt':
+            self.read_area('land_area', i, 0.95)
+        elif w == 'lb':
+            self.read_area('building_area', i, 0.95)
+        elif w == 'luas' and nxt == 'tanah':
+            self.read_area('land_area', i + 1, 0.9)
+        elif w == 'luas' and nxt == 'bangunan':
+            self.read_area('building_area', i + 1, 0.9)
+        elif w == 'luas':
+            # "LUAS 10X20 = 200M" -> land area after the dimension
+            j = i + 1
+            if self.tok(j) is not None and self.tok(j).kind == 'dim':
+                j += 1
+                if self.tok(j) is not None and self.tok(j).kind == 'eq':
+                    self.read_area('land_area', j - 1, 0.85)
+            else:
+                self.read_area('land_area', i, 0.8)
+        elif w in ('listrik', 'pln', 'daya'):
+            value = self.num_at(i + 1, i)
+            if value is not None and 450 <= value <= 200_000:
+                self.vote('electricity', int(value), 0.95)
+                self.consumed.add(i + 1)
+        elif w == 'hadap' and nxt in ORIENTATIONS:
+            orientation = nxt.capitalize()
+            after = self.word_at(i + 2) if self.same_line(i, i + 2) else None
+            if after in ('laut', 'daya'):
+                orientation += f" {after.capitalize()}"
+            self.vote('orientation', orientation, 0.95)
+        elif w in CERTIFICATES:
+            self.vote('certificate_type', CERTIFICATES[w], 0.95)
+        elif w == 'pdam':
+            self.vote('water_type', 'PDAM', 0.9)
+        elif w == 'sumur' and (prev in (None, 'air') or nxt == 'bor'):
+            self.vote('water_type', 'Sumur', 0.85)
+        elif w in ('nego', 'negotiable'):
+            self.vote('negotiable', True, 0.9)
+        elif w == 'kpr':
+            self.vote('kpr', True, 0.85)
+        elif w in ('imb', 'pbg'):
+            self.vote('imb', True, 0.9)
+        elif w == 'carport':
+            value = self.num_at(i + 1, i)
+            if value is not None and value < 20:
+                self.vote('carports', int(value), 0.9)
+                self.consumed.add(i + 1)
+        elif w in ('garasi', 'garage'):
+            value = self.num_at(i + 1, i)
+            if value is not None and value < 20:
+                self.vote('garages', int(value), 0.9)
+                self.consumed.add(i + 1)
+        elif w == 'lantai':
+            value = self.num_at(i + 1, i)
+            if value is not None and 0 < value < 100:
+                self.vote('floors', value, 0.8)
+                self.consumed.add(i + 1)
+        elif w == 'siap' and nxt == 'huni':
+            self.vote('condition', 'Siap Huni', 0.9)
+        elif w == 'hitung' and nxt == 'tanah':
+            self.vote('condition', 'Butuh Renovasi', 0.85)
+        elif w in ('baru', 'gress', 'gres', 'new') and prev in PROPERTY_TYPES:
+            self.vote('condition', 'Baru', 0.8)
+        elif w in ('second', 'seken', 'bekas'):
+            self.vote('condition', 'Bekas', 0.8)
+        elif w in ('furnish', 'furnished', 'furnised') and prev in ('full', 'fully', 'semi', 'un'):
+            self.vote('furnished', {'semi': 'Semi', 'un': 'Kosongan'}.get(prev, 'Full'), 0.9)
+        elif w in ('unfurnish', 'unfurnished', 'kosongan'):
+            self.vote('furnished', 'Kosongan', 0.85)
+        elif w == 'row' or (w == 'jalan' and prev == 'lebar'):
+            rest = self.rest_of_line(i + 1 if nxt == 'jalan' else i)
+            if rest:
+                self.vote('row_road', rest[:100], 0.85)
+            # Road widths ("8-9M") are not prices
+            j = i + 1
+            while self.same_line(i, j):
+                self.consumed.add(j)
+                j += 1
+        elif w in PRICE_KEYWORDS:
+            j = i + 1
+            if self.word_at(j) in SALE_WORDS | RENT_WORDS:
+                j += 1
+            if self.tok(j) is not None and self.tok(j).kind == 'num' and self.same_line(i, j):
+                self.read_price(j, 0.95)
+
+    def on_number(self, i: int, t: Token) -> None:
+        nxt = self.word_at(i + 1) if self.same_line(i, i + 1) else None
+        value = _to_number(t.text, scaled=False)
+
+        # "3+1 KT" -> first number, helper room after '+' is ignored
+        if self.tok(i + 1) is not None and self.tok(i + 1).kind == 'plus' \
+                and self.tok(i + 2) is not None and self.tok(i + 2).kind == 'num':
+            room = self.word_at(i + 3) if self.same_line(i, i + 3) else None
+            if room == 'kt':
+                self.vote('bedrooms', int(value), 0.9)
+            elif room == 'km':
+                self.vote('bathrooms', int(value), 0.9)
+            self.consumed.add(i + 2)
+            return
+
+        follower = self.word_at(i + 2) if self.same_line(i, i + 2) else None
+        if nxt == 'kt' and follower not in HELPER_WORDS and value < 100:
+            self.vote('bedrooms', int(value), 0.9)
+        elif nxt == 'km' and follower not in HELPER_WORDS | {'dari', 'ke', 'menuju'} and value < 100:
+            self.vote('bathrooms', int(value), 0.85)
+        elif nxt == 'kamar' and follower == 'tidur' and value < 100:
+            self.vote('bedrooms', int(value), 0.9)
+        elif nxt == 'kamar' and follower == 'mandi' and value < 100:
+            self.vote('bathrooms', int(value), 0.9)
+        elif nxt == 'lantai' and 0 < value < 100:
+            semi = self.word_at(i - 1) == 'semi' and self.same_line(i, i - 1)
+            self.vote('floors', value - 0.5 if semi else value, 0.75 if semi else 0.9)
+        elif nxt in ELECTRICITY_UNITS and 450 <= value <= 200_000:
+            self.vote('electricity', int(value), 0.9)
+        elif nxt == 'carport' and value < 20:
+            self.vote('carports', int(value), 0.85)
+        elif nxt in ('garasi', 'garage') and value < 20:
+            self.vote('garages', int(value), 0.85)
+        elif nxt in UNAMBIGUOUS_MULTIPLIERS and not self.line_has_area_context(i):
+            self.read_price(i, 0.85)
+        elif nxt == 'm' and not self.line_has_area_context(i) and value < 1000:
+            # Bare "1.3M" is a price unless the line talks about sizes
+            self.read_price(i, 0.75)
+
+    # Resolution
+    def resolve(self) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        data: Dict[str, Any] = {}
+        confidence: Dict[str, float] = {}
+
+        for field, votes in self.votes.items():
+            value = max(votes, key=lambda vote: vote[1])[0]
+            agreeing = [c for v, c in votes if v == value]
+            conf = max(agreeing)
+            conflicting = any(v != value and c >= conf - 0.1 for v, c in votes)
+            if len(agreeing) > 1:
+                conf = min(conf + 0.03, 0.99)
+            if conflicting:
+                conf *= 0.7
+            data[field] = value
+            confidence[field] = round(conf, 2)
+
+        # Transaction type
+        if self.dual_keyword or (self.has_sale and self.has_rent):
+            data['transaction_type'] = 'jual sewa'
+            confidence['transaction_type'] = 0.95 if self.dual_keyword else 0.75
+        elif self.has_sale or self.has_rent:
+            data['transaction_type'] = 'jual' if self.has_sale else 'sewa'
+            confidence['transaction_type'] = 0.9
+
+        # Prices: dual listings split sale/rent, otherwise the final (smallest) price wins
+        if self.prices:
+            distinct = sorted({value for value, _ in self.prices})
+            best = max(c for _, c in self.prices)
+            if data.get('transaction_type') == 'jual sewa' and len(distinct) >= 2:
+                data['price'], data['rent_price'] = distinct[-1], distinct[0]
+                confidence['price'] = confidence['rent_price'] = round(best * 0.9, 2)
+            else:
+                data['price'] = distinct[0]
+                agreeing = sum(1 for value, _ in self.prices if value == distinct[0])
+                conf = best if len(distinct) == 1 else best * 0.6
+                if agreeing > 1:
+                    conf = min(conf + 0.03, 0.99)
+                confidence['price'] = round(conf, 2)
+
+        # Land area from dimensions when not stated
+        dimension_area = data.pop('_dimension_area', None)
+        dimension_conf = confidence.pop('_dimension_area', 0.0)
+        if 'land_area' not in data and dimension_area:
+            data['land_area'] = dimension_area
+            confidence['land_area'] = round(dimension_conf * 0.8, 2)
+
+        self.resolve_text_fields(data, confidence)
+        return data, confidence
+
+    def resolve_text_fields(self, data: Dict[str, Any], confidence: Dict[str, float]) -> None:
+        """Line-level rules: location header, contact and links"""
+        contact_line = None
+        for line_no, line in enumerate(self.lines):
+            if 'contact_phone' not in data:
+                phone = _PHONE_RE.search(line)
+                if phone:
+                    data['contact_phone'] = re.sub(r'[-\s]', '', phone.group(0))
+                    confidence['contact_phone'] = 0.9
+                    contact_line = line_no
+                    name = _clean_text(re.sub(r'\(.*?\)', '', line[:phone.start()]))
+                    name = re.sub(r'^(hubungi|kontak|cp|contact)\b\s*:?', '', name, flags=re.IGNORECASE).strip()
+                    if name and not any(ch.isdigit() for ch in name):
+                        data['contact_name'] = name
+                        confidence['contact_name'] = 0.8
+            if re.search(r'\b(hubungi|kontak|contact|cp)\b', line, re.IGNORECASE) and contact_line is None:
+                contact_line = line_no
+
+            if 'city' not in data and (contact_line is None or line_no < contact_line):
+                match = _LOCATION_LINE_RE.match(line)
+                if match and not _PHONE_RE.search(line):
+                    data['address'] = _clean_text(match.group(1))
+                    data['city'] = _clean_text(match.group(2)).title()
+                    confidence['address'] = 0.8
+                    confidence['city'] = 0.85
+
+        for t in self.tokens:
+            if t.kind != 'url':
+                continue
+            if any(host in t.text for host in _VIDEO_HOSTS):
+                field = 'video_review_url'
+            elif contact_line is not None and t.line > contact_line:
+                field = 'agent_url'
+            else:
+                field = 'property_url'
+            if field not in data:
+                data[field] = t.text
+                confidence[field] = 0.85
+
+
+class ListingExtraction:
+    """Result of the local parser: field values plus per-field confidence"""
+
+    def __init__(self, data: Dict[str, Any], confidence: Dict[str, float]):
+        self.data = data
+        self.confidence = confidence
+
+    def is_confident(self, threshold: float = LOCAL_EXTRACTION_MIN_CONFIDENCE) -> bool:
+        """True when the record is complete enough to skip the AI"""
+        if any(self.confidence.get(field, 0.0) < threshold for field in REQUIRED_FIELDS):
+            return False
+        specs = sum(1 for field in SPEC_FIELDS if self.confidence.get(field, 0.0) >= threshold)
+        return specs >= MIN_SPEC_FIELDS
+
+    def confident_data(self, threshold: float = LOCAL_EXTRACTION_MIN_CONFIDENCE) -> Dict[str, Any]:
+        """Only the fields at or above the threshold"""
+        return {k: v for k, v in self.data.items() if self.confidence.get(k, 0.0) >= threshold}
+
+
+def parse_listing(text: str) -> ListingExtraction:
+    """
+    Extract property fields from a listing without calling the AI
+
+    Args:
+        text: Raw listing text
+
+    Returns:
+        ListingExtraction with data and per-field confidence (0..1)
+    """
+    rules = _ListingRules(text or '')
+    rules.run()
+    data, confidence = rules.resolve()
+    return ListingExtraction(data, confidence)
@@ -1,61 +1,522 @@
 """
-Script to migrate database schema
-Adds new columns to properties table
+Versioned, online schema migrations
+
+Each migration is a numbered list of steps built from the ORM models in
+database.py; applied versions are recorded in schema_migrations, and every step
+checks the live schema first, so re-running is always safe. Steps are written
+for a large, live properties table:
+
+- DDL runs in short transactions with lock_timeout, retried with backoff, so a
+  migration waiting for a lock never queues the bot's queries behind it
+- indexes are built with CREATE INDEX CONCURRENTLY (an invalid leftover of an
+  interrupted build is dropped and rebuilt)
+- type changes add a new column kept in sync by a trigger, backfill it in
+  batches and swap the columns in one short transaction, instead of an
+  ALTER COLUMN TYPE that rewrites the table under an ACCESS EXCLUSIVE lock
+- data backfills commit per batch
+
+Usage:
+    python migrate_db.py                      apply pending migrations
+    python migrate_db.py --status             list applied and pending versions
+    python migrate_db.py --check              compare the database with the ORM models
+    python migrate_db.py --backfill locations re-run a data backfill (locations, facilities, stats)
+
+To change the schema: update the model in database.py (and schema.sql), then
+append a Migration with the next version number to MIGRATIONS.
 """
 
 import os
-from sqlalchemy import create_engine, text
+import time
+import argparse
+from typing import Callable, List, NamedTuple, Optional
+
 from dotenv import load_dotenv
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from database import (
+    Base,
+    ExtractionCacheEntry,
+    Property,
+    PropertyImage,
+    User,
+    UserPropertyStats,
+    STATS_LOCK_SQL,
+    TRIGRAM_COLUMNS,
+    apply_gazetteer,
+    check_search_config,
+    property_stats_from_rows,
+    property_stats_query,
+    property_stats_rollup_insert,
+)
+from facilities import normalize_facilities
 
 load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 engine = create_engine(DATABASE_URL)
+Session = sessionmaker(bind=engine)
 
-def migrate():
-    print("🔄 Migrating database...")
-    
-    with engine.connect() as conn:
-        # List of new columns to add
-        columns = [
-            ("electricity", "INTEGER"),
-            ("orientation", "VARCHAR(50)"),
-            ("dimensions", "VARCHAR(50)"),
-            ("row_road", "VARCHAR(100)"),
-            ("property_url", "TEXT"),
-            ("agent_url", "TEXT"),
-            ("rent_price", "BIGINT"),
-            ("condition", "VARCHAR(50)"),
-            ("water_type", "VARCHAR(50)"),
-            ("furnished", "VARCHAR(50)"),
-            ("phone_line_count", "INTEGER"),
-            ("kpr", "BOOLEAN"),
-            ("imb", "BOOLEAN"),
-            ("blueprint", "BOOLEAN"),
-            ("video_review_url", "TEXT")
-        ]
-        
-        for col_name, col_type in columns:
+# Online migration settings
+MIGRATION_LOCK_TIMEOUT = os.getenv('MIGRATION_LOCK_TIMEOUT', '3s')
+MIGRATION_LOCK_RETRIES = int(os.getenv('MIGRATION_LOCK_RETRIES', '10'))
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '500'))
+MIGRATION_BATCH_PAUSE = float(os.getenv('MIGRATION_BATCH_PAUSE', '0.05'))
+
+# pg_advisory_lock key: one migration runner at a time
+_RUNNER_LOCK_KEY = 7210391
+
+
+class MigrationRunner:
+    """Database helpers shared by the steps"""
+
+    def __init__(self, bind):
+        self.engine = bind
+
+    # Schema inspection (fresh each time, steps change the schema)
+
+    def columns(self, table: str) -> dict:
+        return {column['name']: column for column in inspect(self.engine).get_columns(table)}
+
+    def column_type(self, table: str, column: str) -> Optional[str]:
+        with self.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a "
+                "WHERE a.attrelid = to_regclass(:table) AND a.attname = :column AND NOT a.attisdropped"
+            ), {'table': table, 'column': column}).scalar()
+
+    def index_state(self, name: str) -> Optional[bool]:
+        """True if the index exists and is valid, False if invalid, None if missing"""
+        with self.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(:name)"
+            ), {'name': name}).scalar()
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.engine).has_table(table)
+
+    # Execution
+
+    def ddl(self, *statements: str) -> None:
+        """Run statements in one short transaction under lock_timeout, retrying when the lock is busy"""
+        def execute(conn):
+            for statement in statements:
+                conn.execute(text(statement))
+        self.locked(execute)
+
+    def locked(self, work: Callable) -> None:
+        """Call work(connection) in a transaction under lock_timeout, retrying with backoff when the lock is busy"""
+        for attempt in range(1, MIGRATION_LOCK_RETRIES + 1):
             try:
-                # Changes floors to DECIMAL first if needed (manual step usually, but let's just add new cols)
-                # Note: floors change from integer to decimal might need explicit ALTER COLUMN
-                
-                query = text(f"ALTER TABLE properties ADD COLUMN IF NOT EXISTS {col_name} {col_type};")
-                conn.execute(query)
-                print(f"   ✅ Added column: {col_name}")
-            except Exception as e:
-                print(f"   ⚠️  Error adding {col_name}: {e}")
-        
-        # Modify floors column type
+                with self.engine.begin() as conn:
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{MIGRATION_LOCK_TIMEOUT}'"))
+                    work(conn)
+                return
+            except OperationalError as e:
+                if getattr(e.orig, 'pgcode', None) != '55P03' or attempt == MIGRATION_LOCK_RETRIES:
+                    raise
+                delay = min(30.0, 0.5 * 2 ** attempt)
+                print(f"      ⏳ Lock busy, retry {attempt}/{MIGRATION_LOCK_RETRIES} in {delay:.0f}s")
+                time.sleep(delay)
+
+    def concurrently(self, statement: str) -> None:
+        """Run a statement that must not be inside a transaction block (CREATE INDEX CONCURRENTLY)"""
+        with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(statement))
+
+    def batches(self, process: Callable, label: str) -> int:
+        """
+        Call process(session, after_id) -> (last_id, changed) until it returns last_id None,
+        committing after every batch
+        """
+        after_id, total = 0, 0
+        while True:
+            with Session() as db:
+                after_id, changed = process(db, after_id)
+                db.commit()
+            if after_id is None:
+                return total
+            total += changed
+            print(f"      … {label}: {total} rows (id <= {after_id})")
+            time.sleep(MIGRATION_BATCH_PAUSE)
+
+
+# Steps
+
+class Step:
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    def run(self, runner: MigrationRunner) -> None:
+        raise NotImplementedError
+
+
+class CreateTables(Step):
+    """Create model tables (with their indexes) that do not exist yet"""
+
+    def __init__(self, *models):
+        self.tables = [model.__table__ for model in models]
+
+    def describe(self) -> str:
+        return "create tables " + ", ".join(table.name for table in self.tables)
+
+    def run(self, runner: MigrationRunner) -> None:
+        for table in self.tables:
+            if runner.has_table(table.name):
+                continue
+            runner.locked(lambda conn: table.create(bind=conn, checkfirst=True))
+            print(f"      ✅ Created table: {table.name}")
+
+
+class AddColumns(Step):
+    """Add model columns as nullable (catalog-only change, no table rewrite)"""
+
+    def __init__(self, model, *names: str):
+        self.table = model.__table__
+        self.names = names
+
+    def describe(self) -> str:
+        return f"add {self.table.name} columns " + ", ".join(self.names)
+
+    def run(self, runner: MigrationRunner) -> None:
+        existing = runner.columns(self.table.name)
+        for name in self.names:
+            if name in existing:
+                continue
+            column = self.table.c[name]
+            ddl = str(CreateColumn(column).compile(dialect=runner.engine.dialect))
+            runner.ddl(f"ALTER TABLE {self.table.name} ADD COLUMN IF NOT EXISTS {ddl.replace(' NOT NULL', '')}")
+            print(f"      ✅ Added column: {name}")
+
+
+class ChangeColumnType(Step):
+    """
+    Change a column to its model type without rewriting the table under lock:
+    add <column>__new, keep it in sync with a trigger, backfill in batches,
+    then drop the old column and rename the new one in one short transaction
+    """
+
+    def __init__(self, model, name: str, using: str):
+        self.table = model.__table__.name
+        self.name = name
+        self.type = model.__table__.c[name].type.compile(dialect=engine.dialect)
+        self.using = using  # SQL expression converting the old value ({column} is replaced)
+
+    def describe(self) -> str:
+        return f"change {self.table}.{self.name} to {self.type}"
+
+    def run(self, runner: MigrationRunner) -> None:
+        current = runner.column_type(self.table, self.name)
+        target = runner.column_type(self.table, f"{self.name}__new")
+        with runner.engine.connect() as conn:
+            wanted = conn.execute(text(f"SELECT format_type('{self.type}'::regtype, NULL)")).scalar()
+        if current is None or (current.split('(')[0] == wanted and target is None):
+            return
+
+        new, function = f"{self.name}__new", f"{self.table}_{self.name}__sync"
+        convert = self.using.format(column=f"NEW.{self.name}")
+        runner.ddl(
+            f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS {new} {self.type}",
+            f"CREATE OR REPLACE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS "
+            f"$$ BEGIN NEW.{new} := {convert}; RETURN NEW; END $$",
+            f"DROP TRIGGER IF EXISTS {function} ON {self.table}",
+            f"CREATE TRIGGER {function} BEFORE INSERT OR UPDATE ON {self.table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {function}()",
+        )
+
+        convert_old = self.using.format(column=self.name)
+
+        def backfill(db, after_id):
+            ids = db.execute(text(
+                f"UPDATE {self.table} SET {new} = {convert_old} WHERE id IN ("
+                f"SELECT id FROM {self.table} WHERE id > :after ORDER BY id LIMIT :limit) RETURNING id"
+            ), {'after': after_id, 'limit': MIGRATION_BATCH_SIZE}).scalars().all()
+            return (max(ids), len(ids)) if ids else (None, 0)
+
+        copied = runner.batches(backfill, f"{self.table}.{self.name}")
+        runner.ddl(
+            f"DROP TRIGGER IF EXISTS {function} ON {self.table}",
+            f"ALTER TABLE {self.table} DROP COLUMN {self.name}",
+            f"ALTER TABLE {self.table} RENAME COLUMN {new} TO {self.name}",
+            f"DROP FUNCTION IF EXISTS {function}()",
+        )
+        print(f"      ✅ Changed {self.table}.{self.name} to {self.type} ({copied} rows copied)")
+
+
+class CreateIndexes(Step):
+    """Build model indexes with CREATE INDEX CONCURRENTLY"""
+
+    def __init__(self, model, *names: str):
+        self.indexes = [index for index in model.__table__.indexes if index.name in names]
+        missing = set(names) - {index.name for index in self.indexes}
+        if missing:
+            raise ValueError(f"Unknown indexes on {model.__tablename__}: {', '.join(sorted(missing))}")
+
+    def describe(self) -> str:
+        return "create indexes " + ", ".join(index.name for index in self.indexes)
+
+    def run(self, runner: MigrationRunner) -> None:
+        for index in self.indexes:
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=runner.engine.dialect))
+            build_index(runner, index.name, ddl)
+
+
+class CreateTrigramIndexes(Step):
+    """pg_trgm GIN indexes for keyword search (skipped when the extension is unavailable)"""
+
+    def describe(self) -> str:
+        return "create trigram indexes on properties " + ", ".join(TRIGRAM_COLUMNS)
+
+    def run(self, runner: MigrationRunner) -> None:
         try:
-            conn.execute(text("ALTER TABLE properties ALTER COLUMN floors TYPE DECIMAL(3,1);"))
-            print("   ✅ Modified column: floors (to DECIMAL)")
+            runner.ddl("CREATE EXTENSION IF NOT EXISTS pg_trgm")
         except Exception as e:
-            print(f"   ⚠️  Error modifying floors: {e}")
-            
-        conn.commit()
-    
+            print(f"      ⚠️  pg_trgm not available, keyword search runs without trigram indexes: {e.__class__.__name__}")
+            return
+        for column in TRIGRAM_COLUMNS:
+            name = f"idx_properties_{column}_trgm"
+            build_index(runner, name, f"CREATE INDEX IF NOT EXISTS {name} ON properties USING gin ({column} gin_trgm_ops)")
+
+
+def build_index(runner: MigrationRunner, name: str, create_sql: str) -> None:
+    """CREATE INDEX CONCURRENTLY, replacing an invalid index left by an interrupted build"""
+    state = runner.index_state(name)
+    if state:
+        return
+    if state is False:
+        print(f"      ♻️  Dropping invalid index {name}")
+        runner.concurrently(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    concurrent_sql = create_sql.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)\
+        .replace('CREATE UNIQUE INDEX', 'CREATE UNIQUE INDEX CONCURRENTLY', 1)
+    started = time.monotonic()
+    runner.concurrently(concurrent_sql)
+    print(f"      ✅ Index ready: {name} ({time.monotonic() - started:.1f}s)")
+
+
+class Backfill(Step):
+    """Data backfill committed per batch"""
+
+    def __init__(self, name: str, process: Callable):
+        self.name = name
+        self.process = process
+
+    def describe(self) -> str:
+        return f"backfill {self.name}"
+
+    def run(self, runner: MigrationRunner) -> None:
+        changed = runner.batches(self.process, self.name)
+        print(f"      ✅ Backfilled {self.name}: {changed} rows updated")
+
+
+# Backfills: process(session, after_id) -> (last_id or None when done, rows changed)
+
+def _listing_batch(db, after_id: int, *conditions) -> list:
+    return db.query(Property).filter(Property.id > after_id, *conditions)\
+        .order_by(Property.id).limit(MIGRATION_BATCH_SIZE).all()
+
+
+def backfill_locations(db, after_id: int):
+    """Gazetteer ids (and canonical names) for listings stored without them"""
+    batch = _listing_batch(db, after_id, Property.city_id.is_(None))
+    for property_obj in batch:
+        apply_gazetteer(property_obj)
+    return (batch[-1].id if batch else None), sum(p.city_id is not None for p in batch)
+
+
+def backfill_facilities(db, after_id: int):
+    """Facility lists rewritten in the canonical vocabulary"""
+    batch = _listing_batch(db, after_id, Property.facilities.isnot(None))
+    changed = 0
+    for property_obj in batch:
+        normalized = normalize_facilities(property_obj.facilities)
+        if normalized != property_obj.facilities:
+            property_obj.facilities = normalized
+            changed += 1
+    return (batch[-1].id if batch else None), changed
+
+
+def rebuild_user_stats(db, after_id: int):
+    """
+    /stats rollups recomputed with the grouped query. Each user's exclusive stats lock
+    is taken first (as when a rollup is seeded), so a concurrent write's delta is either
+    counted or applied to the rebuilt row once the batch commits.
+    """
+    user_ids = [user_id for (user_id,) in db.query(User.id).filter(User.id > after_id)
+                .order_by(User.id).limit(MIGRATION_BATCH_SIZE)]
+    if not user_ids:
+        return None, 0
+    for user_id in user_ids:
+        db.execute(STATS_LOCK_SQL, {'user_id': user_id})
+    for user_id in user_ids:
+        stats = property_stats_from_rows(db.execute(property_stats_query(user_id)).all())
+        db.execute(property_stats_rollup_insert(user_id, stats))
+    return user_ids[-1], len(user_ids)
+
+
+BACKFILLS = {
+    'locations': backfill_locations,
+    'facilities': backfill_facilities,
+    'stats': rebuild_user_stats,
+}
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    steps: List[Step]
+
+
+MIGRATIONS = [
+    Migration(1, "base tables", [
+        CreateTables(User, Property, PropertyImage),
+        # Databases created from an older schema.sql named these differently or lacked them
+        CreateIndexes(User, 'ix_users_id', 'ix_users_telegram_id'),
+        CreateIndexes(Property, 'ix_properties_id', 'ix_properties_city', 'ix_properties_price'),
+        CreateIndexes(PropertyImage, 'ix_property_images_id', 'ix_property_images_property_id'),
+    ]),
+    Migration(2, "extended listing fields", [
+        AddColumns(Property, 'electricity', 'orientation', 'dimensions', 'row_road', 'property_url', 'agent_url',
+                   'rent_price', 'condition', 'water_type', 'furnished', 'phone_line_count', 'kpr', 'imb',
+                   'blueprint', 'video_review_url'),
+        ChangeColumnType(Property, 'floors', using="{column}::numeric(3,1)"),
+    ]),
+    Migration(3, "persistent extraction cache", [
+        CreateTables(ExtractionCacheEntry),
+    ]),
+    Migration(4, "keyword search indexes", [
+        CreateIndexes(Property, 'idx_properties_search_document'),
+        CreateTrigramIndexes(),
+    ]),
+    Migration(5, "gazetteer location ids", [
+        AddColumns(Property, 'province_id', 'city_id', 'district_id'),
+        CreateIndexes(Property, 'ix_properties_province_id', 'ix_properties_city_id', 'ix_properties_district_id'),
+        Backfill('locations', backfill_locations),
+    ]),
+    Migration(6, "facility vocabulary", [
+        ChangeColumnType(Property, 'facilities', using="{column}::jsonb"),
+        Backfill('facilities', backfill_facilities),
+        CreateIndexes(Property, 'idx_properties_facilities'),
+    ]),
+    Migration(7, "stats rollups", [
+        CreateTables(UserPropertyStats),
+        Backfill('stats', rebuild_user_stats),
+    ]),
+    Migration(8, "query-shaped composite indexes", [
+        CreateIndexes(Property, 'idx_properties_user_recent', 'idx_properties_user_price',
+                      'idx_properties_user_city_price', 'idx_properties_user_district_price'),
+    ]),
+]
+
+
+# Version bookkeeping
+
+def ensure_version_table() -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        ))
+
+
+def applied_versions() -> dict:
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT version, applied_at FROM schema_migrations")).all())
+
+
+def migrate() -> bool:
+    """Apply pending migrations in order; returns False if one failed (nothing after it runs)"""
+    print("🔄 Migrating database...")
+    try:
+        with engine.connect() as conn:
+            check_search_config(conn)
+    except RuntimeError as e:
+        print(f"   ❌ {e}")
+        return False
+    ensure_version_table()
+    runner = MigrationRunner(engine)
+    with engine.connect() as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': _RUNNER_LOCK_KEY})
+        try:
+            done = applied_versions()
+            for migration in MIGRATIONS:
+                if migration.version in done:
+                    continue
+                print(f"   ▶️  {migration.version}: {migration.name}")
+                try:
+                    for step in migration.steps:
+                        print(f"      • {step.describe()}")
+                        step.run(runner)
+                except Exception as e:
+                    print(f"   ❌ Migration {migration.version} failed: {e}")
+                    return False
+                with engine.begin() as conn:
+                    conn.execute(text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                                 {'version': migration.version, 'name': migration.name})
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': _RUNNER_LOCK_KEY})
+            lock_conn.commit()
     print("✨ Migration complete!")
+    return True
+
+
+def status() -> None:
+    ensure_version_table()
+    done = applied_versions()
+    for migration in MIGRATIONS:
+        applied = done.get(migration.version)
+        mark = f"✅ {applied:%Y-%m-%d %H:%M}" if applied else "⏳ pending"
+        print(f"   {migration.version:>3}  {mark:<20} {migration.name}")
+
+
+def _type_key(type_sql: str) -> str:
+    return type_sql.replace(' ', '').upper().replace('DECIMAL', 'NUMERIC')
+
+
+def check() -> bool:
+    """Report differences between the ORM models and the database; True if none"""
+    print("🔍 Comparing database with models...")
+    runner = MigrationRunner(engine)
+    problems = []
+    for table in Base.metadata.sorted_tables:
+        if not runner.has_table(table.name):
+            problems.append(f"missing table {table.name}")
+            continue
+        existing = runner.columns(table.name)
+        for column in table.columns:
+            if column.name not in existing:
+                problems.append(f"missing column {table.name}.{column.name}")
+                continue
+            wanted = column.type.compile(dialect=engine.dialect)
+            actual = existing[column.name]['type'].compile(dialect=engine.dialect)
+            if _type_key(wanted) != _type_key(actual):
+                problems.append(f"column {table.name}.{column.name} is {actual}, model says {wanted}")
+        for name in sorted(set(existing) - set(table.columns.keys())):
+            problems.append(f"extra column {table.name}.{name} (not in the model)")
+        for index in table.indexes:
+            state = runner.index_state(index.name)
+            if not state:
+                problems.append(f"{'invalid' if state is False else 'missing'} index {index.name}")
+    for problem in problems:
+        print(f"   ⚠️  {problem}")
+    print("✅ Database matches the models" if not problems else f"❌ {len(problems)} difference(s)")
+    return not problems
+
 
 if __name__ == "__main__":
-    migrate()
+    parser = argparse.ArgumentParser(description="Versioned online schema migrations")
+    parser.add_argument('--status', action='store_true', help="list applied and pending migrations")
+    parser.add_argument('--check', action='store_true', help="compare the database with the ORM models")
+    parser.add_argument('--backfill', choices=sorted(BACKFILLS), help="re-run one data backfill")
+    args = parser.parse_args()
+
+    if args.status:
+        status()
+    elif args.check:
+        raise SystemExit(0 if check() else 1)
+    elif args.backfill:
+        Backfill(args.backfill, BACKFILLS[args.backfill]).run(MigrationRunner(engine))
+    else:
+        raise SystemExit(0 if migrate() else 1)
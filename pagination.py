@@ -0,0 +1,134 @@
+"""
+Keyset (seek) pagination for property lists
+
+Pages are fetched with WHERE (sort_key, id) beyond the cursor + LIMIT instead of
+OFFSET, so page 500 costs the same as page 1. Cursors are short strings that fit
+in Telegram callback_data (64 bytes):
+
+    n<key>.<id>   next page, rows after (key, id)
+    p<key>.<id>   previous page, rows before (key, id)
+
+key and id are base36; datetimes are encoded as microseconds since the epoch and
+an empty key stands for NULL.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, or_, tuple_
+
+# Properties per page of every bot list (queries and page counts)
+PAGE_SIZE = 5
+
+_EPOCH = datetime(1970, 1, 1)
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+class Keyset(NamedTuple):
+    """Sort order of a list: column then the unique id column, in the same direction"""
+    column: Any
+    id_column: Any
+    descending: bool
+    nullable: bool  # NULL keys sort last (ascending order only)
+    is_datetime: bool
+
+
+def _b36(n: int) -> str:
+    if n < 0:
+        return '-' + _b36(-n)
+    digits = ''
+    while True:
+        n, r = divmod(n, 36)
+        digits = _DIGITS[r] + digits
+        if not n:
+            return digits
+
+
+def encode_cursor(keyset: Keyset, direction: str, key: Any, row_id: int) -> str:
+    """Cursor for the page after ('n') or before ('p') the row with (key, row_id)"""
+    if key is None:
+        encoded = ''
+    elif keyset.is_datetime:
+        delta = key - _EPOCH
+        encoded = _b36((delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds)
+    else:
+        encoded = _b36(int(key))
+    return f"{direction}{encoded}.{_b36(row_id)}"
+
+
+def decode_cursor(keyset: Keyset, cursor: str) -> Tuple[str, Any, int]:
+    """(direction, key, id) of a cursor; raises ValueError if malformed"""
+    direction, body = cursor[:1], cursor[1:]
+    if direction not in ('n', 'p') or '.' not in body:
+        raise ValueError(f"Invalid page cursor: {cursor!r}")
+    encoded, row_id = body.split('.', 1)
+    if not encoded:
+        key = None
+    elif keyset.is_datetime:
+        key = _EPOCH + timedelta(microseconds=int(encoded, 36))
+    else:
+        key = int(encoded, 36)
+    return direction, key, int(row_id, 36)
+
+
+def _after(keyset: Keyset, key: Any, row_id: int):
+    """Rows that come after (key, row_id) in the keyset order"""
+    column = keyset.column
+    if keyset.descending:
+        return tuple_(column, keyset.id_column) < tuple_(key, row_id)
+    if key is None:
+        return and_(column.is_(None), keyset.id_column > row_id)
+    after = tuple_(column, keyset.id_column) > tuple_(key, row_id)
+    return or_(after, column.is_(None)) if keyset.nullable else after
+
+
+def _before(keyset: Keyset, key: Any, row_id: int):
+    """Rows that come before (key, row_id) in the keyset order"""
+    column = keyset.column
+    if keyset.descending:
+        return tuple_(column, keyset.id_column) > tuple_(key, row_id)
+    if key is None:
+        return or_(column.isnot(None), and_(column.is_(None), keyset.id_column < row_id))
+    return tuple_(column, keyset.id_column) < tuple_(key, row_id)
+
+
+def seek(keyset: Keyset, cursor: Optional[str]) -> Tuple[list, list]:
+    """Extra WHERE conditions and ORDER BY for the page at cursor (a previous page is read backwards)"""
+    column, id_column = keyset.column, keyset.id_column
+    forward = [column.desc(), id_column.desc()] if keyset.descending else [column.asc(), id_column.asc()]
+    if not cursor:
+        return [], forward
+    direction, key, row_id = decode_cursor(keyset, cursor)
+    if direction == 'n':
+        return [_after(keyset, key, row_id)], forward
+    backward = [column.asc(), id_column.asc()] if keyset.descending else [column.desc(), id_column.desc()]
+    return [_before(keyset, key, row_id)], backward
+
+
+def page_count(total_items: int, limit: int = PAGE_SIZE) -> int:
+    """Number of pages needed for total_items"""
+    return (total_items + limit - 1) // limit
+
+
+def build_page(keyset: Keyset, rows: List[Any], cursor: Optional[str], page: int, limit: int,
+               total_items: Optional[int]) -> Dict[str, Any]:
+    """Page result from up to limit + 1 fetched rows (the extra row only signals more pages)"""
+    backward = bool(cursor) and cursor.startswith('p')
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    has_next = True if backward else has_more
+    has_prev = has_more if backward else page > 1
+
+    def row_cursor(direction: str, row: Any) -> str:
+        return encode_cursor(keyset, direction, getattr(row, keyset.column.key), getattr(row, keyset.id_column.key))
+
+    return {
+        'items': rows,
+        'total_items': total_items,
+        'total_pages': page_count(total_items, limit) if total_items is not None else None,
+        'current_page': page,
+        'next_cursor': row_cursor('n', rows[-1]) if rows and has_next else None,
+        'prev_cursor': row_cursor('p', rows[0]) if rows and has_prev else None,
+    }
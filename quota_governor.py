@@ -0,0 +1,301 @@
+"""
+Process-wide Gemini quota governor
+
+All ai_processor calls pass through one governor that
+- paces requests with token buckets sized to the configured RPM / TPM,
+- serves waiting callers by priority lane (interactive /add > /search > ask > backfill),
+- backs off exponentially after a 429, honoring the retry delay Gemini sends.
+Callers wait their turn instead of failing; a lane only gives up once its wait budget is spent.
+"""
+
+import os
+import re
+import json
+import time
+import heapq
+import random
+import asyncio
+import logging
+import threading
+import itertools
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Configured quota (free tier defaults, see QUOTA_INFO.md)
+GEMINI_RPM = int(os.getenv('GEMINI_RPM', '15'))
+GEMINI_TPM = int(os.getenv('GEMINI_TPM', '1000000'))
+
+# Backoff after a quota error when Gemini sends no retry delay
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+POLL_INTERVAL = 0.25  # Max sleep between checks while queued
+CHARS_PER_TOKEN = 4.0  # Prompt token estimate before the API reports the real count
+
+
+class Lane(IntEnum):
+    """Priority lanes, lower value is served first"""
+    INTERACTIVE = 0  # /add extraction, a user is waiting on the screen
+    SEARCH = 1  # /search query parsing
+    ASK = 2  # ask_gemini
+    BACKFILL = 3  # seeding, batch imports
+
+
+# Max seconds a call may wait in its lane (queue + backoff) before giving up; None waits forever
+LANE_MAX_WAIT: Dict[Lane, Optional[float]] = {
+    Lane.INTERACTIVE: float(os.getenv('GEMINI_INTERACTIVE_MAX_WAIT', '30')),
+    Lane.SEARCH: float(os.getenv('GEMINI_SEARCH_MAX_WAIT', '10')),
+    Lane.ASK: float(os.getenv('GEMINI_ASK_MAX_WAIT', '30')),
+    Lane.BACKFILL: None,
+}
+
+
+class QuotaExceededError(Exception):
+    """Raised when Gemini API quota is exceeded"""
+
+    def __init__(self, message: str = "Gemini API quota exceeded", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_RETRY_PATTERNS = [
+    re.compile(r'"retryDelay"\s*:\s*"(\d+(?:\.\d+)?)s"'),
+    re.compile(r"'retryDelay'\s*:\s*'(\d+(?:\.\d+)?)s'"),
+    re.compile(r'retry in (\d+(?:\.\d+)?)\s*s', re.IGNORECASE),
+]
+
+
+def is_quota_error(e: BaseException) -> bool:
+    """Check whether a Gemini error means the quota is exhausted"""
+    if isinstance(e, QuotaExceededError):
+        return True
+    if getattr(e, 'code', None) == 429 or getattr(e, 'status', None) == 'RESOURCE_EXHAUSTED':
+        return True
+    error_msg = str(e)
+    return '429' in error_msg or 'RESOURCE_EXHAUSTED' in error_msg
+
+
+def retry_after_seconds(e: BaseException) -> Optional[float]:
+    """Retry delay requested by the API (Retry-After header or RetryInfo.retryDelay), if any"""
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    details = getattr(e, 'details', None)
+    texts = [json.dumps(details, default=str)] if details else []
+    texts.append(str(e))
+    for text in texts:
+        for pattern in _RETRY_PATTERNS:
+            match = pattern.search(text)
+            if match:
+                return float(match.group(1))
+    return None
+
+
+def estimate_tokens(*texts: Optional[str]) -> float:
+    """Rough prompt token count used to reserve TPM before a call"""
+    return sum(len(text) for text in texts if text) / CHARS_PER_TOKEN
+
+
+class _Bucket:
+    """Token bucket refilled continuously at capacity per minute"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(per_minute, 1))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (amounts above capacity wait for a full bucket)"""
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class QuotaGovernor:
+    """Shared rate limiter for sync and async Gemini callers"""
+
+    def __init__(self, rpm: int = GEMINI_RPM, tpm: int = GEMINI_TPM):
+        self._lock = threading.Lock()
+        self._requests = _Bucket(rpm)
+        self._tokens = _Bucket(tpm)
+        self._queue: List[Tuple[int, int]] = []  # (lane, ticket) heap of waiting callers
+        self._tickets = itertools.count()
+        self._blocked_until = 0.0
+        self._failures = 0
+        self._stats = {'granted': 0, 'quota_errors': 0, 'rejected': 0, 'wait_total': 0.0}
+
+    # Admission
+
+    def _try_grant(self, entry: Tuple[int, int], tokens: float) -> float:
+        """Grant entry if it is at the head of the queue and quota allows; else seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            if self._queue[0] != entry:
+                return POLL_INTERVAL / 5
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            self._requests.level -= 1
+            self._tokens.level -= min(tokens, self._tokens.capacity)
+            heapq.heappop(self._queue)
+            self._stats['granted'] += 1
+            return 0.0
+
+    def _enqueue(self, lane: Lane) -> Tuple[int, int]:
+        entry = (int(lane), next(self._tickets))
+        with self._lock:
+            heapq.heappush(self._queue, entry)
+        return entry
+
+    def _leave(self, entry: Tuple[int, int]) -> None:
+        with self._lock:
+            if entry in self._queue:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+
+    def _check_budget(self, lane: Lane, started: float, wait: float) -> None:
+        """Give up early when the lane's wait budget cannot cover the next wait"""
+        budget = LANE_MAX_WAIT.get(lane)
+        if budget is None:
+            return
+        elapsed = time.monotonic() - started
+        if elapsed + wait > budget:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise QuotaExceededError(
+                f"Gemini quota: {lane.name.lower()} lane wait budget ({budget:.0f}s) exhausted",
+                retry_after=max(self._blocked_until - time.monotonic(), wait),
+            )
+
+    def acquire(self, lane: Lane, tokens: float = 0, started: Optional[float] = None) -> None:
+        """
+        Block until a request with about `tokens` prompt tokens may be sent.
+        started is when the caller began waiting (defaults to now), for the lane's wait budget.
+        """
+        started = started or time.monotonic()
+        entry = self._enqueue(lane)
+        try:
+            while True:
+                wait = self._try_grant(entry, tokens)
+                if wait <= 0:
+                    break
+                self._check_budget(lane, started, wait)
+                time.sleep(min(wait, POLL_INTERVAL))
+        finally:
+            self._leave(entry)
+        self._record_wait(started)
+
+    async def acquire_async(self, lane: Lane, tokens: float = 0, started: Optional[float] = None) -> None:
+        """Async variant of acquire, sleeps without blocking the event loop"""
+        started = started or time.monotonic()
+        entry = self._enqueue(lane)
+        try:
+            while True:
+                wait = self._try_grant(entry, tokens)
+                if wait <= 0:
+                    break
+                self._check_budget(lane, started, wait)
+                await asyncio.sleep(min(wait, POLL_INTERVAL))
+        finally:
+            self._leave(entry)
+        self._record_wait(started)
+
+    def _record_wait(self, started: float) -> None:
+        with self._lock:
+            self._stats['wait_total'] += time.monotonic() - started
+
+    # Feedback
+
+    def settle(self, estimated: float, actual: Optional[int]) -> None:
+        """Correct the token bucket with the prompt tokens the API actually counted"""
+        if not actual:
+            return
+        with self._lock:
+            self._tokens.level -= actual - min(estimated, self._tokens.capacity)
+
+    def report_success(self) -> None:
+        """Reset the backoff after a successful call"""
+        with self._lock:
+            self._failures = 0
+
+    def report_quota_error(self, e: BaseException) -> float:
+        """Pause all lanes after a 429; returns the pause in seconds"""
+        retry_after = retry_after_seconds(e)
+        with self._lock:
+            self._failures += 1
+            self._stats['quota_errors'] += 1
+            if retry_after is None:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self._failures - 1))
+                delay *= random.uniform(0.8, 1.2)
+            else:
+                delay = retry_after
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            # The bucket was evidently fuller than the server thinks
+            self._requests.level = min(self._requests.level, 0.0)
+        logger.warning(f"Gemini quota exceeded, pausing calls for {delay:.1f}s")
+        return delay
+
+    # Call wrappers
+
+    def call(self, lane: Lane, tokens: float, fn: Callable[[], T]) -> T:
+        """Run fn under the governor, retrying quota errors until the lane's wait budget runs out"""
+        started = time.monotonic()
+        while True:
+            self.acquire(lane, tokens, started)
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_quota_error(e):
+                    raise
+                delay = self.report_quota_error(e)
+                self._check_budget(lane, started, delay)
+                continue
+            self.report_success()
+            return result
+
+    async def call_async(self, lane: Lane, tokens: float, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async variant of call; fn is a coroutine function"""
+        started = time.monotonic()
+        while True:
+            await self.acquire_async(lane, tokens, started)
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_quota_error(e):
+                    raise
+                delay = self.report_quota_error(e)
+                self._check_budget(lane, started, delay)
+                continue
+            self.report_success()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus the current queue depth per lane and remaining pause"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['queued'] = {lane.name.lower(): sum(1 for entry in self._queue if entry[0] == lane)
+                               for lane in Lane}
+            stats['paused_for'] = round(max(self._blocked_until - time.monotonic(), 0.0), 1)
+        stats['wait_total'] = round(stats['wait_total'], 2)
+        return stats
+
+
+governor = QuotaGovernor()
@@ -0,0 +1,51 @@
+"""
+Read routing between the primary and an optional read replica
+
+Read-only queries of the bot (lists, search, filter menus, stats) can be served by
+a streaming replica (DATABASE_REPLICA_URL). A replica lags the primary slightly, so
+a user who just saved, changed or deleted a listing keeps reading from the primary
+for REPLICA_STICKY_SECONDS and sees their own write (read-your-writes).
+"""
+
+import os
+import time
+from typing import Any, Dict
+
+# Read-your-writes window after a user's last write (seconds)
+REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+
+
+class ReadRouter:
+    """Per-user deadlines until which reads must go to the primary"""
+
+    def __init__(self, sticky_seconds: float = REPLICA_STICKY_SECONDS):
+        self.sticky_seconds = sticky_seconds
+        self._sticky: Dict[int, float] = {}  # users.id -> monotonic deadline
+        self._stats = {'replica_reads': 0, 'primary_reads': 0, 'sticky_reads': 0}
+
+    def mark_write(self, user_id: int) -> None:
+        """The user wrote: pin their reads to the primary for the sticky window"""
+        now = time.monotonic()
+        self._sticky[user_id] = now + self.sticky_seconds
+        if len(self._sticky) > 1024:
+            self._sticky = {uid: deadline for uid, deadline in self._sticky.items() if deadline > now}
+
+    def use_replica(self, user_id: int) -> bool:
+        """Whether a read for user_id may go to the replica (and count it)"""
+        deadline = self._sticky.get(user_id)
+        if deadline is not None:
+            if deadline > time.monotonic():
+                self._stats['sticky_reads'] += 1
+                return False
+            del self._sticky[user_id]
+        self._stats['replica_reads'] += 1
+        return True
+
+    def record_primary_read(self) -> None:
+        self._stats['primary_reads'] += 1
+
+    def clear(self) -> None:
+        self._sticky.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, 'sticky_users': len(self._sticky)}
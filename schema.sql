@@ -1,9 +1,12 @@
 -- Database schema for Property Collection Bot
+-- Mirrors the models in database.py for a fresh database; existing databases are
+-- upgraded with `python migrate_db.py`. `python migrate_db.py --check` compares a
+-- database with the models.
 
 -- Users table: Track Telegram users
 CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
-    telegram_id BIGINT UNIQUE NOT NULL,
+    telegram_id BIGINT NOT NULL, -- unique (ix_users_telegram_id)
     username VARCHAR(255),
     first_name VARCHAR(255),
     last_name VARCHAR(255),
@@ -18,17 +21,22 @@ CREATE TABLE IF NOT EXISTS properties (
     
     -- Property Type & Location
     property_type VARCHAR(50) NOT NULL, -- rumah, apartemen, tanah, ruko, villa, dll
+    condition VARCHAR(50), -- Baru, Bekas, Siap Huni, Butuh Renovasi
     address TEXT,
     city VARCHAR(100),
     district VARCHAR(100), -- kecamatan
     province VARCHAR(100),
+    province_id INTEGER, -- gazetteer ids (gazetteer.py)
+    city_id INTEGER,
+    district_id INTEGER,
     postal_code VARCHAR(10),
     latitude DECIMAL(10, 8),
     longitude DECIMAL(11, 8),
     
     -- Pricing
     transaction_type VARCHAR(20) NOT NULL, -- jual, sewa
-    price BIGINT, -- in Rupiah
+    price BIGINT, -- in Rupiah (sale, or rent if rent-only)
+    rent_price BIGINT, -- rent of a jual/sewa listing
     price_per_meter BIGINT, -- calculated
     negotiable BOOLEAN DEFAULT TRUE,
     
@@ -39,12 +47,26 @@ CREATE TABLE IF NOT EXISTS properties (
     -- Specifications
     bedrooms INTEGER,
     bathrooms INTEGER,
-    floors INTEGER,
+    floors DECIMAL(3, 1), -- 1.5 lantai
     carports INTEGER,
     garages INTEGER,
     year_built INTEGER,
+    electricity INTEGER, -- watt
+    orientation VARCHAR(50),
+    dimensions VARCHAR(50),
+    row_road VARCHAR(100),
     
-    -- Facilities (stored as JSON array)
+    -- Utilities & Condition
+    water_type VARCHAR(50), -- PDAM, Sumur
+    furnished VARCHAR(50), -- Full, Semi, Unfurnished
+    phone_line_count INTEGER,
+    
+    -- Legal & Financial
+    kpr BOOLEAN DEFAULT FALSE,
+    imb BOOLEAN DEFAULT FALSE,
+    blueprint BOOLEAN DEFAULT FALSE,
+    
+    -- Facilities (JSONB array in the canonical vocabulary of facilities.py)
     facilities JSONB,
     
     -- Description & Contact
@@ -52,6 +74,9 @@ CREATE TABLE IF NOT EXISTS properties (
     contact_name VARCHAR(255),
     contact_phone VARCHAR(50),
     contact_whatsapp VARCHAR(50),
+    property_url TEXT,
+    agent_url TEXT,
+    video_review_url TEXT,
     
     -- Certificate & Legal
     certificate_type VARCHAR(50), -- SHM, SHGB, AJB, Girik, dll
@@ -75,15 +100,50 @@ CREATE TABLE IF NOT EXISTS property_images (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Create indexes for better query performance
-CREATE INDEX IF NOT EXISTS idx_properties_user_id ON properties(user_id);
-CREATE INDEX IF NOT EXISTS idx_properties_city ON properties(city);
-CREATE INDEX IF NOT EXISTS idx_properties_property_type ON properties(property_type);
-CREATE INDEX IF NOT EXISTS idx_properties_transaction_type ON properties(transaction_type);
-CREATE INDEX IF NOT EXISTS idx_properties_price ON properties(price);
-CREATE INDEX IF NOT EXISTS idx_properties_status ON properties(status);
-CREATE INDEX IF NOT EXISTS idx_property_images_property_id ON property_images(property_id);
-CREATE INDEX IF NOT EXISTS idx_users_telegram_id ON users(telegram_id);
+-- Persistent AI extraction cache (ai_processor.py)
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    cache_key VARCHAR(64) PRIMARY KEY, -- sha256 of normalized listing + prompt/model version
+    payload JSON NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- Per-user /stats rollup, updated in the same transaction as every property write
+CREATE TABLE IF NOT EXISTS user_property_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    total INTEGER NOT NULL DEFAULT 0,
+    active INTEGER NOT NULL DEFAULT 0,
+    by_type JSONB NOT NULL DEFAULT '{}', -- property_type -> count
+    by_transaction JSONB NOT NULL DEFAULT '{}', -- transaction_type -> count
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create indexes for better query performance (names as in the models)
+CREATE INDEX IF NOT EXISTS ix_users_id ON users(id);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_telegram_id ON users(telegram_id);
+CREATE INDEX IF NOT EXISTS ix_properties_id ON properties(id);
+-- Composite indexes shaped like the hot queries (test_query_plans.py checks the plans)
+CREATE INDEX IF NOT EXISTS idx_properties_user_recent ON properties(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_properties_user_price ON properties(user_id, price, id);
+CREATE INDEX IF NOT EXISTS idx_properties_user_city_price ON properties(user_id, city_id, price, id) WHERE city_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_properties_user_district_price ON properties(user_id, district_id, price, id) WHERE district_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_properties_city ON properties(city);
+CREATE INDEX IF NOT EXISTS ix_properties_province_id ON properties(province_id);
+CREATE INDEX IF NOT EXISTS ix_properties_city_id ON properties(city_id);
+CREATE INDEX IF NOT EXISTS ix_properties_district_id ON properties(district_id);
+CREATE INDEX IF NOT EXISTS ix_properties_price ON properties(price);
+-- Full-text search document (SEARCH_VECTOR_SQL in database.py), indexed as an expression
+CREATE INDEX IF NOT EXISTS idx_properties_search_document ON properties USING gin ((
+    setweight(to_tsvector('indonesian', coalesce(property_type, '') || ' ' || coalesce(city, '') || ' ' || coalesce(district, '')), 'A') ||
+    setweight(to_tsvector('indonesian', coalesce(address, '')), 'B') ||
+    setweight(to_tsvector('indonesian', coalesce(description, '')), 'C')
+));
+CREATE INDEX IF NOT EXISTS idx_properties_facilities ON properties USING gin (facilities jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS ix_property_images_id ON property_images(id);
+CREATE INDEX IF NOT EXISTS ix_property_images_property_id ON property_images(property_id);
+CREATE INDEX IF NOT EXISTS ix_extraction_cache_expires_at ON extraction_cache(expires_at);
+-- Trigram indexes for keyword search need pg_trgm; migrate_db.py (or the bot on a
+-- fresh database) creates them when the extension is available
 
 -- Function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -0,0 +1,286 @@
+"""
+Local grammar for /search queries
+
+Turns phrases like "rumah di sidoarjo 3 kamar max 2M ada kolam renang" into the same
+filter dict that database.search_properties_advanced consumes, without calling the AI.
+A query is only answered locally when every word is understood; anything else goes to Gemini.
+"""
+
+import re
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from facilities import FACILITY_ALIASES, normalize_facility
+from listing_parser import PRICE_MULTIPLIERS, PROPERTY_TYPES, TYPE_BLOCKERS, _to_number
+
+Token = namedtuple('Token', ['kind', 'text'])
+
+_TOKEN_RE = re.compile(r"""
+    (?P<num>\d+(?:[.,]\d+)*)
+  | (?P<unit>(?:m2|m²|meter2|mtr2)(?![^\W\d_]))
+  | (?P<word>[^\W\d_]+)
+  | (?P<dash>-|–|—|s/d)
+  | (?P<lt><=?)
+  | (?P<gt>>=?)
+  | (?P<plus>\+)
+""", re.VERBOSE)
+
+# Words that carry no filter ("cari rumah yang ...")
+FILLER_WORDS = {
+    'cari', 'carikan', 'cariin', 'mencari', 'saya', 'aku', 'mau', 'ingin', 'butuh', 'perlu',
+    'yang', 'dan', 'untuk', 'tolong', 'dong', 'ya', 'properti', 'property', 'info', 'unit',
+    'jual', 'dijual', 'sewa', 'disewa', 'disewakan', 'beli', 'kontrak', 'punya', 'lagi', 'nya',
+}
+PRICE_WORDS = {'harga', 'hrg', 'seharga', 'rp', 'idr'}
+MAX_WORDS = {'max', 'maks', 'maksimal', 'maximal', 'maximum', 'dibawah', 'budget', 'under',
+             'sampai', 'hingga', 'kurang', 'paling'}
+MIN_WORDS = {'min', 'minimal', 'minimum', 'diatas', 'mulai', 'lebih', 'from', 'setidaknya'}
+# Second word of two-word bounds ("di bawah", "kurang dari", "paling mahal")
+BOUND_TAILS = {'dari', 'mahal'}
+RANGE_WORDS = {'sampai', 'hingga', 'sd', 'to'}
+BEDROOM_WORDS = {'kamar', 'kt', 'kmr', 'br', 'bedroom', 'bedrooms', 'bed'}
+AREA_WORDS = {'luas', 'lt'}
+AREA_UNITS = {'meter', 'mtr', 'meter2', 'persegi', 'm2', 'm²'}
+LOCATION_WORDS = {'di', 'daerah', 'area', 'lokasi', 'kawasan', 'wilayah', 'sekitar', 'kota', 'kecamatan'}
+FACILITY_LEADS = {'ada', 'dengan', 'fasilitas', 'plus', 'pakai', 'include', 'termasuk'}
+
+# Common abbreviations used for locations
+LOCATION_ALIASES = {
+    'jaksel': 'Jakarta Selatan', 'jakbar': 'Jakarta Barat', 'jakut': 'Jakarta Utara',
+    'jaktim': 'Jakarta Timur', 'jakpus': 'Jakarta Pusat', 'jkt': 'Jakarta',
+    'tangsel': 'Tangerang Selatan', 'sby': 'Surabaya', 'sda': 'Sidoarjo', 'bdg': 'Bandung',
+    'jogja': 'Yogyakarta', 'jogjakarta': 'Yogyakarta', 'yogya': 'Yogyakarta', 'smg': 'Semarang',
+    'mlg': 'Malang', 'bks': 'Bekasi', 'dps': 'Denpasar',
+}
+
+# Facility phrases (longest first when matching), mapped to the canonical vocabulary
+FACILITY_PHRASES = {alias: name for alias, name in FACILITY_ALIASES.items() if not re.search(r'\d', alias)}
+_MAX_FACILITY_WORDS = max(len(phrase.split()) for phrase in FACILITY_PHRASES)
+
+# Qualifiers the filter dict cannot express; they end a location and send the query to the AI
+UNSUPPORTED_WORDS = {'dekat', 'pinggir', 'murah', 'mewah', 'strategis', 'bebas', 'tanpa', 'kecuali'}
+
+# Every word that starts some other rule ends a location or free-text facility
+_KEYWORDS = (FILLER_WORDS | PRICE_WORDS | MAX_WORDS | MIN_WORDS | BEDROOM_WORDS | AREA_WORDS
+             | LOCATION_WORDS | FACILITY_LEADS | UNSUPPORTED_WORDS | set(PROPERTY_TYPES)
+             | {'antara', 'tanah', 'bawah', 'atas'})
+
+SearchParse = namedtuple('SearchParse', ['filters', 'complete'])
+
+
+def normalize_query(query: str) -> str:
+    """Casefold and collapse whitespace"""
+    return ' '.join((query or '').casefold().split())
+
+
+class _SearchRules:
+    """Single left-to-right pass over the query tokens"""
+
+    def __init__(self, query: str):
+        self.tokens = [Token(m.lastgroup, m.group(m.lastgroup)) for m in _TOKEN_RE.finditer(normalize_query(query))]
+        self.filters: Dict[str, Any] = {}
+        self.unknown: List[str] = []
+
+    def word(self, i: int) -> Optional[str]:
+        return self.tokens[i].text if i < len(self.tokens) and self.tokens[i].kind == 'word' else None
+
+    def kind(self, i: int) -> Optional[str]:
+        return self.tokens[i].kind if i < len(self.tokens) else None
+
+    # Quantities
+
+    def read_quantity(self, i: int, context: Optional[str]) -> Tuple[Optional[str], Optional[float], int, bool]:
+        """
+        Read "2M", "500 m2", "3 kamar", "1.500.000.000" at token i.
+        Returns (kind, value, next index, has_unit) with kind 'price', 'area', 'bedrooms' or None.
+        """
+        raw = self.tokens[i].text
+        unit = self.word(i + 1) or (self.tokens[i + 1].text if self.kind(i + 1) == 'unit' else None)
+        if unit in PRICE_MULTIPLIERS:
+            number = _to_number(raw, scaled=True)
+            # "500m" is meters unless it follows a price word; "2m" is two billion
+            if unit == 'm' and context != 'price' and (context == 'area' or number >= 100):
+                return 'area', number, i + 2, True
+            return 'price', number * PRICE_MULTIPLIERS[unit], i + 2, True
+        number = _to_number(raw, scaled=False)
+        if unit in AREA_UNITS:
+            j = i + 2
+            if self.word(j) == 'persegi':
+                j += 1
+            return 'area', number, j, True
+        if unit in BEDROOM_WORDS and self.kind(i + 2) != 'num':
+            # ("120 kt 3": kt claims the 3, not the 120)
+            j = i + 2
+            if self.word(j) == 'tidur':
+                j += 1
+            elif self.word(j) == 'mandi':
+                return None, None, i, False  # Bathroom counts are not a search filter
+            return 'bedrooms', number, j, True
+        if context == 'price' or number >= 1_000_000:
+            return 'price', number, i + 1, False
+        if context in ('area', 'bedrooms'):
+            return context, number, i + 1, False
+        return None, None, i, False
+
+    def set_bound(self, kind: str, value: float, bound: str) -> bool:
+        """Store a quantity under its filter key; False if the filter dict cannot express it"""
+        if kind == 'price':
+            self.filters[f"{bound}_price"] = int(value)
+        elif kind == 'bedrooms' and bound == 'min' and value < 100:
+            self.filters['min_bedrooms'] = int(value)
+        elif kind == 'area' and bound == 'min':
+            self.filters['min_land_area'] = int(value)
+        else:
+            return False
+        return True
+
+    def starts_range(self, i: int) -> bool:
+        """True when token i joins two quantities ("1 - 2M", "1M sampai 2M", "antara 1M dan 2M")"""
+        return self.kind(i + 1) == 'num' and (self.kind(i) == 'dash' or self.word(i) in RANGE_WORDS | {'dan'})
+
+    def read_range_or_bound(self, i: int, context: Optional[str], bound: Optional[str]) -> int:
+        """Quantity at i, optionally followed by "- 2M" / "sampai 2M"; returns the next index"""
+        kind, value, j, has_unit = self.read_quantity(i, context)
+        if kind is None:
+            # "1-2M": only the upper bound says what the numbers are
+            value, j = _to_number(self.tokens[i].text, scaled=True), i + 1
+            if not self.starts_range(j):
+                self.unknown.append(self.tokens[i].text)
+                return i + 1
+
+        if self.starts_range(j):
+            upper_kind, upper, k, upper_unit = self.read_quantity(j + 1, context or kind)
+            if upper_kind is not None:
+                if kind in ('price', None) and not has_unit and upper_kind == 'price' and upper_unit:
+                    # "1-2M": the unit of the upper bound applies to both
+                    unit_word = self.word(k - 1)
+                    value *= PRICE_MULTIPLIERS.get(unit_word, 1)
+                if not (self.set_bound(upper_kind, value, 'min') and self.set_bound(upper_kind, upper, 'max')):
+                    self.unknown.append(self.tokens[i].text)
+                return k
+
+        # Bare counts and areas are lower bounds, a bare price is a budget
+        bound = bound or ('max' if kind == 'price' else 'min')
+        if not self.set_bound(kind, value, bound):
+            self.unknown.append(self.tokens[i].text)
+        return j
+
+    # Phrases
+
+    def match_facility(self, i: int) -> Tuple[Optional[str], int]:
+        """Longest known facility phrase starting at i"""
+        for size in range(_MAX_FACILITY_WORDS, 0, -1):
+            words = [self.word(i + k) for k in range(size)]
+            if None in words:
+                continue
+            canonical = FACILITY_PHRASES.get(' '.join(words))
+            if canonical:
+                return canonical, i + size
+        return None, i
+
+    def add_facility(self, name: str) -> None:
+        facilities = self.filters.setdefault('must_have_facilities', [])
+        if name not in facilities:
+            facilities.append(name)
+
+    def read_words(self, i: int) -> Tuple[List[str], int]:
+        """Run of non-keyword words starting at i"""
+        words = []
+        while self.word(i) and self.word(i) not in _KEYWORDS and not self.match_facility(i)[0]:
+            words.append(self.word(i))
+            i += 1
+        return words, i
+
+    def read_location(self, i: int) -> int:
+        while self.word(i) in LOCATION_WORDS:
+            i += 1
+        words, j = self.read_words(i)
+        if not words or 'location_keyword' in self.filters:
+            if not words:
+                self.unknown.append(self.word(i - 1) or '')
+            else:
+                self.unknown.extend(words)
+            return max(j, i)
+        phrase = ' '.join(words)
+        self.filters['location_keyword'] = LOCATION_ALIASES.get(
+            phrase, ' '.join(LOCATION_ALIASES.get(w, w.title()) for w in words))
+        return j
+
+    # Main pass
+
+    def run(self) -> None:
+        i = 0
+        context: Optional[str] = None
+        bound: Optional[str] = None
+        while i < len(self.tokens):
+            t = self.tokens[i]
+            w = self.word(i)
+
+            if t.kind == 'num':
+                i = self.read_range_or_bound(i, context, bound)
+                context, bound = None, None
+                continue
+            if t.kind in ('lt', 'gt'):
+                bound = 'max' if t.kind == 'lt' else 'min'
+                i += 1
+                continue
+            if t.kind != 'word':
+                self.unknown.append(t.text)
+                i += 1
+                continue
+
+            facility, j = self.match_facility(i)
+            if facility and not (w in PROPERTY_TYPES and 'property_type' not in self.filters):
+                self.add_facility(facility)
+                i = j
+            elif w in PROPERTY_TYPES and 'property_type' not in self.filters \
+                    and (i == 0 or self.word(i - 1) not in TYPE_BLOCKERS):
+                self.filters['property_type'] = PROPERTY_TYPES[w]
+                i += 1
+            elif w == 'di' and self.word(i + 1) in ('bawah', 'atas'):
+                bound = 'max' if self.word(i + 1) == 'bawah' else 'min'
+                i += 2
+            elif w in LOCATION_WORDS:
+                i = self.read_location(i)
+            elif w in MAX_WORDS or w in MIN_WORDS:
+                bound = 'max' if w in MAX_WORDS else 'min'
+                i += 1
+                if self.word(i) in BOUND_TAILS:
+                    i += 1
+            elif w in PRICE_WORDS:
+                context = 'price'
+                i += 1
+            elif w in AREA_WORDS:
+                context = 'area'
+                i += 1
+                if self.word(i) == 'tanah':
+                    i += 1
+                elif self.word(i) == 'bangunan':
+                    self.unknown.append('bangunan')  # Building area is not a search filter
+                    i += 1
+            elif w in BEDROOM_WORDS:
+                # "kamar 3" / "kt min 3"
+                if self.word(i + 1) == 'tidur':
+                    i += 1
+                context = 'bedrooms'
+                i += 1
+            elif w in FACILITY_LEADS:
+                words, j = self.read_words(i + 1)
+                if words:
+                    self.add_facility(normalize_facility(' '.join(words)))
+                i = max(j, i + 1)
+            elif w in FILLER_WORDS or w in ('antara', 'tanah'):
+                i += 1
+            else:
+                self.unknown.append(w)
+                i += 1
+
+
+def parse_search_grammar(query: str) -> SearchParse:
+    """
+    Parse a search query locally.
+    complete is True only when every word was understood, i.e. the AI would add nothing.
+    """
+    rules = _SearchRules(query)
+    rules.run()
+    return SearchParse(rules.filters, not rules.unknown and bool(rules.filters))
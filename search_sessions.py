@@ -0,0 +1,105 @@
+"""
+Materialized search results
+
+A /search runs its filtered query once and keeps the ordered id list here; Next/Prev
+then slice the list and fetch only that page's rows by primary key. Results stay
+stable while the user browses, and old result messages keep working until the
+session expires.
+"""
+
+import os
+import time
+import secrets
+import logging
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Session configuration
+SEARCH_SESSION_TTL = float(os.getenv('SEARCH_SESSION_TTL', '1800'))
+SEARCH_SESSION_MAX_IDS = int(os.getenv('SEARCH_SESSION_MAX_IDS', '500'))
+SEARCH_SESSION_MAX_SESSIONS = int(os.getenv('SEARCH_SESSION_MAX_SESSIONS', '5000'))
+
+
+class SearchSession:
+    """Ordered result ids of one search, owned by one user"""
+
+    __slots__ = ('token', 'user_id', 'ids', 'truncated', 'expires_at')
+
+    def __init__(self, token: str, user_id: int, ids: Iterable[int], truncated: bool, expires_at: float):
+        self.token = token
+        self.user_id = user_id
+        self.ids = array('q', ids)  # 8 bytes per result
+        self.truncated = truncated
+        self.expires_at = expires_at
+
+    @property
+    def total(self) -> int:
+        return len(self.ids)
+
+    def page_ids(self, page: int, limit: int) -> List[int]:
+        start = (page - 1) * limit
+        return self.ids[start:start + limit].tolist()
+
+
+class SearchSessionStore:
+    """LRU of search sessions with TTL; the oldest sessions are dropped past the cap"""
+
+    def __init__(self, ttl_seconds: float = SEARCH_SESSION_TTL, max_sessions: int = SEARCH_SESSION_MAX_SESSIONS,
+                 max_ids: int = SEARCH_SESSION_MAX_IDS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_ids = max_ids
+        self._sessions: "OrderedDict[str, SearchSession]" = OrderedDict()
+        self._stats = {'created': 0, 'hits': 0, 'expired': 0, 'evicted': 0}
+
+    def create(self, user_id: int, ids: List[int]) -> SearchSession:
+        """
+        Store a result list (ids beyond max_ids are dropped; pass max_ids + 1 ids to
+        let the session know it was truncated)
+        """
+        self._purge()
+        token = secrets.token_hex(4)
+        while token in self._sessions:
+            token = secrets.token_hex(4)
+        session = SearchSession(token, user_id, ids[:self.max_ids], len(ids) > self.max_ids,
+                                time.monotonic() + self.ttl_seconds)
+        self._sessions[token] = session
+        self._stats['created'] += 1
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self._stats['evicted'] += 1
+        return session
+
+    def get(self, token: str, user_id: int) -> Optional[SearchSession]:
+        """The user's session for token, or None if unknown or expired"""
+        session = self._sessions.get(token)
+        if session is None or session.user_id != user_id:
+            return None
+        if session.expires_at < time.monotonic():
+            del self._sessions[token]
+            self._stats['expired'] += 1
+            return None
+        self._sessions.move_to_end(token)
+        self._stats['hits'] += 1
+        return session
+
+    def _purge(self) -> None:
+        """Drop expired sessions from the old end of the LRU"""
+        now = time.monotonic()
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if session.expires_at >= now:
+                break
+            del self._sessions[token]
+            self._stats['expired'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['sessions'] = len(self._sessions)
+        return stats
+
+
+search_sessions = SearchSessionStore()
@@ -5,8 +5,8 @@ Uses AI processor to extract data from raw text first
 
 import asyncio
 import logging
-from database import init_db, get_or_create_user, create_property
-from ai_processor import extract_property_info
+from database import init_db, get_or_create_user, create_properties_bulk
+from ai_processor import extract_property_batch, get_usage_stats
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -145,26 +145,33 @@ def seed_data():
     )
     print(f"👤 Using admin user ID: {admin_user.id}")
     
-    for i, raw_text in enumerate(SAMPLES, 1):
+    # 1. Extract all samples using AI (packed into as few requests as possible)
+    print(f"\n🤖 Extracting {len(SAMPLES)} samples with AI...")
+    extracted_batch = extract_property_batch(SAMPLES)
+    
+    valid = []
+    for i, extracted_data in enumerate(extracted_batch, 1):
         print(f"\nProcessing Sample #{i}...")
         
-        # 1. Extract data using AI
-        print("   🤖 Extracting data with AI...")
-        extracted_data = extract_property_info(raw_text)
-        
         if not extracted_data:
             print("   ❌ Failed to extract data")
             continue
             
         print(f"   ✅ Extracted: {extracted_data.get('property_type')} in {extracted_data.get('city')}")
-        
-        # 2. Save to DB
-        try:
-            prop = create_property(admin_user.id, extracted_data)
-            print(f"   💾 Saved to DB with ID: {prop.id}")
-        except Exception as e:
-            print(f"   ❌ Error saving: {e}")
+        valid.append(extracted_data)
+    
+    # 2. Save to DB (one multi-row INSERT for the whole batch)
+    try:
+        property_ids = create_properties_bulk(admin_user.id, valid)
+        print(f"\n💾 Saved {len(property_ids)} properties to DB, IDs: {property_ids}")
+    except Exception as e:
+        print(f"\n❌ Error saving: {e}")
             
+    for function, usage in get_usage_stats().items():
+        print(f"\n📊 {function}: {usage['calls']} calls, {usage['input_tokens']} in / "
+              f"{usage['output_tokens']} out / {usage['cached_tokens']} cached tokens, "
+              f"${usage['cost_per_item_usd']:.6f} & {usage['latency_per_item_ms']} ms per listing")
+    
     print("\n✨ Seeding complete!")
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+"""
+Pagination callback data tests
+
+Prev/Next buttons carry page_<mode>_<page>_<cursor>; buttons sent by releases before
+keyset pagination carry page_<mode>_<page> and must still parse.
+
+Run with `python test_bot_callbacks.py` or `pytest test_bot_callbacks.py`.
+"""
+
+from bot import pagination_buttons, parse_page_callback
+
+
+def test_keyset_callbacks():
+    assert parse_page_callback("page_list_2_n2kz1c0.4f") == ("list", 2, "n2kz1c0.4f")
+    assert parse_page_callback("page_filter_3_p.9x") == ("filter", 3, "p.9x")
+    assert parse_page_callback("page_search_adv_4_s1a2b3c4d") == ("search_adv", 4, "s1a2b3c4d")
+
+
+def test_old_callbacks_without_cursor():
+    assert parse_page_callback("page_list_2") == ("list", 2, None)
+    assert parse_page_callback("page_search_3") == ("search", 3, None)
+    assert parse_page_callback("page_search_adv_2") == ("search_adv", 2, None)
+
+
+def test_buttons_round_trip():
+    result = {'current_page': 2, 'prev_cursor': 'p1.2', 'next_cursor': 'n3.4'}
+    prev_button, next_button = pagination_buttons("search_adv", result)
+    assert parse_page_callback(prev_button.callback_data) == ("search_adv", 1, "p1.2")
+    assert parse_page_callback(next_button.callback_data) == ("search_adv", 3, "n3.4")
+
+
+if __name__ == "__main__":
+    print("🔍 Checking pagination callbacks...")
+    failed = 0
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_') and callable(test):
+            try:
+                test()
+                print(f"   ✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"   ❌ {name}: {e}")
+    print(f"\n{'✅ All passed' if not failed else f'❌ {failed} failure(s)'}")
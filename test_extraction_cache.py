@@ -0,0 +1,80 @@
+"""
+Extraction cache single-flight tests
+
+Concurrent callers on one key must share a single computation, also when one of
+them is still in the (slow) persistent lookup while another finishes. Runs without
+a database: the persistent tier is stubbed per test.
+
+Run with `python test_extraction_cache.py` or `pytest test_extraction_cache.py`.
+"""
+
+import asyncio
+import threading
+
+from extraction_cache import ExtractionCache
+
+KEY = 'listing-key'
+RESULT = {'property_type': 'rumah', 'price': 1_300_000_000}
+
+
+def test_concurrent_callers_compute_once():
+    cache = ExtractionCache(persistent=False)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return dict(RESULT)
+
+    async def run():
+        return await asyncio.gather(*(cache.aget_or_compute(KEY, compute) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1, f"{len(calls)} computations"
+    assert all(result == RESULT for result in results)
+
+
+def test_caller_in_persistent_lookup_reuses_finished_computation():
+    cache = ExtractionCache(persistent=False)
+    calls = []
+    entered, release = threading.Event(), threading.Event()
+    lookups = []
+
+    def slow_persistent(key):
+        # The first lookup (the late caller's) stalls until the other caller has finished
+        lookups.append(key)
+        if len(lookups) == 1:
+            entered.set()
+            release.wait(5)
+        return None
+
+    cache._get_persistent = slow_persistent
+
+    async def compute():
+        calls.append(1)
+        return dict(RESULT)
+
+    async def run():
+        late = asyncio.create_task(cache.aget_or_compute(KEY, compute))
+        await asyncio.to_thread(entered.wait, 5)
+        first = await cache.aget_or_compute(KEY, compute)
+        release.set()
+        return first, await late
+
+    first, late = asyncio.run(run())
+    assert len(calls) == 1, f"{len(calls)} computations"
+    assert first == late == RESULT
+
+
+if __name__ == "__main__":
+    print("🔍 Checking extraction cache single-flight...")
+    failed = 0
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_') and callable(test):
+            try:
+                test()
+                print(f"   ✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"   ❌ {name}: {e}")
+    print(f"\n{'✅ All passed' if not failed else f'❌ {failed} failure(s)'}")
@@ -0,0 +1,51 @@
+"""
+Local listing parser tests
+
+A listing may only skip the AI when type, transaction, price and location were all
+found with confidence; a post without a parseable location must fall through.
+
+Run with `python test_listing_parser.py` or `pytest test_listing_parser.py`.
+"""
+
+from listing_parser import parse_listing
+
+STRUCTURED = """Jual Rumah
+PONDOK CANDRA RAMBUTAN - Sidoarjo
+LT 180 LB 200
+KT 3+1 KM 2+1
+Rp 1.300.000.000
+SHM"""
+
+CITY_IN_TITLE = """Dijual Rumah Sidoarjo siap huni
+LT 120 LB 90
+3 KT 2 KM
+Harga 850 juta nego"""
+
+
+def test_structured_listing_skips_ai():
+    result = parse_listing(STRUCTURED)
+    assert result.is_confident()
+    data = result.confident_data()
+    assert data['city'] == 'Sidoarjo'
+    assert data['price'] == 1_300_000_000
+
+
+def test_listing_without_location_line_needs_ai():
+    result = parse_listing(CITY_IN_TITLE)
+    assert result.data['price'] == 850_000_000
+    assert 'city' not in result.confident_data()
+    assert not result.is_confident()
+
+
+if __name__ == "__main__":
+    print("🔍 Checking local listing parser...")
+    failed = 0
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_') and callable(test):
+            try:
+                test()
+                print(f"   ✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"   ❌ {name}: {e}")
+    print(f"\n{'✅ All passed' if not failed else f'❌ {failed} failure(s)'}")
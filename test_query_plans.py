@@ -0,0 +1,278 @@
+"""
+Query plan regression tests
+
+Seeds a throwaway schema in the DATABASE_URL Postgres with a few thousand listings,
+EXPLAINs the hot queries exactly as database.py builds them, and fails when one of
+them falls back to a sequential scan or an explicit sort. Everything runs in one
+transaction that is rolled back, so the real tables are untouched. Skipped when
+the database cannot be reached.
+
+Run with `python test_query_plans.py` or `pytest test_query_plans.py`.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from database import (
+    Base,
+    engine,
+    Property,
+    User,
+    UserPropertyStats,
+    CHEAPEST_FIRST,
+    RECENT_FIRST,
+    advanced_search_conditions,
+    count_query,
+    keyword_document_match,
+    keyword_search_conditions,
+    location_conditions,
+    page_query,
+    property_ids_query,
+)
+from pagination import encode_cursor
+
+PLAN_SCHEMA = 'query_plan_test'
+USERS = 40
+LISTINGS_PER_USER = 300
+USER_ID = 7  # The user whose queries are explained
+BROKER_ID = 8  # A large portfolio, where keyword search must not scan every listing
+BROKER_LISTINGS = 6000
+
+# (city, city_id, district, district_id) combinations the seed draws from
+PLACES = [
+    ('Surabaya', 3578, 'Gubeng', 357808), ('Surabaya', 3578, 'Wonokromo', 357831),
+    ('Surabaya', 3578, 'Rungkut', 357818), ('Sidoarjo', 3515, 'Waru', 351517),
+    ('Sidoarjo', 3515, 'Candi', 351503), ('Jakarta Selatan', 3171, 'Tebet', 317110),
+    ('Jakarta Selatan', 3171, 'Cilandak', 317101), ('Malang', 3573, 'Klojen', 357303),
+    ('Tangerang Selatan', 3674, 'Serpong', 367405), ('Purwokerto', None, None, None),
+]
+PROPERTY_TYPES = ['rumah', 'apartemen', 'tanah', 'ruko', 'villa', 'kost', 'gudang']
+FACILITIES = ['ac', 'kolam renang', 'carport', 'cctv', 'taman', 'wifi', 'security']
+STREETS = ['Melati', 'Mawar', 'Kenanga', 'Anggrek', 'Diponegoro', 'Sudirman', 'Ahmad Yani', 'Pahlawan']
+DESCRIPTIONS = [
+    'Rumah siap huni dekat sekolah dan pasar', 'Lokasi strategis pinggir jalan raya',
+    'Bebas banjir, lingkungan tenang dan aman', 'Cocok untuk usaha atau kantor',
+    'Dekat tol dan bandara, akses mudah', 'Hunian asri dengan taman luas',
+]
+RARE_WORD = 'joglo'  # In about 1% of the descriptions: a selective full-text search
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, with its bind parameters processed as usual"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+_conn = None
+_transaction = None
+
+
+def database_unavailable() -> Optional[str]:
+    """Why the DATABASE_URL Postgres cannot be used, or None if it can"""
+    try:
+        with engine.connect():
+            return None
+    except OperationalError as e:
+        return f"database not reachable ({e.orig.__class__.__name__})"
+
+
+def setup_module(module=None):
+    """Create and seed the throwaway schema inside a transaction"""
+    global _conn, _transaction
+    reason = database_unavailable()
+    if reason:
+        import pytest
+        pytest.skip(reason, allow_module_level=True)
+    _conn = engine.connect()
+    _transaction = _conn.begin()
+    _conn.execute(text(f"CREATE SCHEMA {PLAN_SCHEMA}"))
+    _conn.execute(text(f"SET LOCAL search_path TO {PLAN_SCHEMA}"))
+    Base.metadata.create_all(_conn)
+
+    rng = random.Random(20)
+    start = datetime(2024, 1, 1)
+    _conn.execute(insert(User), [{'id': i, 'telegram_id': 900000 + i} for i in range(1, USERS + 1)])
+    rows = []
+    for user_id in range(1, USERS + 1):
+        for n in range(BROKER_LISTINGS if user_id == BROKER_ID else LISTINGS_PER_USER):
+            city, city_id, district, district_id = rng.choice(PLACES)
+            rows.append({
+                'user_id': user_id,
+                'property_type': rng.choice(PROPERTY_TYPES),
+                'transaction_type': rng.choice(['jual', 'sewa', 'jual sewa']),
+                'city': city, 'city_id': city_id, 'district': district, 'district_id': district_id,
+                'province_id': city_id // 100 if city_id else None,
+                'price': rng.choice([None] + [rng.randrange(100, 20000) * 1_000_000] * 9),
+                'bedrooms': rng.randint(1, 6),
+                'land_area': rng.randint(30, 600),
+                'facilities': rng.sample(FACILITIES, rng.randint(0, 4)),
+                'address': f"Jl. {rng.choice(STREETS)} No. {n + 1}",
+                'description': rng.choice(DESCRIPTIONS) + (f", rumah {RARE_WORD}" if rng.random() < 0.01 else ''),
+                'status': rng.choice(['active'] * 4 + ['sold']),
+                'created_at': start + timedelta(minutes=rng.randrange(0, 500000)),
+            })
+    _conn.execute(insert(Property), rows)
+    _conn.execute(insert(UserPropertyStats), [{'user_id': i, 'by_type': {}, 'by_transaction': {}}
+                                              for i in range(1, USERS + 1)])
+    _conn.execute(text("ANALYZE"))
+
+
+def teardown_module(module=None):
+    global _conn, _transaction
+    if _transaction is not None:
+        _transaction.rollback()
+    if _conn is not None:
+        _conn.close()
+    _conn = _transaction = None
+
+
+def plan_tree(statement) -> list:
+    """The statement's plan nodes, outermost first"""
+    plan = _conn.execute(Explain(statement)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = []
+    pending = [plan[0]['Plan']]
+    while pending:
+        node = pending.pop(0)
+        nodes.append(node)
+        pending.extend(node.get('Plans', []))
+    return nodes
+
+
+def plan_nodes(statement) -> list:
+    """Node types of the statement's plan, outermost first"""
+    return [node['Node Type'] for node in plan_tree(statement)]
+
+
+def plan_indexes(statement) -> set:
+    """Names of the indexes the statement's plan reads"""
+    return {node['Index Name'] for node in plan_tree(statement) if 'Index Name' in node}
+
+
+def assert_plan(statement, allow_sort: bool = False) -> list:
+    """Fail on a Seq Scan, and on a Sort unless allowed"""
+    nodes = plan_nodes(statement)
+    assert 'Seq Scan' not in nodes, f"sequential scan in plan: {nodes}"
+    if not allow_sort:
+        assert not {'Sort', 'Incremental Sort'} & set(nodes), f"sort in plan: {nodes}"
+    return nodes
+
+
+def _row(*conditions):
+    """A listing of USER_ID, to build cursors from"""
+    return _conn.execute(page_query([Property.user_id == USER_ID, *conditions], RECENT_FIRST, None, 10)).all()[5]
+
+
+# /list: newest first
+
+def test_recent_first_page():
+    assert_plan(page_query([Property.user_id == USER_ID], RECENT_FIRST, None, 5))
+
+
+def test_recent_next_and_previous_page():
+    row = _row()
+    for direction in ('n', 'p'):
+        cursor = encode_cursor(RECENT_FIRST, direction, row.created_at, row.id)
+        assert_plan(page_query([Property.user_id == USER_ID], RECENT_FIRST, cursor, 5))
+
+
+def test_recent_total_count():
+    assert_plan(count_query([Property.user_id == USER_ID]))
+
+
+# Location filter: cheapest first
+
+def test_city_filter_page():
+    assert_plan(page_query(location_conditions(USER_ID, city='Surabaya'), CHEAPEST_FIRST, None, 5))
+
+
+def test_city_district_price_filter_page():
+    conditions = location_conditions(USER_ID, city='Surabaya', district='Gubeng',
+                                     min_price=500_000_000, max_price=2_000_000_000)
+    assert_plan(page_query(conditions, CHEAPEST_FIRST, None, 5))
+
+
+def test_price_only_filter_page():
+    conditions = location_conditions(USER_ID, min_price=1_000_000_000, max_price=5_000_000_000)
+    assert_plan(page_query(conditions, CHEAPEST_FIRST, None, 5))
+
+
+def test_city_filter_next_pages():
+    conditions = location_conditions(USER_ID, city='Sidoarjo')
+    row = _row(Property.city_id == 3515, Property.price.isnot(None))
+    for key in (row.price, None):  # Past the priced listings, into the NULL prices
+        cursor = encode_cursor(CHEAPEST_FIRST, 'n', key, row.id)
+        assert_plan(page_query(conditions, CHEAPEST_FIRST, cursor, 5))
+
+
+def test_city_filter_total_count():
+    assert_plan(count_query(location_conditions(USER_ID, city='Jakarta Selatan', district='Tebet')))
+
+
+# /search result ids (filters in any combination; the planner may sort a small set)
+
+def test_search_ids_by_location():
+    filters = {'location_keyword': 'sby', 'min_bedrooms': 3}
+    assert_plan(property_ids_query(advanced_search_conditions(USER_ID, filters), 501), allow_sort=True)
+
+
+def test_search_ids_by_facilities():
+    filters = {'must_have_facilities': ['AC', 'swimming pool']}
+    assert_plan(property_ids_query(advanced_search_conditions(USER_ID, filters), 501), allow_sort=True)
+
+
+def test_search_ids_without_filters():
+    assert_plan(property_ids_query(advanced_search_conditions(USER_ID, {}), 501), allow_sort=True)
+
+
+# Keyword search: the full-text match is served by the GIN expression index
+
+def test_keyword_full_text_uses_gin_index():
+    statement = property_ids_query([Property.user_id == BROKER_ID, keyword_document_match(RARE_WORD)], 501)
+    assert_plan(statement, allow_sort=True)
+    indexes = plan_indexes(statement)
+    assert 'idx_properties_search_document' in indexes, f"full-text GIN index not used: {indexes}"
+
+
+def test_keyword_search_ids():
+    for user_id in (USER_ID, BROKER_ID):
+        assert_plan(property_ids_query(keyword_search_conditions(user_id, RARE_WORD), 501), allow_sort=True)
+
+
+if __name__ == "__main__":
+    print("🔍 Checking query plans...")
+    skip_reason = database_unavailable()
+    if skip_reason:
+        print(f"⏭️  Skipped: {skip_reason}")
+        raise SystemExit(0)
+    tests = [(name, test) for name, test in sorted(globals().items())
+             if name.startswith('test_') and callable(test)]
+    failed = 0
+    setup_module()
+    try:
+        for name, test in tests:
+            try:
+                test()
+                print(f"   ✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"   ❌ {name}: {e}")
+    finally:
+        teardown_module()
+    print(f"\n{'✅ All plans use indexes' if not failed else f'❌ {failed} plan regression(s)'}")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,131 @@
+"""
+Unit of work connection tests
+
+One Telegram update must check out one pooled connection for all its reads and
+writes, and give it back when a handler commits before confirming a save. Runs the
+async_database functions against the DATABASE_URL Postgres (the test user and its
+listings are deleted afterwards); skipped when the database cannot be reached.
+
+Run with `python test_unit_of_work.py` or `pytest test_unit_of_work.py`.
+"""
+
+import asyncio
+from typing import Optional
+
+from sqlalchemy import delete, event
+from sqlalchemy.exc import OperationalError
+
+import async_database
+from database import Base, User, engine
+from async_database import (
+    async_engine,
+    commit,
+    create_property,
+    dispose_engine,
+    get_or_create_user,
+    get_property_stats,
+    get_unique_cities,
+    get_user_properties,
+    unit_of_work,
+)
+
+TELEGRAM_ID = 990_000_000_001  # Outside the range of real Telegram ids
+LISTING = {'property_type': 'rumah', 'transaction_type': 'jual', 'price': 950_000_000, 'city': 'Sidoarjo'}
+
+
+def database_unavailable() -> Optional[str]:
+    """Why the DATABASE_URL Postgres cannot be used, or None if it can"""
+    try:
+        with engine.connect():
+            return None
+    except OperationalError as e:
+        return f"database not reachable ({e.orig.__class__.__name__})"
+
+
+def setup_module(module=None):
+    reason = database_unavailable()
+    if reason:
+        import pytest
+        pytest.skip(reason, allow_module_level=True)
+    Base.metadata.create_all(engine)
+    teardown_function()
+
+
+def teardown_function(function=None):
+    with engine.begin() as conn:
+        conn.execute(delete(User).where(User.telegram_id == TELEGRAM_ID))
+
+
+def count_checkouts(update) -> int:
+    """Primary pool checkouts made while running the coroutine function `update` (replica off)"""
+    checkouts = []
+    pool = async_engine.sync_engine.pool
+    replica_sessions, async_database.ReplicaSessionLocal = async_database.ReplicaSessionLocal, None
+
+    def on_checkout(*args):
+        checkouts.append(1)
+
+    async def run():
+        try:
+            await update()
+        finally:
+            await dispose_engine()  # asyncpg connections belong to this event loop
+
+    event.listen(pool, 'checkout', on_checkout)
+    try:
+        asyncio.run(run())
+    finally:
+        event.remove(pool, 'checkout', on_checkout)
+        async_database.ReplicaSessionLocal = replica_sessions
+    return len(checkouts)
+
+
+def test_update_reads_share_one_connection():
+    async def update():
+        async with unit_of_work():
+            user = await get_or_create_user(TELEGRAM_ID, username='uow_test')
+            await get_user_properties(user.id)
+            await get_property_stats(user.id)
+            await get_unique_cities(user.id)
+
+    checkouts = count_checkouts(update)
+    assert checkouts == 1, f"{checkouts} checkouts for one update"
+
+
+def test_commit_returns_connection_before_confirming():
+    held_after_commit = []
+
+    async def update():
+        async with unit_of_work():
+            user = await get_or_create_user(TELEGRAM_ID, username='uow_test')
+            await create_property(user.id, dict(LISTING))
+            await commit()
+            held_after_commit.append(async_engine.sync_engine.pool.checkedout())
+            # The listing after the confirmation runs on a fresh checkout
+            page = await get_user_properties(user.id)
+            assert page['total_items'] == 1
+
+    checkouts = count_checkouts(update)
+    assert held_after_commit == [0], f"{held_after_commit[0]} connection(s) held after commit()"
+    assert checkouts == 2, f"{checkouts} checkouts for one update"
+
+
+if __name__ == "__main__":
+    print("🔍 Checking unit of work connections...")
+    skip_reason = database_unavailable()
+    if skip_reason:
+        print(f"⏭️  Skipped: {skip_reason}")
+        raise SystemExit(0)
+    setup_module()
+    failed = 0
+    for name, test in sorted(globals().items()):
+        if name.startswith('test_') and callable(test):
+            try:
+                test()
+                print(f"   ✅ {name}")
+            except AssertionError as e:
+                failed += 1
+                print(f"   ❌ {name}: {e}")
+            finally:
+                teardown_function()
+    print(f"\n{'✅ All passed' if not failed else f'❌ {failed} failure(s)'}")
@@ -0,0 +1,97 @@
+"""
+In-memory user identity cache
+
+Maps telegram_id -> database user so handlers resolve the current user without a
+query, and buffers last_active touches so they can be written in one batched
+UPDATE (see async_database.flush_user_activity).
+"""
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '3600'))
+
+
+class CachedUser(NamedTuple):
+    """Identity fields handlers read from a user"""
+    id: int
+    telegram_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+
+    @classmethod
+    def from_user(cls, user: Any) -> 'CachedUser':
+        return cls(user.id, user.telegram_id, user.username, user.first_name, user.last_name)
+
+
+class UserIdentityCache:
+    """Bounded LRU with TTL, plus the pending last_active touches per user id"""
+
+    def __init__(self, max_entries: int = USER_CACHE_SIZE, ttl_seconds: float = USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # telegram_id -> (user, expires_at)
+        self._activity: Dict[int, datetime] = {}  # users.id -> latest activity not yet written
+        self._stats = {'hits': 0, 'misses': 0, 'flushed_touches': 0}
+
+    def get(self, telegram_id: int) -> Optional[CachedUser]:
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry[1] < time.monotonic():
+            if entry is not None:
+                del self._entries[telegram_id]
+            self._stats['misses'] += 1
+            return None
+        self._entries.move_to_end(telegram_id)
+        self._stats['hits'] += 1
+        return entry[0]
+
+    def put(self, user: CachedUser) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[user.telegram_id] = (user, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(user.telegram_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: int) -> None:
+        self._entries.pop(telegram_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._activity.clear()
+
+    # Write-behind last_active
+
+    def touch(self, user_id: int, when: Optional[datetime] = None) -> None:
+        """Record activity; only the latest touch per user is kept until the next flush"""
+        self._activity[user_id] = when or datetime.utcnow()
+
+    def drain_activity(self) -> Dict[int, datetime]:
+        """Take the pending touches (the caller writes them)"""
+        pending, self._activity = self._activity, {}
+        return pending
+
+    def restore_activity(self, pending: Dict[int, datetime]) -> None:
+        """Put back touches whose write failed, without overwriting newer ones"""
+        for user_id, when in pending.items():
+            current = self._activity.get(user_id)
+            if current is None or current < when:
+                self._activity[user_id] = when
+
+    def record_flush(self, count: int) -> None:
+        self._stats['flushed_touches'] += count
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['entries'] = len(self._entries)
+        stats['pending_touches'] = len(self._activity)
+        return stats